@@ -165,11 +165,13 @@ class SurfacePathExtrusion(SurfaceAbstract):
 	"""
 		I hold 2 paths. Respective points are connected
 		Makes only sense, if the both paths are 'similar'
+		If a tolerance is given, the points are found by adaptive flattening (then quality is ignored)
 	"""
-	def __init__(self, name, path1, path2):
+	def __init__(self, name, path1, path2, tolerance=None):
 		super().__init__(name)
 		self.m_path1 = path1
 		self.m_path2 = path2
+		self.m_tolerance = tolerance
 
 
 	def isClosed(self):
@@ -178,9 +180,14 @@ class SurfacePathExtrusion(SurfaceAbstract):
 
 
 	def allFaces(self, quality):
-		diff = 1.0 / int(quality)
-		p1 = self.m_path1.getInterPoints(diff)
-		p2 = self.m_path2.getInterPoints(diff)
+		if self.m_tolerance is not None:
+			params = self.m_path1.adaptiveParams(self.m_tolerance, self.m_path2)
+			p1 = self.m_path1.getPointsForParams(params)
+			p2 = self.m_path2.getPointsForParams(params)
+		else:
+			diff = 1.0 / int(quality)
+			p1 = self.m_path1.getAllInterPoints(diff)
+			p2 = self.m_path2.getAllInterPoints(diff)
 		if len(p1) != len(p2):
 			raise Exception('SurfacePathExtrusion: cannot calculate faces')
 		if self.isClosed() and p1[-1].isSameAs(p1[0]):
@@ -199,7 +206,7 @@ class SurfacePathExtrusion(SurfaceAbstract):
 	def copy(self):
 		p1 = self.m_path1.copy()
 		p2 = self.m_path2.copy()
-		return SurfacePathExtrusion(self.m_name, p1, p2)
+		return SurfacePathExtrusion(self.m_name, p1, p2, self.m_tolerance)
 
 
 	def transformBy(self, aff):
@@ -426,7 +433,7 @@ class SurfaceBezierCubic(SurfaceAbstract):
 
 
 	def transformBy(self, aff):
-		self.m_controlPoints = [aff * p for p in self.m_controlPoints]
+		self.m_controlPoints = aff.applyMany(self.m_controlPoints)
 
 
 ##################################################################
@@ -3,13 +3,15 @@
 """
 
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 #import traceback
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 from zutils.ZUnits import ZUnits
 from zutils.ZGeom import ZGeomItem, Point, Plane
 from zutils.ZMatrix import Affine
-from zutils.OSCNode import OSCTransform, OSCRoot
+from zutils.OSCNode import OSCAbstract, OSCTransform, OSCRoot, OSCText
 
 from zutils.ZRhino3dm import ZRhinoFile
 
@@ -25,6 +27,8 @@ class Instrument():
 		Superclass for musical instruments. Handles composition of parts, editing, error checking, and updating
 	"""
 	s_catchExceptions = False		# if False, crash, else just emit an error message and continue
+	s_parallelOSC = False			# if True, writeOSC() generates the parts in a process pool
+	s_maxOSCWorkers = None			# None means number of cpus
 
 	def __init__(self, metric=True, concertPitch=440, leftHanded=False, folder='', title='', text=''):
 		super().__init__()
@@ -110,8 +114,17 @@ class Instrument():
 		return True
 
 
-	def writeOSC(self, fileName, wantedPart=None):
+	def writeOSC(self, fileName, wantedPart=None, parallel=None):
+		"""
+			Write all parts (or only wantedPart) to one OpenScad file.
+			If parallel (default s_parallelOSC), the subtrees of the parts are generated in a process pool
+		"""
 		self.calculateAll()
+		if parallel is None:
+			parallel = self.s_parallelOSC
+		if parallel and wantedPart is None and len(self.m_parts) > 1:
+			if self.writeOSCParallel(fileName):
+				return
 		root = OSCRoot('rootNode')
 		rootMirror = root
 		
@@ -127,17 +140,67 @@ class Instrument():
 		if wantedPart:
 			parts = [wantedPart]
 		for part in parts:
-			part.addOscColor(root)
-			affine = part.createAffLocalToGlobal(self)
-			name = self.m_names[part]
-			transform = OSCTransform('part named ' + name + ':', affine)
-			root.add(transform)
-			part.writeMyOSC(root, transform)
+			self.writePartOSC(root, part)
 		root.writeScadTo(fileName)
 
 		#root.printStructure()
 
 
+	def writeOSCParallel(self, fileName) -> bool:
+		"""
+			Generate the OpenScad text of every part in its own process, and join them in the order of my parts.
+			Return False if i cannot be pickled for the workers (then nothing is written).
+			Exceptions inside the workers are raised here
+		"""
+		try:
+			instrumentData = pickle.dumps(self)
+		except (pickle.PicklingError, AttributeError, TypeError) as err:
+			print(f'Instrument: parallel scad generation not possible ({str(err)}), writing sequentially')
+			return False
+
+		settings = self.getOSCSettings()
+		with ProcessPoolExecutor(max_workers=self.s_maxOSCWorkers) as pool:
+			futures = [pool.submit(writePartOSCText, instrumentData, idx, settings) for idx in range(len(self.m_parts))]
+			texts = [future.result() for future in futures]
+
+		root = OSCRoot('rootNode')
+		if self.m_leftHanded:
+			yzPlane = Plane(Point(), normal=Point(1))
+			root.add(OSCTransform('left handed mirror', Affine.makeMirror(yzPlane)))
+		for idx, text in enumerate(texts):
+			root.add(OSCText('part ' + str(idx), text))
+		root.writeScadTo(fileName)
+		return True
+
+
+	@classmethod
+	def getOSCSettings(cls):
+		"""
+			The class wide settings a worker process must use to create the same scad text as this process
+		"""
+		return (ZGeomItem.s_inchWanted, OSCAbstract.s_floatPrecision, OSCRoot.s_quality)
+
+
+	@classmethod
+	def applyOSCSettings(cls, settings):
+		inchWanted, floatPrecision, quality = settings
+		ZGeomItem.adaptForInches(inchWanted)
+		OSCAbstract.setFloatPrecision(floatPrecision)
+		OSCRoot.s_quality = quality
+
+
+	def writePartOSC(self, root, part):
+		"""
+			Add the color and the transformed subtree of part to root
+		"""
+		part.addOscColor(root)
+		affine = part.createAffLocalToGlobal(self)
+		name = self.m_names[part]
+		transform = OSCTransform('part named ' + name + ':', affine)
+		root.add(transform)
+		part.writeMyOSC(root, transform)
+
+
 	#def writeOneComponent(self, compo, affine, name, root, parent):
 	#	trCompo = OSCTransform('subtree of ' + name + ':', affine)
 	#	parent.add(trCompo)
@@ -329,3 +392,19 @@ class Instrument():
 				return c
 		
 		return None
+
+
+##################################################
+##################################################
+
+
+def writePartOSCText(instrumentData, partIdx, settings):
+	"""
+		Worker of Instrument.writeOSCParallel(): return the scad text of one part, as it would appear under the root node.
+		instrumentData is the pickled instrument
+	"""
+	Instrument.applyOSCSettings(settings)
+	instrument = pickle.loads(instrumentData)
+	root = OSCRoot('rootNode')
+	instrument.writePartOSC(root, instrument.m_parts[partIdx])
+	return root.getScadText(-1)
@@ -200,6 +200,9 @@ void s1386(SISLSurf *,int,int,SISLSurf **,int *);
 // findClosestPointSimple
 void s1958(SISLSurf *,double [],int,double,double,double [],double *,int *);
 
+// findClosestParamsMany (local newton iteration from a start parameter pair)
+void s1775(SISLSurf *,double [],int,double,double [],double [],double [],double [],int *);
+
 // getPointAndDerivativesAndNormalAtParameters
 void s1421(SISLSurf *,int,double [],int *,int *,double [],double [],int *);
 
@@ -4,6 +4,9 @@
 	- create a object of class OSCRoot
 	- build a hierarchy of other OSCClass objects under the root (with addChild())
 	- call root.writeScadTo(fileName)
+	Polyhedra (e.g. OSCForm3d, OSCExtrudeRounded) can also be written directly as mesh with writeStlTo() or write3mfTo()
+	Optionally (setUseTextCache(True)) the text of unchanged subtrees is reused: each node has a structural hash
+	(see getSubtreeHash()), and the texts are kept in an LRU cache (optionally also on disk, see setTextCacheFolder())
 """
 
 # should also be regarded: CadQuery
@@ -12,12 +15,18 @@
 ###############################################
 
 
+import os
 import math
+import itertools
+import zipfile
+import hashlib
+from collections import OrderedDict
+import numpy as np
 
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 
-from zutils.ZGeom import Point, Line, Plane, Polygon, Circle2
+from zutils.ZGeom import ZGeomItem, Point, PointArray, Line, Plane, Polygon, Circle2
 from zutils.ZMatrix import Matrix, Affine
 from zutils.ZUnits import ZUnits
 
@@ -39,6 +48,27 @@ class OSCAbstract:
 	s_vectorFormat2 = '[%.4f, %.4f]'
 	s_vectorFormat3 = '[%.4f, %.4f, %.4f]'
 	s_vectorFormat4 = '[%.4f, %.4f, %.4f, %.4f]'
+
+	s_useTextCache = False				# opt in: reuse the text of unchanged subtrees
+	s_textCache = OrderedDict()			# subtree hash + tabs => scad text
+	s_textCacheSize = 0					# number of characters in s_textCache
+	s_textCacheMaxSize = 50 * 1024 * 1024
+	s_textCacheFolder = None			# if set, texts are also stored there
+	s_textCacheMaxDiskSize = 500 * 1024 * 1024
+	s_textCacheHits = 0
+	s_textCacheMisses = 0
+	# class name => attributes ignored by describeForHash() (links, caches and derived data).
+	# Objects are only hashable, if their class or a superclass is listed here
+	s_hashExcluded = {
+		'OSCAbstract': {'m_parent', 'm_children', 'm_subtreeHash', 'm_transformation'},
+		'OSCPolyhedron': {'m_pointGrid', 'm_namesToIndices', 'm_facesChecked'},
+		'ZGeomItem': set(),
+		'Matrix': {'m_lines', 'm_determinant'},
+		'Affine': {'m_inverse'},
+		'ZPathSegment': set(),
+		'ZPath': {'m_bvh'},
+	}
+	s_hashExcludedByClass = dict()		# class => union of the s_hashExcluded entries of the class and its superclasses (None: not hashable)
 	
 
 	@classmethod
@@ -73,32 +103,276 @@ class OSCAbstract:
 		self.m_type = 'abstract'
 		self.m_name = name
 		self.m_parent = None
+		self.m_subtreeHash = None
+		self.m_transformation = None		# cache of getTransformation()
 
 
 	def add(self, child):
 		self.m_children.append(child)
 		child.m_parent = self
+		child.forgetTransformations()
+		runner = self
+		while runner is not None:
+			runner.m_subtreeHash = None
+			runner = runner.m_parent
 		return child
 
 
 	def writeToFile(self, f, tabNo):
 		for child in self.m_children:
-			child.writeToFile(f, tabNo+1)
+			child.writeCachedToFile(f, tabNo+1)
+
+
+	def writeCachedToFile(self, f, tabNo):
+		"""
+			Like writeToFile(), but reuse the text of an identical subtree written before
+		"""
+		subtreeHash = self.getSubtreeHash() if OSCAbstract.s_useTextCache else None
+		if subtreeHash is None:
+			self.writeToFile(f, tabNo)
+			return
+		key = subtreeHash + '_' + str(tabNo)
+		text = self.lookupText(key)
+		if text is None:
+			buffer = OSCWriteBuffer()
+			self.writeToFile(buffer, tabNo)
+			text = buffer.getText()
+			self.storeText(key, text)
+		f.write(text)
+
+
+	def getSubtreeHash(self) -> str:
+		"""
+			Return a hash of my type, name, parameters, the output settings and the hashes of my children.
+			Return None, if i or a child hold values that cannot be described reliably (then the subtree is not cached).
+			It is kept until forgetSubtreeHashes() is called or a child is added
+		"""
+		if self.m_subtreeHash is None:
+			description = self.getHashDescription()
+			if description is None:
+				return None
+			hasher = hashlib.sha1()
+			settings = (self.__class__.__name__,) + self.getOutputSettings()
+			hasher.update(repr(settings).encode('utf-8'))
+			hasher.update(description.encode('utf-8'))
+			for child in self.m_children:
+				childHash = child.getSubtreeHash()
+				if childHash is None:
+					return None
+				hasher.update(childHash.encode('utf-8'))
+			self.m_subtreeHash = hasher.hexdigest()
+		return self.m_subtreeHash
+
+
+	@classmethod
+	def getOutputSettings(cls) -> tuple:
+		"""
+			Return all the class wide settings that influence the generated text (part of the cache keys)
+		"""
+		return (OSCAbstract.s_floatPrecision, OSCAbstract.s_floatThreshold, OSCRoot.s_quality,
+			ZGeomItem.s_inchWanted, ZGeomItem.s_wantedAccuracy, ZUnits.s_isMetric, ZUnits.s_inToM)
+
+
+	def forgetSubtreeHashes(self):
+		"""
+			Must be called, if the parameters of nodes could have changed (is done before each write)
+		"""
+		self.m_subtreeHash = None
+		for child in self.m_children:
+			child.forgetSubtreeHashes()
+
+
+	def getHashDescription(self) -> str:
+		"""
+			Return a string describing all my parameters (but not my children), or None if that is not possible
+		"""
+		return self.describeForHash(self, set())
+
+
+	@classmethod
+	def describeForHash(cls, value, seen) -> str:
+		"""
+			Return a string that describes value completely, or None for values of unknown type.
+			Objects are known, if their class (or a superclass) is listed in s_hashExcluded
+		"""
+		if value is None or isinstance(value, (bool, int, float, str)):
+			return repr(value)
+		if isinstance(value, np.generic):
+			return repr(value.item())
+		if isinstance(value, PointArray):
+			return hashlib.sha1(value.m_array.tobytes()).hexdigest()
+		if isinstance(value, Point):
+			return 'P(%r,%r,%r)' % (value.m_x, value.m_y, value.m_z)
+		if isinstance(value, np.ndarray):
+			if value.dtype.hasobject:
+				return None
+			return hashlib.sha1(value.tobytes()).hexdigest() + str(value.dtype) + str(value.shape)
+		if isinstance(value, (list, tuple, dict)):
+			items = value.items() if isinstance(value, dict) else enumerate(value)
+			descriptions = []
+			for key, val in items:
+				keyDescription = cls.describeForHash(key, seen)
+				valDescription = cls.describeForHash(val, seen)
+				if keyDescription is None or valDescription is None:
+					return None
+				descriptions.append(keyDescription + ':' + valDescription)
+			return value.__class__.__name__ + '[' + ','.join(descriptions) + ']'
+		excluded = cls.getHashExcluded(value.__class__)
+		if excluded is None or not hasattr(value, '__dict__'):
+			return None
+		if id(value) in seen:
+			return 'cycle'
+		seen.add(id(value))
+		descriptions = []
+		for key, val in vars(value).items():
+			if key in excluded:
+				continue
+			valDescription = cls.describeForHash(val, seen)
+			if valDescription is None:
+				return None
+			descriptions.append(key + '=' + valDescription)
+		return value.__class__.__name__ + '(' + ','.join(descriptions) + ')'
+
+
+	@classmethod
+	def getHashExcluded(cls, valueClass) -> set:
+		"""
+			Return the attributes of valueClass objects that describeForHash() ignores:
+			the union of the s_hashExcluded entries of valueClass and its superclasses (None, if none of them is listed)
+		"""
+		byClass = OSCAbstract.s_hashExcludedByClass
+		if valueClass not in byClass:
+			ret = None
+			for klass in valueClass.__mro__:
+				own = OSCAbstract.s_hashExcluded.get(klass.__name__, None)
+				if own is not None:
+					ret = (ret or set()) | own
+			byClass[valueClass] = ret
+		return byClass[valueClass]
+
+
+	@classmethod
+	def lookupText(cls, key):
+		cache = OSCAbstract.s_textCache
+		text = cache.get(key)
+		if text is not None:
+			cache.move_to_end(key)
+			OSCAbstract.s_textCacheHits += 1
+			return text
+		folder = OSCAbstract.s_textCacheFolder
+		if folder is not None:
+			fileName = os.path.join(folder, key + '.scad')
+			if os.path.isfile(fileName):
+				with open(fileName, 'r', encoding='utf-8') as f:
+					text = f.read()
+				OSCAbstract.s_textCacheHits += 1
+				cls.storeText(key, text, False)
+				return text
+		OSCAbstract.s_textCacheMisses += 1
+		return None
+
+
+	@classmethod
+	def storeText(cls, key, text, toDisk=True):
+		cache = OSCAbstract.s_textCache
+		cache[key] = text
+		OSCAbstract.s_textCacheSize += len(text)
+		while OSCAbstract.s_textCacheSize > OSCAbstract.s_textCacheMaxSize and len(cache) > 1:
+			_, oldText = cache.popitem(last=False)
+			OSCAbstract.s_textCacheSize -= len(oldText)
+		folder = OSCAbstract.s_textCacheFolder
+		if toDisk and folder is not None:
+			with open(os.path.join(folder, key + '.scad'), 'w', encoding='utf-8') as f:
+				f.write(text)
+
+
+	@classmethod
+	def clearTextCache(cls):
+		OSCAbstract.s_textCache = OrderedDict()
+		OSCAbstract.s_textCacheSize = 0
+		OSCAbstract.s_textCacheHits = 0
+		OSCAbstract.s_textCacheMisses = 0
+
+
+	@classmethod
+	def setUseTextCache(cls, flag):
+		"""
+			Switch the reuse of subtree texts on or off (it is off by default)
+		"""
+		OSCAbstract.s_useTextCache = flag
+
+
+	@classmethod
+	def setTextCacheMaxSize(cls, maxSize):
+		"""
+			maxSize is the number of characters of all cached texts
+		"""
+		OSCAbstract.s_textCacheMaxSize = maxSize
+
+
+	@classmethod
+	def setTextCacheFolder(cls, folder, maxDiskSize=None):
+		"""
+			Also store the texts in folder (None means: only in memory). maxDiskSize is in bytes
+		"""
+		if folder is not None and not os.path.isdir(folder):
+			os.makedirs(folder)
+		OSCAbstract.s_textCacheFolder = folder
+		if maxDiskSize is not None:
+			OSCAbstract.s_textCacheMaxDiskSize = maxDiskSize
+
+
+	@classmethod
+	def pruneTextCacheFolder(cls):
+		"""
+			Remove the oldest files of the disk cache, until it is smaller than s_textCacheMaxDiskSize
+		"""
+		folder = OSCAbstract.s_textCacheFolder
+		if folder is None:
+			return
+		entries = [entry for entry in os.scandir(folder) if entry.name.endswith('.scad')]
+		stats = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+		total = sum([size for (_, size, _) in stats])
+		for (_, size, path) in sorted(stats):
+			if total <= OSCAbstract.s_textCacheMaxDiskSize:
+				break
+			os.remove(path)
+			total -= size
+
+
+	@classmethod
+	def getTextCacheStats(cls):
+		return (OSCAbstract.s_textCacheHits, OSCAbstract.s_textCacheMisses, len(OSCAbstract.s_textCache), OSCAbstract.s_textCacheSize)
 
 
 	def getTransformation(self):
-		runner = self
-		transform = Affine()
-		while runner is not None:
-			if isinstance(runner, OSCTransform):
-				transform = runner.m_affine * transform
-			runner = runner.m_parent
-		return transform
+		"""
+			Return the product of the affines of all OSCTransforms above me (and of me).
+			It is cached, and only the cached transformation of my parent is needed
+		"""
+		if self.m_transformation is None:
+			if self.m_parent is None:
+				transform = Affine()
+			else:
+				transform = self.m_parent.getTransformation()
+			if isinstance(self, OSCTransform):
+				transform = transform * self.m_affine
+			self.m_transformation = transform
+		return self.m_transformation
+
+
+	def forgetTransformations(self):
+		"""
+			Must be called for a subtree that got a new parent, or if the affine of an OSCTransform was changed
+		"""
+		self.m_transformation = None
+		for child in self.m_children:
+			child.forgetTransformations()
 			
 
 	def writeTabs(self, f, tabs):
-		for _ in range(tabs):
-			f.write(' ')
+		if tabs > 0:
+			f.write(' ' * tabs)
 
 
 	def writeBlockOpen(self, f, tabs):
@@ -145,7 +419,7 @@ class OSCAbstract:
 			Write the given affine to the OSCAD file.
 			Handles orthonormal and non-orthonormal affines
 		"""
-		if not affine.m_matrix.isOrthonormal() or not affine.m_matrix.preservesOrientation():
+		if not affine.m_matrix.isOrthogonal() or not affine.m_matrix.preservesOrientation():
 			self.writeMultMatrix(f, affine)
 			return
 		# we handle here the orthonormal case
@@ -205,6 +479,42 @@ class OSCAbstract:
 		return numFormat % tuple(arr)
 
 
+	def getPointListString(self, points, dim=3, separator=', '):
+		"""
+			Return the string of all points (list of Points or PointArray), each like writePoint2/3 and followed by separator.
+			All numbers are formatted in one % operation (like numpy savetxt does per row)
+		"""
+		if len(points) == 0:
+			return ''
+		if isinstance(points, PointArray):
+			arr = points.m_array[:, :dim].copy()
+		else:
+			arr = np.array([[p.m_x, p.m_y, p.m_z] for p in points])[:, :dim]
+		if np.isnan(arr).any():
+			print('trying to write math.nan to scad file')
+		arr[np.abs(arr) < OSCAbstract.s_floatThreshold] = 0
+		numFormat = OSCAbstract.s_vectorFormat3 if dim == 3 else OSCAbstract.s_vectorFormat2
+		return ((numFormat + separator) * len(arr)) % tuple(arr.ravel().tolist())
+
+
+	@classmethod
+	def getIndexListString(cls, indexLists):
+		"""
+			Return the faces of a polyhedron as string: [[i1,i2,...,],...]
+		"""
+		return ''.join(['[' + ''.join([str(idx) + ',' for idx in face]) + '],' for face in indexLists])
+
+
+	def getScadText(self, tabNo=0) -> str:
+		"""
+			Return the OpenScad code of me (and my children) as string
+		"""
+		self.forgetSubtreeHashes()
+		buffer = OSCWriteBuffer()
+		self.writeToFile(buffer, tabNo)
+		return buffer.getText()
+
+
 	def vectorLength(self, v):
 		return v.distanceOf(Point(0, 0, 0))
 
@@ -233,6 +543,42 @@ class OSCAbstract:
 ######################################################
 
 
+class OSCWriteBuffer:
+	"""
+		A file like object that collects the written strings in a list, and writes them in big chunks (joined) to its file.
+		Without a file, it just collects (see getText())
+	"""
+	s_chunkSize = 1 << 20
+
+	def __init__(self, f=None):
+		self.m_file = f
+		self.m_parts = []
+		self.m_size = 0
+
+
+	def write(self, text):
+		self.m_parts.append(text)
+		self.m_size += len(text)
+		if self.m_file is not None and self.m_size > self.s_chunkSize:
+			self.flush()
+
+
+	def flush(self):
+		if self.m_file is None:
+			return
+		self.m_file.write(''.join(self.m_parts))
+		self.m_parts = []
+		self.m_size = 0
+
+
+	def getText(self) -> str:
+		return ''.join(self.m_parts)
+
+
+######################################################
+######################################################
+
+
 class OSCRoot(OSCAbstract):
 	"""
 		The root node of a OSCAD hierarchy
@@ -251,9 +597,13 @@ class OSCRoot(OSCAbstract):
 	def writeScadTo(self, fileName):
 		if fileName is None:
 			return
+		self.forgetSubtreeHashes()
 		with open(fileName, "w", encoding='utf-8') as f:
-			f.write('$fn='+str(self.s_quality)+';\n\n')
-			self.writeToFile(f, -1)
+			buffer = OSCWriteBuffer(f)
+			buffer.write('$fn='+str(self.s_quality)+';\n\n')
+			self.writeToFile(buffer, -1)
+			buffer.flush()
+		self.pruneTextCacheFolder()
 
 
 	def writeXmlTo(self, fileName):
@@ -388,6 +738,24 @@ class OSCCallModule(OSCAbstract):
 #####################################################
 
 
+class OSCText(OSCAbstract):
+	"""
+		Holds OpenScad code that was generated elsewhere (e.g. in a worker process), it is written unchanged
+	"""
+	def __init__(self, name, text):
+		super().__init__(name)
+		self.m_text = text
+		self.m_type = 'text'
+
+
+	def writeToFile(self, f, tabNo):
+		f.write(self.m_text)
+
+
+#####################################################
+#####################################################
+
+
 class OSCPolygon(OSCAbstract):
 	"""
 		Encapsulates a OSCAD Polygon
@@ -401,9 +769,7 @@ class OSCPolygon(OSCAbstract):
 	def writeToFile(self, f, tabNo):
 		self.writeTabs(f, tabNo)
 		f.write('polygon([')
-		for point in self.m_points:
-			self.writePoint2(f, point)
-			f.write(', ')
+		f.write(self.getPointListString(self.m_points, 2))
 		f.write(']);\n')
 
 
@@ -419,8 +785,9 @@ class OSCPolygon(OSCAbstract):
 class OSCPath(OSCPolygon):
 	"""
 		Encapsulates a (svg) path in OSCAD
+		If a tolerance is given, the path is flattened adaptively (as few points as possible), else by quality
 	"""
-	def __init__(self, name, path, qualityFactor=math.nan):
+	def __init__(self, name, path, qualityFactor=math.nan, tolerance=None):
 		super().__init__(name, [])
 		self.m_type = 'path'
 		if not math.isnan(qualityFactor):
@@ -433,7 +800,10 @@ class OSCPath(OSCPolygon):
 			delta = 1 / OSCRoot.s_quality
 		else:
 			delta = 1 / self.m_quality
-		points = path.getInterPoints(delta)
+		if tolerance is not None:
+			points = path.getAdaptiveInterPoints(tolerance)
+		else:
+			points = path.getAllInterPoints(delta)
 		self.m_points = points
 
 
@@ -762,16 +1132,33 @@ class OSCLongSlot3D(OSCCombination):
 class OSCPolyhedron(OSCAbstract):
 	"""
 		Encapsulates a surface that can be represented by a set of faces
+		Points of faces are welded: points nearer than ZGeomItem.s_wantedAccuracy get the same index.
+		To find them in O(1), a spatial hash (grid cells of size s_wantedAccuracy => point indices) is used.
+		Before writing, the orientation of the faces is checked once (see checkAllPolygons())
 	"""
+	s_neighbourOffsets = list(itertools.product((-1, 0, 1), repeat=3))
+	s_checkOrientation = True		# subclasses that create consistently oriented faces switch it off
+	s_stlTriangleType = np.dtype([('normal', '<f4', (3,)), ('corners', '<f4', (3, 3)), ('attribute', '<u2')])
+	s_3mfContentTypes = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+		+ '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+		+ '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+		+ '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+		+ '</Types>\n')
+	s_3mfRelations = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+		+ '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+		+ '<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+		+ '</Relationships>\n')
 
 	def __init__(self, name, nonPlanarity=-1, massCenter=None):
 		super().__init__(name)
 		self.type = 'polyhedron'
 		self.m_points = []
+		self.m_pointGrid = dict()
 		self.m_namesToIndices = dict()
 		self.m_faces = []
 		self.m_nonPlanarity = nonPlanarity
 		self.m_massCenter = massCenter
+		self.m_facesChecked = False
 
 
 	def addFace(self, points: list):
@@ -788,20 +1175,64 @@ class OSCPolyhedron(OSCAbstract):
 		for point in points:
 			face.append(self.getPointIdx(point))
 		self.m_faces.append(face)
+		self.m_facesChecked = False
 
 
 	def addFaceWithNames(self, pointNames):
-		face = [self.getPointNameIdx(x) for x in pointNames]
+		"""
+			Add the face given by point names (see addPointNames()). Welded neighbours are used once, degenerate faces are dropped
+		"""
+		face = []
+		for idx in [self.getPointNameIdx(x) for x in pointNames]:
+			if not face or face[-1] != idx:
+				face.append(idx)
+		if len(face) > 1 and face[-1] == face[0]:
+			face.pop()
+		if len(face) < 3:
+			return
 		self.m_faces.append(face)
+		self.m_facesChecked = False
 
 
-	# get the index of point in the point list
+	# get the index of point in the point list (or of a point that is nearer than s_wantedAccuracy)
 	# if not yet existing, add it
 	def getPointIdx(self, point):
-		if point in self.m_points:
-			return self.m_points.index(point)
+		(x, y, z) = (point.m_x, point.m_y, point.m_z)
+		cell = self.gridCellOf(point)
+		accuracy = ZGeomItem.s_wantedAccuracy
+		squaredAccuracy = accuracy * accuracy
+		grid = self.m_pointGrid
+		for (dx, dy, dz) in self.s_neighbourOffsets:
+			indices = grid.get((cell[0] + dx, cell[1] + dy, cell[2] + dz))
+			if indices is None:
+				continue
+			for idx in indices:
+				other = self.m_points[idx]
+				diffX = other.m_x - x
+				diffY = other.m_y - y
+				diffZ = other.m_z - z
+				if diffX * diffX + diffY * diffY + diffZ * diffZ < squaredAccuracy:
+					return idx
+		return self.appendPoint(point, cell)
+
+
+	def appendPoint(self, point, cell=None):
+		"""
+			Add the point (without welding) and return its index
+		"""
+		if cell is None:
+			cell = self.gridCellOf(point)
+		idx = len(self.m_points)
 		self.m_points.append(point)
-		return len(self.m_points) - 1
+		self.m_pointGrid.setdefault(cell, []).append(idx)
+		self.m_facesChecked = False
+		return idx
+
+
+	@classmethod
+	def gridCellOf(cls, point) -> tuple:
+		accuracy = ZGeomItem.s_wantedAccuracy
+		return (math.floor(point.m_x / accuracy), math.floor(point.m_y / accuracy), math.floor(point.m_z / accuracy))
 
 
 	def getPointNameIdx(self, pointName):
@@ -811,68 +1242,141 @@ class OSCPolyhedron(OSCAbstract):
 
 	def addPointNames(self, pointNamesDict):
 		self.m_namesToIndices = dict()
-		num = 0
 		for name, point in pointNamesDict.items():
-			self.m_namesToIndices[name] = num
-			self.m_points.append(point)
-			num = num + 1
+			self.m_namesToIndices[name] = self.getPointIdx(point)
+
+
+	def makeFacesIfNeeded(self):
+		"""
+			Subclasses that create their faces not before writing do it here
+		"""
+		pass
+
+
+	def getHashDescription(self) -> str:
+		"""
+			Describe my points and faces as they are: hashing must not change me (writing checks the faces later anyway)
+		"""
+		if not self.m_faces:
+			# faces that are made not before writing (see makeFacesIfNeeded()) are described by what they are made of
+			return super().getHashDescription()
+		hasher = hashlib.sha1(PointArray.fromPoints(self.m_points).m_array.tobytes())
+		hasher.update(repr(self.m_faces).encode('utf-8'))
+		return repr((self.m_type, self.m_name, self.s_checkOrientation)) + hasher.hexdigest()
 
 
 	def writeToFile(self, f, tabNo):
+		self.makeFacesIfNeeded()
 		self.checkAllPolygons()
 		self.writeTabs(f, tabNo)
 		self.writeTabs(f, tabNo)
 		f.write('polyhedron([')
-		for point in self.m_points:
-			self.writePoint3(f, point)
-			f.write(', ')
+		f.write(self.getPointListString(self.m_points))
 		f.write('],\n')
 		self.writeTabs(f, tabNo+1)
 		f.write('[')
-		for indexes in self.m_faces:
-			f.write('[')
-			for index in indexes:
-				f.write(str(index))
-				f.write(',')
-			f.write('],')
+		f.write(self.getIndexListString(self.m_faces))
 		f.write(']);\n')
 
 
 	def checkAllPolygons(self):
-		# check, if every polygon is clockwise (seen from outside)
-		massCenter = self.m_massCenter
-		if massCenter is None:
-			massCenter = Point()
-			for point in self.m_points:
-				massCenter += point
-			factor = 1.0 / len(self.m_points)
-			massCenter = massCenter.scaledBy(factor)
-			self.m_massCenter = massCenter
-		#print(massCenter)
-		num = 0
-		degen = []
-		for face in self.m_faces:
-			points = []
-			for idx in face:
-				points.append(self.m_points[idx])
-			poly = Polygon(points)
-			
-			status = poly.makeClockwise(massCenter)
-			if status == 0:
-				# was clockwise
-				pass
-			elif status == 1:
-				# must reverse:
-				face.reverse() 
+		"""
+			Make every face clockwise seen from outside (i.e. its vector area points to the mass center) and remove degenerate faces.
+			All faces are handled in one numpy pass, and only again after faces or points were added
+		"""
+		if self.m_facesChecked or not self.s_checkOrientation:
+			return
+		self.m_facesChecked = True
+		faces = self.m_faces
+		lengths = np.array([len(face) for face in faces], dtype=int)
+		valid = np.flatnonzero(lengths >= 3)
+		degenerate = np.ones(len(faces), dtype=bool)
+		if len(valid) > 0:
+			points = PointArray.fromPoints(self.m_points).m_array
+			validLengths = lengths[valid]
+			indices = np.fromiter(itertools.chain.from_iterable([faces[ii] for ii in valid]), dtype=int, count=int(validLengths.sum()))
+			starts = np.concatenate(([0], np.cumsum(validLengths)[:-1]))
+			# index of the next point in the same face (the last one is followed by the first one)
+			nextPositions = np.arange(1, len(indices) + 1)
+			nextPositions[starts + validLengths - 1] = starts
+			facePoints = points[indices]
+			vectorAreas = np.add.reduceat(np.cross(facePoints, facePoints[nextPositions]), starts, axis=0)
+			centers = np.add.reduceat(facePoints, starts, axis=0) / validLengths[:, None]
+			if self.m_massCenter is None:
+				massCenter = points.mean(axis=0)
 			else:
-				# degenerate
-				print(f'{self.m_name}: face degenerate: {str(num)}')
-				degen.append(num)
-			num = num +1
+				massCenter = PointArray.asNumpy(self.m_massCenter)
+			sides = np.einsum('ij,ij->i', vectorAreas, massCenter - centers)
+			degenerate[valid] = ~np.any(vectorAreas != 0, axis=1)
+			for ii in valid[(sides < 0) & ~degenerate[valid]]:
+				faces[ii].reverse()
 
-		degen.reverse()
-		for face in degen:
-			self.m_faces.pop(face)
+		for num in reversed(np.flatnonzero(degenerate).tolist()):
+			print(f'{self.m_name}: face degenerate: {str(num)}')
+			faces.pop(num)
+
+
+	def getTriangles(self):
+		"""
+			Return the faces as triangles (a fan per face) in an int array of shape (n, 3).
+			The triangles are counterclockwise seen from outside, as needed for stl and 3mf
+		"""
+		self.makeFacesIfNeeded()
+		self.checkAllPolygons()
+		faces = [face for face in self.m_faces if len(face) >= 3]
+		if not faces:
+			return np.zeros((0, 3), dtype=int)
+		lengths = np.array([len(face) for face in faces], dtype=int)
+		indices = np.fromiter(itertools.chain.from_iterable(faces), dtype=int, count=int(lengths.sum()))
+		starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+		numTriangles = lengths - 2
+		firsts = np.repeat(starts, numTriangles)
+		# the running number of each triangle inside its face
+		inFace = np.arange(int(numTriangles.sum())) - np.repeat(np.cumsum(numTriangles) - numTriangles, numTriangles)
+		seconds = firsts + inFace + 1
+		# faces are clockwise (for OpenScad), so swap the last 2 corners
+		return np.stack((indices[firsts], indices[seconds + 1], indices[seconds]), axis=1)
+
+
+	def writeStlTo(self, fileName, header=None):
+		"""
+			Write me as binary stl file. The file content is built in one preallocated buffer
+		"""
+		triangles = self.getTriangles()
+		points = PointArray.fromPoints(self.m_points).m_array.astype(np.float32)
+		buffer = np.zeros(len(triangles), dtype=self.s_stlTriangleType)
+		corners = points[triangles]
+		normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+		lengths = np.linalg.norm(normals, axis=1)
+		lengths[lengths == 0] = 1
+		buffer['normal'] = normals / lengths[:, None]
+		buffer['corners'] = corners
+		if header is None:
+			header = 'binary stl of ' + str(self.m_name)
+		with open(fileName, 'wb') as f:
+			f.write(header.encode('utf-8')[:80].ljust(80, b' '))
+			f.write(np.array([len(triangles)], dtype='<u4').tobytes())
+			f.write(buffer.tobytes())
+
+
+	def write3mfTo(self, fileName):
+		"""
+			Write me as 3mf file (a zip file containing the mesh as xml)
+		"""
+		triangles = self.getTriangles()
+		points = PointArray.fromPoints(self.m_points).m_array
+		unit = 'inch' if ZGeomItem.s_inchWanted else 'millimeter'
+		vertices = ('<vertex x="%.7g" y="%.7g" z="%.7g"/>\n' * len(points)) % tuple(points.ravel().tolist())
+		faces = ('<triangle v1="%d" v2="%d" v3="%d"/>\n' * len(triangles)) % tuple(triangles.ravel().tolist())
+		model = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+			+ '<model unit="' + unit + '" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+			+ '<resources>\n<object id="1" type="model">\n<mesh>\n<vertices>\n' + vertices + '</vertices>\n'
+			+ '<triangles>\n' + faces + '</triangles>\n</mesh>\n</object>\n</resources>\n'
+			+ '<build>\n<item objectid="1"/>\n</build>\n</model>\n')
+		with zipfile.ZipFile(fileName, 'w', zipfile.ZIP_DEFLATED) as zf:
+			zf.writestr('[Content_Types].xml', self.s_3mfContentTypes)
+			zf.writestr('_rels/.rels', self.s_3mfRelations)
+			zf.writestr('3D/3dmodel.model', model)
 
 
 	def addXmlDescriptionTo(self, node):
@@ -945,8 +1449,11 @@ class OSCHexahedron(OSCPolyhedron):
 
 class OSCExtrudeRounded(OSCPolyhedron):
 	"""
-		The extrusion of a path, with rounded edges of given radius
+		The extrusion of a closed path, with rounded edges of given radius.
+		The path is walked counterclockwise (seen from (0, 0, 1)), whatever its own orientation,
+		so the faces are clockwise seen from outside and the rounding goes inwards
 	"""
+	s_checkOrientation = False		# the faces are oriented by the path, the mass center check fails for concave paths
 	def __init__(self, name, path, height, roundRadius):
 		super().__init__(name)
 		self.m_type = 'ExtrudeRounded'
@@ -959,10 +1466,9 @@ class OSCExtrudeRounded(OSCPolyhedron):
 	def makePolyhedron(self):
 		delta = 1 / OSCRoot.s_quality
 		#print(delta)
-		roundingQuality = 4
-		pointsAndTangents = self.m_path.getInterPointsWithTangent(delta)
+		pointsAndDirections = self.getPointsAndDirections(self.m_path.getAllInterPoints(delta))
 		namesToPoints = dict()
-		numOfPoints = len(pointsAndTangents)
+		numOfPoints = len(pointsAndDirections)
 
 		roundingQuality = 5
 		if self.m_roundRadius == 0:
@@ -970,11 +1476,11 @@ class OSCExtrudeRounded(OSCPolyhedron):
 			
 		corners = self.makeRoundingOffsets(self.m_roundRadius, roundingQuality)
 		numLines = 1
-		self.makeSeveralRoundCornersLines(pointsAndTangents, namesToPoints, corners, numLines)
+		self.makeSeveralRoundCornersLines(pointsAndDirections, namesToPoints, corners, numLines)
 		numLines = numLines + len(corners)	# the next index
 
 		corners = self.makeRoundingOffsets(self.m_roundRadius, roundingQuality, self.m_height)
-		self.makeSeveralRoundCornersLines(pointsAndTangents, namesToPoints, corners, numLines)
+		self.makeSeveralRoundCornersLines(pointsAndDirections, namesToPoints, corners, numLines)
 		numLines = numLines + len(corners) - 1	# the last index
 
 		self.addPointNames(namesToPoints)
@@ -991,6 +1497,43 @@ class OSCExtrudeRounded(OSCPolyhedron):
 		self.addFacesWithNames(numOfPoints - 1, 0, numLines)
 
 
+	@classmethod
+	def getPointsAndDirections(cls, points: list[Point]) -> list[tuple]:
+		"""
+			Return a list of tuples (point, direction) for the outline points in counterclockwise order.
+			direction points inwards and has the length, that moves both adjacent edges by 1 (miter)
+		"""
+		outline = []
+		for point in points:
+			if not outline or not point.isSameAs(outline[-1]):
+				outline.append(point)
+		if len(outline) > 1 and outline[-1].isSameAs(outline[0]):
+			outline.pop()
+		if len(outline) < 3:
+			raise Exception('OSCExtrudeRounded: path must enclose an area')
+
+		# twice the signed area (shoelace formula): negative means clockwise
+		doubleArea = sum([p1.m_x * p2.m_y - p2.m_x * p1.m_y for p1, p2 in zip(outline, outline[1:] + outline[:1])])
+		if doubleArea < 0:
+			outline.reverse()
+
+		num = len(outline)
+		edgeNormals = []		# left of each edge, i.e. inwards
+		for ii in range(num):
+			edge = outline[(ii + 1) % num] - outline[ii]
+			edgeNormals.append(Point(-edge.m_y, edge.m_x).unit())
+		ret = []
+		for ii in range(num):
+			before = edgeNormals[ii - 1]
+			after = edgeNormals[ii]
+			direction = before + after
+			if direction.length() < ZGeomItem.s_wantedAccuracy:
+				direction = after		# the path turns back here
+			direction = direction.unit()
+			ret.append((outline[ii], direction.scaledBy(1.0 / (direction * after))))
+		return ret
+
+
 	def makeRoundingOffsets(self, radius, numSteps, height=0):
 		# if height is > 0, make it reverse down from height
 		circle = Circle2(Point(radius, radius), radius)
@@ -1015,25 +1558,21 @@ class OSCExtrudeRounded(OSCPolyhedron):
 		return ret
 
 
-	def makeSeveralRoundCornersLines(self, pointsAndTangents, namesToPoints, offsets, startLineNo):
+	def makeSeveralRoundCornersLines(self, pointsAndDirections, namesToPoints, offsets, startLineNo):
 		#print(startLineNo)
 		for offset in offsets:
 			hei = offset[0]
 			normal = offset[1]
-			self.makeOneRoundCornersLine(pointsAndTangents, namesToPoints, hei, normal, startLineNo)
+			self.makeOneRoundCornersLine(pointsAndDirections, namesToPoints, hei, normal, startLineNo)
 			startLineNo = startLineNo + 1
 
 
-	def makeOneRoundCornersLine(self, pointsAndTangents, namesToPoints, height, normalDistance, rowIndex):
+	def makeOneRoundCornersLine(self, pointsAndDirections, namesToPoints, height, normalDistance, rowIndex):
 		numOfPoints = 0
 		#print(str(rowIndex) + '  ' + str(height) + ' ' +str(normalDistance))
 		heightOffset = Point(0, 0, height)
-		zVector = Point(0, 0, -1)
-		for pointAndTangent in pointsAndTangents:
-			point = pointAndTangent[0]
-
-			tang = pointAndTangent[1]
-			normal = tang.crossProduct(zVector).scaledTo(normalDistance)
+		for point, direction in pointsAndDirections:
+			normal = direction.scaledBy(normalDistance)
 			point2 = point + heightOffset + normal	# on the top 
 			namesToPoints[str(numOfPoints) + '-' + str(rowIndex)] = point2
 			numOfPoints = numOfPoints + 1
@@ -1075,9 +1614,9 @@ class OSCForm3d(OSCPolyhedron):
 		self.m_type = 'Form3d'
 		
 
-	def writeToFile(self, f, tabNo=0):
-		self.makePolyhedron()
-		super().writeToFile(f, tabNo)
+	def makeFacesIfNeeded(self):
+		if not self.m_faces:
+			self.makePolyhedron()
 
 
 	def makePolyhedron(self):
@@ -1,7 +1,9 @@
 """
 	Contains those classes:
 	- SislObjectHolder
+	- SislScope
 	- SislCurveHolder
+	- SislSurfaceGrid
 	- SislSurfaceHolder
 	- SislLoftedSurfaceHolder
 	- LoftedSurfaceCurveType (enum for creating lofted surfaces)
@@ -14,11 +16,22 @@
 
 from __future__ import annotations
 import math
+import weakref
 from enum import IntEnum
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
-from zutils.ZGeom import Point
+from zutils.ZGeom import Point, PointArray
 from zutils.ZMatrix import Matrix, Affine
-import zutils.sisl_adapt as sl
+try:
+	import zutils.sisl_adapt as sl
+	s_ffi = sl.ffi
+except ImportError:
+	# without the compiled library only the marshalling helpers of SislObjectHolder can be used
+	import cffi
+	sl = None
+	s_ffi = cffi.FFI()
 
 
 ########################################################
@@ -28,12 +41,20 @@ import zutils.sisl_adapt as sl
 class SislObjectHolder:
 	"""
 		Common superclass for SislCurveHolder, SislSurfaceHolder, ....
+		Can be used as context manager (frees the SISL object at exit), see also SislScope
 	"""
 	s_spaceDimension = 3
+	s_scopes = []			# stack of the active SislScopes
+	s_liveCounts = dict()	# class name -> number of not yet freed SISL objects
+	s_liveBytes = 0			# estimated size of all not yet freed SISL objects
 
 	def __init__(self, structPtr):
 		self.m_structPtr = structPtr
 		self.m_massCenter = None
+		self.m_sislBytes = 0
+		self.m_isRegistered = False
+		if structPtr is not None and structPtr != sl.ffi.NULL:
+			self.registerLive()
 
 
 	def __del__(self):
@@ -43,40 +64,105 @@ class SislObjectHolder:
 		self.free()
 
 
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, excType, excValue, traceback):
+		self.free()
+
+
+	def registerLive(self) -> None:
+		"""
+			Count me as living SISL object and give me to the innermost SislScope
+		"""
+		self.m_sislBytes = self.getSislBytes()
+		self.m_isRegistered = True
+		name = self.__class__.__name__
+		SislObjectHolder.s_liveCounts[name] = SislObjectHolder.s_liveCounts.get(name, 0) + 1
+		SislObjectHolder.s_liveBytes += self.m_sislBytes
+		if self.s_scopes:
+			self.s_scopes[-1].add(self)
+
+
+	def unregisterLive(self) -> None:
+		"""
+			My SISL object is freed: do not count it any more
+		"""
+		if not self.m_isRegistered:
+			return
+		name = self.__class__.__name__
+		SislObjectHolder.s_liveCounts[name] -= 1
+		SislObjectHolder.s_liveBytes -= self.m_sislBytes
+		self.m_sislBytes = 0
+		self.m_isRegistered = False
+
+
+	def getSislBytes(self) -> int:
+		"""
+			Return the estimated size of my SISL object in bytes (struct, knots and vertices)
+		"""
+		return 0
+
+
+	def getReferencedHolders(self) -> list[SislObjectHolder]:
+		"""
+			Return the holders i keep references to (they must live as long as i do)
+		"""
+		return []
+
+
 	@classmethod
-	def makePointArray(cls, points: list[Point]) -> sl.ffi.cdata:
+	def getLiveStats(cls) -> dict:
 		"""
-			Return an ffi array of doubles, that contains all the coordinates
+			Return a dict with the number of all living SISL objects ('count'), their estimated size ('bytes')
+			and the number per holder class
 		"""
-		if isinstance(points, Point):
-			return cls.makePointArray([points])
-		ret = cls.makeDoubleArray(3 * len(points))
-		idx = 0
-		for p in points:
-			for ii in range(3):
-				ret[idx] = p[ii]
-				idx += 1
+		ret = dict(SislObjectHolder.s_liveCounts)
+		ret['count'] = sum(SislObjectHolder.s_liveCounts.values())
+		ret['bytes'] = SislObjectHolder.s_liveBytes
 		return ret
 
 
+	@classmethod
+	def makePointArray(cls, points: list[Point]|PointArray) -> sl.ffi.cdata:
+		"""
+			Return an ffi array of doubles, that contains all the coordinates.
+			For a PointArray (or a float64 numpy array) no copy is made: the ffi array points into its memory
+		"""
+		if isinstance(points, Point):
+			points = [points]
+		return s_ffi.from_buffer('double[]', cls.getCoordinateArray(points))
+
+
+	@classmethod
+	def getCoordinateArray(cls, points: list[Point]|PointArray) -> np.ndarray:
+		"""
+			Return a flat contiguous float64 numpy array with all the coordinates of points
+		"""
+		if isinstance(points, PointArray):
+			arr = points.m_array
+		elif isinstance(points, np.ndarray):
+			arr = points
+		else:
+			arr = PointArray.fromPoints(points).m_array
+		return np.ascontiguousarray(arr, dtype=np.float64).reshape(-1)
+
+
 	@classmethod
 	def makeDoubleArray(cls, num: int) -> sl.ffi.cdata:
 		"""
 			Return a ffi array holding space for num doubles
 		"""
-		return sl.ffi.new('double[]', num)
+		return s_ffi.new('double[]', num)
 
 
 	@classmethod
 	def makeDoubleArrayWithValues(cls, values: list[float]) -> sl.ffi.cdata:
 		"""
-			Return a (double) ffi array holding the given floats
+			Return a (double) ffi array holding the given floats (for a contiguous float64 numpy array without copying)
 		"""
-		num = len(values)
-		ret = sl.ffi.new('double[]', num)
-		for ii in range(num):
-			ret[ii] = values[ii]
-		return ret
+		return s_ffi.from_buffer('double[]', np.ascontiguousarray(values, dtype=np.float64).reshape(-1))
 
 
 	@classmethod
@@ -84,7 +170,7 @@ class SislObjectHolder:
 		"""
 			Return a ffi array holding space for num ints
 		"""
-		return sl.ffi.new('int[]', num)
+		return s_ffi.new('int[]', num)
 
 
 	@classmethod
@@ -92,11 +178,7 @@ class SislObjectHolder:
 		"""
 			Return a ffi array holding the given ints
 		"""
-		num = len(values)
-		ret = sl.ffi.new('int[]', num)
-		for ii in range(num):
-			ret[ii] = values[ii]
-		return ret
+		return s_ffi.from_buffer('int[]', np.ascontiguousarray(values, dtype=np.intc).reshape(-1))
 
 
 
@@ -145,7 +227,7 @@ class SislObjectHolder:
 		"""
 			Return a pointer to an int, usable for status return value
 		"""
-		return sl.ffi.new('int[]', 1)
+		return s_ffi.new('int[]', 1)
 
 
 	@classmethod
@@ -153,12 +235,17 @@ class SislObjectHolder:
 		"""
 			Return list of num points read from the ffi double array
 		"""
-		ret = []
-		ii = 0
-		while ii < num * 3:
-			ret.append(Point(arr[ii], arr[ii+1], arr[ii+2]))
-			ii += 3
-		return ret
+		return cls.getPointArrayFromArray(arr, num).asPoints()
+
+
+	@classmethod
+	def getPointArrayFromArray(cls, arr: sl.ffi.cdata, num: int, copy: bool=False) -> PointArray:
+		"""
+			Return a PointArray with num points read from the ffi double array.
+			Without copy it is a view on the ffi memory: use copy=True, if that memory belongs to a SISL struct
+		"""
+		values = cls.getDoubleArrayFromArray(arr, 3 * num, copy)
+		return PointArray(values.reshape(num, 3))
 
 
 	@classmethod
@@ -166,12 +253,25 @@ class SislObjectHolder:
 		"""
 			Return list of num floats read from the ffi double array
 		"""
-		ret = []
-		ii = 0
-		while ii < num:
-			ret.append(arr[ii])
-			ii += 1
-		return ret
+		return cls.getDoubleArrayFromArray(arr, num).tolist()
+
+
+	@classmethod
+	def getDoubleArrayFromArray(cls, arr: sl.ffi.cdata, num: int, copy: bool=False) -> np.ndarray:
+		"""
+			Return a numpy array with num floats read from the ffi double array (a view, if not copy).
+			arr may also be a list or numpy array (then it is converted to contiguous float64)
+		"""
+		if num == 0:
+			return np.zeros(0)
+		if isinstance(arr, s_ffi.CData):
+			cType = s_ffi.typeof(arr)
+			if cType.kind not in ('array', 'pointer') or cType.item.cname != 'double':
+				raise Exception('getDoubleArrayFromArray: need a double array, not ' + cType.cname)
+			ret = np.frombuffer(s_ffi.buffer(arr, num * s_ffi.sizeof('double')), dtype=np.float64)
+		else:
+			ret = np.ascontiguousarray(arr, dtype=np.float64).reshape(-1)[:num]
+		return ret.copy() if copy else ret
 
 
 	@classmethod
@@ -189,6 +289,68 @@ class SislObjectHolder:
 ###################################################################
 
 
+class SislScope:
+	"""
+		Owns all SislObjectHolders created while it is active (use it in a with statement).
+		At exit all of them are freed, except those given to keep().
+		Scopes can be nested: kept holders go to the enclosing scope
+	"""
+	def __init__(self):
+		self.m_holders = []
+
+
+	def __enter__(self):
+		SislObjectHolder.s_scopes.append(self)
+		return self
+
+
+	def __exit__(self, excType, excValue, traceback):
+		SislObjectHolder.s_scopes.remove(self)
+		self.freeAll()
+
+
+	def add(self, holder: SislObjectHolder) -> None:
+		self.m_holders.append(holder)
+
+
+	def keep(self, holder: SislObjectHolder) -> SislObjectHolder:
+		"""
+			Do not free holder at my exit. Return holder
+		"""
+		kept = [holder] + holder.getReferencedHolders()
+		mine = [x for x in self.m_holders if any(x is y for y in kept)]
+		self.m_holders = [x for x in self.m_holders if not any(x is y for y in mine)]
+		parent = self.getParent()
+		if parent is not None:
+			for x in mine:
+				parent.add(x)
+		return holder
+
+
+	def getParent(self) -> SislScope:
+		"""
+			Return the enclosing active scope or None
+		"""
+		scopes = SislObjectHolder.s_scopes
+		if self in scopes:
+			idx = scopes.index(self)
+			return scopes[idx-1] if idx > 0 else None
+		return scopes[-1] if scopes else None
+
+
+	def freeAll(self) -> None:
+		"""
+			Free all my holders
+		"""
+		for holder in self.m_holders:
+			holder.free()
+		self.m_holders = []
+
+
+###################################################################
+###################################################################
+
+
 class SislCurveHolder(SislObjectHolder):
 	def __init__(self, structPtr):
 		super().__init__(structPtr)
@@ -231,14 +393,15 @@ class SislCurveHolder(SislObjectHolder):
 		if value.isSameAs(Point()):
 			raise Exception('constant value of curve must not be (0, 0, 0)')
 
-		curve1 = cls.createCurveFromStraightLine(Point(), Point(0, 1))
-		curve2 = cls.createCurveFromStraightLine(Point(1), Point(1, 1))
-		surf = SislLoftedSurfaceHolder.createLoftedSurfaceFromBSplines([curve1, curve2])
-		ret = surf.getDerivationAtEdge(True, False)
+		with SislScope() as scope:
+			curve1 = cls.createCurveFromStraightLine(Point(), Point(0, 1))
+			curve2 = cls.createCurveFromStraightLine(Point(1), Point(1, 1))
+			surf = SislLoftedSurfaceHolder.createLoftedSurfaceFromBSplines([curve1, curve2])
+			ret = surf.getDerivationAtEdge(True, False)
 
-		matrix = Matrix.makeOrthonormalTransformation(value) * Matrix(value.length())
-		aff = Affine(matrix)
-		return ret.transformedBy(aff)
+			matrix = Matrix.makeOrthonormalTransformation(value) * Matrix(value.length())
+			aff = Affine(matrix)
+			return scope.keep(ret.transformedBy(aff))
 
 
 	@classmethod
@@ -280,7 +443,11 @@ class SislCurveHolder(SislObjectHolder):
 		curves = []
 		for segDescription in allControlPoints:
 			curves.append(cls.createCurveFromControlPoints(segDescription, order, isOpen))
-		return cls.joinAllCurves(curves)
+		ret = cls.joinAllCurves(curves)
+		if len(curves) > 1:
+			for curve in curves:
+				curve.free()
+		return ret
 
 
 	@classmethod
@@ -302,7 +469,9 @@ class SislCurveHolder(SislObjectHolder):
 		runner = curvesIn[0]
 		for ii in range(1, len(curvesIn)):
 			curve2 = curvesIn[ii]
-			longer = runner.joinedWith(curve2)		# play it safe for GC of (old) ret
+			longer = runner.joinedWith(curve2)
+			if ii > 1:
+				runner.free()		# an intermediate result
 			runner = longer
 		return runner
 
@@ -365,10 +534,18 @@ class SislCurveHolder(SislObjectHolder):
 			Release my resources. Is automatically called at GC time
 		"""
 		if self.m_structPtr is not None:
+			self.unregisterLive()
 			sl.lib.freeCurve(self.m_structPtr)
 			self.m_structPtr = None
 
 
+	def getSislBytes(self) -> int:
+		struct = self.m_structPtr[0]
+		numVertices = getattr(struct, 'in')
+		numDoubles = numVertices * struct.idim + numVertices + struct.ik
+		return sl.ffi.sizeof('SISLCurve') + numDoubles * sl.ffi.sizeof('double')
+
+
 	def getRegularCurvePoints(self, numPoints: int) -> list[Point]:
 		"""
 			Return an array of curve points at regular parameter values.
@@ -381,6 +558,14 @@ class SislCurveHolder(SislObjectHolder):
 		"""
 			Return an array of curve points at the given (python) parameter values.
 		"""
+		return self.getCurvePointArrayAt(paramsPython).asPoints()
+
+
+	def getCurvePointArrayAt(self, paramsPython: list[float]) -> PointArray:
+		"""
+			Return a PointArray of curve points at the given parameter values (list or numpy array).
+			The PointArray uses the memory that SISL has written to
+		"""
 		allVs = self.makeDoubleArrayWithValues(paramsPython)
 		numPoints = len(paramsPython)
 
@@ -389,7 +574,7 @@ class SislCurveHolder(SislObjectHolder):
 		sl.lib.s1542(self.m_structPtr, numPoints, allVs, arrPointer, stat)
 		self.checkStat(stat, 'getCurvePointsAt')
 
-		return self.getPointsFromArray(arrPointer, numPoints)
+		return self.getPointArrayFromArray(arrPointer, numPoints)
 
 
 	def dumpCurvePoints(self, numPoints: int) -> None:
@@ -434,9 +619,12 @@ class SislCurveHolder(SislObjectHolder):
 		"""
 			Return a new SislCurveHolder which is myself transformed by affine transformation aff
 		"""
-		verts, knots, order = self.getNurbsData()
-		vertsTransformed = [aff * x for x in verts]
-		return self.createNewCurve(vertsTransformed, order, knots)
+		struct = self.m_structPtr[0]
+		numVertices = getattr(struct, 'in')
+		order = struct.ik
+		verts = self.getPointArrayFromArray(struct.ecoef, numVertices)
+		knots = self.getDoublesFromArray(struct.et, order + numVertices)
+		return self.createNewCurve(aff.applyMany(verts), order, knots)
 
 
 	def getNurbsData(self) -> list:
@@ -534,18 +722,70 @@ class SislCurveHolder(SislObjectHolder):
 #######################################################################
 
 
+class SislSurfaceGrid:
+	"""
+		The result of evaluating a surface on a regular parameter grid (see s1506).
+		m_points, m_derivsU, m_derivsV and m_normals are read only numpy arrays of shape (numU, numV, 3),
+		they are strided views on the raw SISL output (no copies)
+	"""
+	def __init__(self, pointsAndDerivs, normals, numU: int, numV: int):
+		# SISL runs fastest over u, each entry holds point, u-derivative and v-derivative
+		split = pointsAndDerivs.reshape(numV, numU, -1, 3).transpose(1, 0, 2, 3)
+		self.m_points = split[:, :, 0]
+		self.m_derivsU = split[:, :, 1]
+		self.m_derivsV = split[:, :, 2]
+		self.m_normals = normals.reshape(numV, numU, 3).transpose(1, 0, 2)
+		self.m_sizes = [numU, numV]
+
+
+	@classmethod
+	def asPointLists(cls, arr) -> list[list[Point]]:
+		"""
+			Return a list of numU lists with the Points of the (numU, numV, 3) array arr
+		"""
+		return [[Point(x, y, z) for x, y, z in row] for row in arr.tolist()]
+
+
+	def getPointsLists(self) -> list[list[Point]]:
+		"""
+			Return the surface points as list of numU lists with all v-points for the respective u value
+		"""
+		return self.asPointLists(self.m_points)
+
+
+	def getNormalsLists(self) -> list[list[Point]]:
+		"""
+			Return the normals as list of numU lists with all v-normals for the respective u value
+		"""
+		return self.asPointLists(self.m_normals)
+
+
+#######################################################################
+#######################################################################
+
+
 class SislSurfaceHolder(SislObjectHolder):
 	"""
 		Encapsulate a Sisl surface
 	"""
+	s_useGridCache = True
+	s_gridCacheMaxBytes = 64 * 1024 * 1024		# per surface
+	s_gridCacheMaxTotalBytes = 256 * 1024 * 1024		# all surfaces together
+	s_gridCacheTotalBytes = 0
+	s_gridCacheLru = OrderedDict()		# (id(surface), numU, numV) -> (weakref to surface, bytes) of all cached grids
+	s_gridDerivs = 1
+	s_gridSizeOfOnePoint = int(3 * (s_gridDerivs + 1)*(s_gridDerivs + 2)/2)		# point and 2 partial derivatives
+	s_closestChunkSize = 256		# points per task in findClosestParamsMany
+	s_closestNumThreads = 1		# default for findClosestMany. More threads are experimental: SISL is not proven to be re-entrant
+
 	def __init__(self, structPtr):
 		super().__init__(structPtr)
 		self.m_startPar1 = -1
 		self.m_endPar1 = -1
 		self.m_startPar2 = -1
 		self.m_endPar2 = -1
-		#self.m_surfacePoints = dict()
-		#self.m_normalVectors = dict()
+		self.m_gridCache = OrderedDict()		# (numU, numV) -> [pointsAndDerivs, normals] as numpy arrays
+		self.m_gridCacheBytes = 0
 		self.getParameterRanges()
 
 
@@ -597,11 +837,38 @@ class SislSurfaceHolder(SislObjectHolder):
 		"""
 			Release my resources. Is automatically called at GC time
 		"""
+		self.clearGridCache()
 		if self.m_structPtr is not None:
+			self.unregisterLive()
 			sl.lib.freeSurf(self.m_structPtr)
 			self.m_structPtr = None
 
 
+	def getSislBytes(self) -> int:
+		struct = self.m_structPtr[0]
+		numDoubles = struct.in1 * struct.in2 * struct.idim + struct.in1 + struct.ik1 + struct.in2 + struct.ik2
+		return sl.ffi.sizeof('SISLSurf') + numDoubles * sl.ffi.sizeof('double')
+
+
+	def clearGridCache(self) -> None:
+		"""
+			Forget all the grids evaluated by readRegularSurfacePoints
+		"""
+		for key in list(self.m_gridCache.keys()):
+			self.dropGrid(key)
+
+
+	def dropGrid(self, key: tuple) -> None:
+		"""
+			Remove the grid for key = (numU, numV) from my cache
+		"""
+		buffers = self.m_gridCache.pop(key)
+		size = sum([x.nbytes for x in buffers])
+		self.m_gridCacheBytes -= size
+		SislSurfaceHolder.s_gridCacheTotalBytes -= size
+		SislSurfaceHolder.s_gridCacheLru.pop((id(self),) + key, None)
+
+
 	def getParameterRanges(self) -> None:
 		"""
 			Get the start and stop values for my U and V parameters. Store in myself.
@@ -646,18 +913,10 @@ class SislSurfaceHolder(SislObjectHolder):
 			Return surfacePoints for a regular parameter grid
 			Return list of numU lists with all v-points for the respective u value.
 		"""
-		#if numU is None:
-		#	# just return the last created points
-		#	keys = list(self.m_surfacePoints.keys())
-		#	if len(keys) != 1:
-		#		raise Exception('do not know, which points to return')
-		#	return self.m_surfacePoints[keys[0]]
 		if math.isnan(numV):
 			numV = numU
-		#key = str(numU) + 'x' + str(numV)
-		#if self.m_surfacePoints.get(key, None) is None:
-		return self.readRegularSurfacePoints(numU, numV)[0]
-		#return self.m_surfacePoints[key]
+		grid = self.getGrid(numU, numV)
+		return [grid.getPointsLists(), grid.m_sizes]
 
 
 	def getNormalVectors(self, numU: int=None, numV: int=math.nan) -> list:
@@ -665,70 +924,89 @@ class SislSurfaceHolder(SislObjectHolder):
 			Return surface normals for a regular parameter grid
 			Return list of numV lists with all u-points for the respective v value.
 		"""
-		#if numU is None:
-		#	# just return the last created points
-		#	keys = list(self.m_normalVectors.keys())
-		#	if len(keys) != 1:
-		#		raise Exception('do not know, which normals to return')
-		#	return self.m_normalVectors[keys[0]]
 		if math.isnan(numV):
 			numV = numU
-		#key = str(numU) + 'x' + str(numV)
-		#if self.m_surfacePoints.get(key, None) is None:
-		return self.readRegularSurfacePoints(numU, numV)[1]
-		#return self.m_normalVectors[key]
+		grid = self.getGrid(numU, numV)
+		return [grid.getNormalsLists(), grid.m_sizes]
 
 
-	def readRegularSurfacePoints(self, numU: int, numV: int) -> None:
+	def getGridBuffers(self, numU: int, numV: int) -> list[np.ndarray]:
 		"""
-			Read the points from sisl for a regular parameter grid
+			Return [pointsAndDerivs, normals]: the raw s1506 output for a regular parameter grid as read only numpy arrays.
+			The result is cached per (numU, numV). Least recently used grids are dropped above s_gridCacheMaxBytes
+			for one surface resp. s_gridCacheMaxTotalBytes for all surfaces
 		"""
-		#key = str(numU) + 'x' + str(numV)
-		derivs = 1
-		sizeOfOnePoint = int(3 * (derivs + 1)*(derivs + 2)/2)
-		sizeOfPointsArray = int(sizeOfOnePoint * numU * numV)
-		pointsAndDerivsPointer = self.makeDoubleArray(sizeOfPointsArray)
-		normalsPointer = self.makeDoubleArray(3 * numU * numV)
+		key = (numU, numV)
+		ret = self.m_gridCache.get(key, None)
+		if ret is not None:
+			self.m_gridCache.move_to_end(key)
+			SislSurfaceHolder.s_gridCacheLru.move_to_end((id(self),) + key)
+			return [x.view() for x in ret]
+
+		sizeOfPointsArray = int(self.s_gridSizeOfOnePoint * numU * numV)
+		pointsAndDerivs = np.empty(sizeOfPointsArray)
+		normals = np.empty(3 * numU * numV)
 
 		uVals = self.getInterValues(self.m_startPar1, self.m_endPar1, numU)
 		vVals = self.getInterValues(self.m_startPar2, self.m_endPar2, numV)
 
 		stat = self.statItem()
 
-		sl.lib.s1506(self.m_structPtr, derivs, numU, uVals, numV, vVals, pointsAndDerivsPointer, normalsPointer, stat)
+		sl.lib.s1506(self.m_structPtr, self.s_gridDerivs, numU, uVals, numV, vVals, 
+			sl.ffi.from_buffer('double[]', pointsAndDerivs), sl.ffi.from_buffer('double[]', normals), stat)
 		self.checkStat(stat, 'Surface:readRegularSurfacePoints')
 
-		# in the array pointsAndDerivsPointer we have a mix of surface point coordinates and partial derivatives
-		# we extract the point coordinates first
-		allPointsCoordinates = []
-		for ii in range(numU * numV):
-			start = ii * sizeOfOnePoint
-			theSlice = slice(start, start + 3)
-			allPointsCoordinates.extend(pointsAndDerivsPointer[theSlice])
+		pointsAndDerivs.flags.writeable = False
+		normals.flags.writeable = False
+		ret = [pointsAndDerivs, normals]
+		if self.s_useGridCache:
+			self.storeGrid(key, ret)
+		return [x.view() for x in ret]
 
-		allPoints = self.getPointsFromArray(allPointsCoordinates, numU * numV)
-		allNormals = self.getPointsFromArray(normalsPointer, numU * numV)
 
-		# now we rearrange the points and normals in sublists
-		pointsLists = []
-		normalsLists = []
-		for ii in range(numU):
-			pointList = []
-			pointsLists.append(pointList)
-			normalsList = []
-			normalsLists.append(normalsList)
-			for jj in range(numV):
-				idx = jj * numU + ii
-				pointList.append(allPoints[idx])
-				normalsList.append(allNormals[idx])
-
-		# store the lists
-		#self.m_surfacePoints[key] = [pointsLists, [numU, numV]]
-		#self.m_normalVectors[key] = [normalsLists, [numU, numV]]
-		surfacePoints = [pointsLists, [numU, numV]]
-		normalVectors = [normalsLists, [numU, numV]]
+	def storeGrid(self, key: tuple, buffers: list[np.ndarray]) -> None:
+		"""
+			Put the grid buffers into my cache and drop the oldest grids, if it gets too big
+		"""
+		size = sum([x.nbytes for x in buffers])
+		if size > min(self.s_gridCacheMaxBytes, self.s_gridCacheMaxTotalBytes):
+			return
+		self.m_gridCache[key] = buffers
+		self.m_gridCacheBytes += size
+		lru = SislSurfaceHolder.s_gridCacheLru
+		lru[(id(self),) + key] = (weakref.ref(self), size)
+		SislSurfaceHolder.s_gridCacheTotalBytes += size
+		while self.m_gridCacheBytes > self.s_gridCacheMaxBytes:
+			self.dropGrid(next(iter(self.m_gridCache)))
+		while SislSurfaceHolder.s_gridCacheTotalBytes > self.s_gridCacheMaxTotalBytes:
+			(_, numU, numV), (surfaceRef, oldSize) = next(iter(lru.items()))
+			surface = surfaceRef()
+			if surface is None:
+				lru.popitem(last=False)
+				SislSurfaceHolder.s_gridCacheTotalBytes -= oldSize
+			else:
+				surface.dropGrid((numU, numV))
+
+
+	def getGrid(self, numU: int, numV: int=math.nan) -> SislSurfaceGrid:
+		"""
+			Return a SislSurfaceGrid with points, partial derivatives and normals for a regular parameter grid
+		"""
+		if math.isnan(numV):
+			numV = numU
+		pointsAndDerivs, normals = self.getGridBuffers(numU, numV)
+		return SislSurfaceGrid(pointsAndDerivs, normals, numU, numV)
+
+
+	def readRegularSurfacePoints(self, numU: int, numV: int) -> list:
+		"""
+			Read the points from sisl for a regular parameter grid
+			Return [[pointsLists, [numU, numV]], [normalsLists, [numU, numV]]]
+		"""
+		grid = self.getGrid(numU, numV)
+		surfacePoints = [grid.getPointsLists(), grid.m_sizes]
+		normalVectors = [grid.getNormalsLists(), grid.m_sizes]
 		return [surfacePoints, normalVectors]
-		#self.dumpPoints(numU, numV, pointsLists)
 
 
 	def dumpPoints(self, numU: int, numV: int, pointsLists: list[Point]):
@@ -843,6 +1121,90 @@ class SislSurfaceHolder(SislObjectHolder):
 		return [u, v]
 
 
+	def findClosestParamsMany(self, points: list[Point]|PointArray, resolution: float=1e-6, warmStart: bool=True, numThreads: int=None) -> np.ndarray:
+		"""
+			Return the parameters of the closest surface points for all points as numpy array of shape (n, 2).
+			See findClosestMany()
+		"""
+		return self.findClosestMany(points, resolution, warmStart, numThreads)[0]
+
+
+	def findClosestPointsMany(self, points: list[Point]|PointArray, resolution: float=1e-6, warmStart: bool=True, numThreads: int=None) -> PointArray:
+		"""
+			Return a PointArray with the closest surface point for all points. See findClosestMany()
+		"""
+		return self.findClosestMany(points, resolution, warmStart, numThreads)[1]
+
+
+	def findClosestMany(self, points: list[Point]|PointArray, resolution: float=1e-6, warmStart: bool=True, numThreads: int=None) -> list:
+		"""
+			Return [params, closestPoints] (numpy array of shape (n, 2) and PointArray) for all points.
+			With warmStart each point starts a local Newton iteration (s1775) from the result of its predecessor,
+			the global search (s1958) is only used, if that fails or gives an implausible distance.
+			So points should be ordered spatially coherent (e.g. along a path).
+			numThreads defaults to s_closestNumThreads (1, i.e. serial). With numThreads > 1 chunks of points are handled
+			in a thread pool (SISL calls release the GIL). This is opt-in, as the re-entrancy of SISL is not proven
+		"""
+		if numThreads is None:
+			numThreads = self.s_closestNumThreads
+		coords = self.getCoordinateArray(points).reshape(-1, 3)
+		num = len(coords)
+		params = np.zeros((num, 2))
+		closest = np.zeros((num, 3))
+		if num == 0:
+			return [params, PointArray(closest)]
+
+		# the first global search builds the box structures inside my SISL struct, all later calls reuse them.
+		# Do it before going parallel
+		self.findClosestChunk(coords, params, closest, 0, 1, resolution, False)
+		chunkSize = self.s_closestChunkSize
+		starts = list(range(1, num, chunkSize))
+		doChunk = lambda start: self.findClosestChunk(coords, params, closest, start, min(start + chunkSize, num), resolution, warmStart)
+		if numThreads > 1 and len(starts) > 1:
+			with ThreadPoolExecutor(numThreads) as pool:
+				list(pool.map(doChunk, starts))
+		else:
+			for start in starts:
+				doChunk(start)
+		return [params, PointArray(closest)]
+
+
+	def findClosestChunk(self, coords: np.ndarray, params: np.ndarray, closest: np.ndarray, start: int, stop: int, resolution: float, warmStart: bool) -> None:
+		"""
+			Write the closest parameters and points for coords[start:stop] into params and closest
+		"""
+		startPars = self.makeDoubleArrayWithValues([self.m_startPar1, self.m_startPar2])
+		endPars = self.makeDoubleArrayWithValues([self.m_endPar1, self.m_endPar2])
+		leftKnot1 = self.makeIntArrayWithValues([0])
+		leftKnot2 = self.makeIntArrayWithValues([0])
+		normal = self.makeDoubleArray(3)
+		dist = self.makeDoubleArray(1)
+		stat = self.statItem()
+		prevDist = None
+
+		for ii in range(start, stop):
+			inPnt = sl.ffi.from_buffer('double[]', coords[ii])
+			paramsOut = sl.ffi.from_buffer('double[]', params[ii])
+			pointOut = sl.ffi.from_buffer('double[]', closest[ii])
+			found = False
+			if warmStart and prevDist is not None:
+				guess = sl.ffi.from_buffer('double[]', params[ii-1])
+				sl.lib.s1775(self.m_structPtr, inPnt, self.s_spaceDimension, resolution, startPars, endPars, guess, paramsOut, stat)
+				if stat[0] >= 0:
+					sl.lib.s1421(self.m_structPtr, 0, paramsOut, leftKnot1, leftKnot2, pointOut, normal, stat)
+					newDist = float(np.linalg.norm(closest[ii] - coords[ii]))
+					# the true distance can exceed the one of the predecessor at most by the step between them
+					step = float(np.linalg.norm(coords[ii] - coords[ii-1]))
+					found = stat[0] >= 0 and newDist <= prevDist + step + resolution
+			if not found:
+				sl.lib.s1958(self.m_structPtr, inPnt, self.s_spaceDimension, resolution, resolution, paramsOut, dist, stat)
+				self.checkStat(stat, 'Surface:findClosestParamsMany')
+				sl.lib.s1421(self.m_structPtr, 0, paramsOut, leftKnot1, leftKnot2, pointOut, normal, stat)
+				self.checkStat(stat, 'Surface:findClosestParamsMany')
+				newDist = dist[0]
+			prevDist = newDist
+
+
 	def getOneSurfacePoint(self, u: float, v: float) -> Point:
 		"""
 			Return only the surface point for the given parameters. No derivation and no normal
@@ -878,9 +1240,9 @@ class SislSurfaceHolder(SislObjectHolder):
 		knotsV = self.getDoublesFromArray(struct.et2, numKnotsV)
 
 		numVertices = numVerticesU * numVerticesV
-		verts = self.getPointsFromArray(struct.ecoef, numVertices)
+		verts = self.getPointArrayFromArray(struct.ecoef, numVertices)
 
-		vertsTransformed = [aff * x for x in verts]
+		vertsTransformed = aff.applyMany(verts)
 		return self.createNewSurface(numVerticesU, numVerticesV, vertsTransformed, orderU, orderV, knotsU, knotsV)
 
 
@@ -946,6 +1308,10 @@ class SislLoftedSurfaceHolder(SislSurfaceHolder):
 		self.m_bePseudoExtrusion = False
 
 
+	def getReferencedHolders(self) -> list[SislObjectHolder]:
+		return list(self.m_curves)
+
+
 	class LoftedSurfaceCurveType(IntEnum):
 		"""
 			See description of s1538
@@ -1016,9 +1382,12 @@ class SislLoftedSurfaceHolder(SislSurfaceHolder):
 			param = self.m_paramsOfCurves[-1]
 		coordinateDirection = 2
 		deriveCurve = derivationSurf.pickACurveAtParameter(param, coordinateDirection)
+		derivationSurf.free()
 		if inverted:
 			affMirror = Affine.makePointMirror()
-			return deriveCurve.transformedBy(affMirror)
+			ret = deriveCurve.transformedBy(affMirror)
+			deriveCurve.free()
+			return ret
 		return deriveCurve
 
 
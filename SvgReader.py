@@ -4,6 +4,9 @@
 
 import math
 import os.path
+import re
+import hashlib
+from collections import OrderedDict
 import xml.etree.ElementTree as ET
 from zutils.ZGeom import Point, Circle2, Ellipse2
 from zutils.ZPath import ZPath, ZBezier3Segment, ZLineSegment, ZBezier2Segment, ZArcSegment
@@ -16,13 +19,50 @@ class SvgPathReader:
 	"""
 		Allows to read an existing svg file and to convert pathes and ellipses to objects of class ZPath.ZPath
 	"""
+	s_commandPattern = re.compile(r'([MmZzLlHhVvCcSsQqTtAa])([^MmZzLlHhVvCcSsQqTtAa]*)')
+	s_numberPattern = re.compile(r'[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+	s_flagPattern = re.compile(r'[\s,]*([01])')
+
+	# LRU cache of parsed d attributes: key => path (before the extraction of full ellipses), see parsePathCached()
+	s_pathCache = OrderedDict()
+	s_pathCacheSize = 256
+	s_pathCacheHits = 0
+	s_pathCacheMisses = 0
+
 	@classmethod
 	def classParsePath(cls, dAttr, smartCircles=True) -> ZPath:
 		"""
 			Return the path described in the d-attribute.
 		"""
 		instance = cls()
-		return instance.parsePath(dAttr, smartCircles)
+		return instance.parsePathCached(dAttr, smartCircles)
+
+
+	@classmethod
+	def pathCacheKey(cls, text, smartCircles) -> str:
+		return hashlib.sha1((str(smartCircles) + '|' + text).encode('utf-8')).hexdigest()
+
+
+	@classmethod
+	def clearPathCache(cls):
+		cls.s_pathCache.clear()
+		cls.s_pathCacheHits = 0
+		cls.s_pathCacheMisses = 0
+
+
+	@classmethod
+	def setPathCacheSize(cls, size):
+		"""
+			Set the maximal number of cached paths (0 disables the cache)
+		"""
+		cls.s_pathCacheSize = size
+		while len(cls.s_pathCache) > size:
+			cls.s_pathCache.popitem(last=False)
+
+
+	@classmethod
+	def getPathCacheStats(cls) -> dict:
+		return {'hits': cls.s_pathCacheHits, 'misses': cls.s_pathCacheMisses, 'size': len(cls.s_pathCache)}
 
 
 	def __init__(self):
@@ -30,7 +70,6 @@ class SvgPathReader:
 		self.m_namespaces = {'svg': 'http://www.w3.org/2000/svg'}
 		self.m_dAtributeName = 'd'
 		self.m_text = None
-		self.m_idx = 0
 		self.m_commands = []
 		self.m_currentCommand = None
 		self.m_args = []
@@ -39,10 +78,11 @@ class SvgPathReader:
 		self.m_paths = []
 		self.m_circles = []
 		self.m_currentLoopStart = None
+		self.m_rawPath = None
 
 	def initialize(self):
 		self.m_text = None
-		self.m_idx = 0
+		self.m_rawPath = None
 		self.m_commands = []
 		self.m_currentCommand = None
 		self.m_args = []
@@ -57,57 +97,62 @@ class SvgPathReader:
 		self.m_dAtributeName = attName
 
 	def foundSomething(self):
-		return len(self.m_commands) > 0
+		return len(self.m_commands) > 0 or self.m_rawPath is not None
 
 
 	def readFile(self, fName) -> list[ZPath]:
-		if not os.path.exists(fName):
-			raise Exception('SvgPathReader.readFile(): File does not exist: ' + fName)
-		self.m_fName = fName
-		tree = ET.parse(fName)
-		rootNode = tree.getroot()
-		self.m_paths = []
-
-		#self.enumerateTags(rootNode)
-
-		for g in rootNode.findall('svg:g', namespaces=self.m_namespaces):
-			#self.enumerateTags(g)
-			self.analyzeGroup(g)
-
-		for circle in rootNode.findall('svg:circle', namespaces=self.m_namespaces):
-			self.parseCircle(circle)
-
+		"""
+			Read all paths, circles and ellipses of the file. Return the list of paths
+		"""
+		self.m_paths = list(self.iterFile(fName))
 		return self.m_paths
 
 
-	def analyzeGroup(self, node):
-		for pathNode in node.findall('svg:path', namespaces=self.m_namespaces):
-			text = pathNode.get(self.m_dAtributeName)
-			if not text:
-				#print('could not find attribute ' + self.m_dAtributeName)
-				# not every path must be mirrored!
-				text = pathNode.get('d')
-			path = self.parsePath(text)
-			path.m_groupId = self.getGroupName(node)
-		for circle in node.findall('svg:circle', namespaces=self.m_namespaces):
-			self.parseCircle(circle)
-		for ellipse in node.findall('svg:ellipse', namespaces=self.m_namespaces):
-			self.parseEllipse(ellipse)
-		for group in node.findall('svg:g', namespaces=self.m_namespaces):
-			# groups can be nested
-			self.analyzeGroup(group)
-
-
-	def getGroupName(self, node):
-		#print('in getGroupNode')
-		while node:
-			#print(node)
-			theId = node.get('id', None)
-			if theId is not None:
-				#print('found group name:' + theId)
-				return theId
-			node = node.find('..')
-		return None
+	def iterFile(self, fName):
+		"""
+			Read the file in a streaming way (iterparse) and yield each path (in groups) as soon as it is complete.
+			Circles and ellipses are collected in m_circles. The yielded paths are not kept (see readFile()),
+			processed elements are cleared and removed from their parent to keep the memory flat.
+			The group id of a path is the id of the nearest enclosing group that has one
+		"""
+		if not os.path.exists(fName):
+			raise Exception('SvgPathReader.readFile(): File does not exist: ' + fName)
+		self.m_fName = fName
+		ns = '{' + self.m_namespaces['svg'] + '}'
+		groupTag = ns + 'g'
+		elemStack = []
+		groupIds = [None]
+
+		for (event, elem) in ET.iterparse(fName, events=('start', 'end')):
+			if event == 'start':
+				elemStack.append(elem)
+				if elem.tag == groupTag:
+					groupIds.append(elem.get('id', groupIds[-1]))
+				continue
+
+			elemStack.pop()
+			tag = elem.tag
+			parent = elemStack[-1] if elemStack else None
+			inGroup = parent is not None and parent.tag == groupTag
+			if tag == groupTag:
+				groupIds.pop()
+			elif tag == ns + 'path' and inGroup:
+				text = elem.get(self.m_dAtributeName)
+				if not text:
+					# not every path must be mirrored!
+					text = elem.get('d')
+				path = self.parsePathCached(text)
+				path.m_groupId = groupIds[-1]
+				if len(path.m_segments) > 0:
+					yield path
+			elif tag == ns + 'circle' and (inGroup or len(elemStack) == 1):
+				self.parseCircle(elem)
+			elif tag == ns + 'ellipse' and inGroup:
+				self.parseEllipse(elem)
+			if parent is not None:
+				# the earlier children of parent are removed already, so remove() finds elem at once
+				elem.clear()
+				parent.remove(elem)
 
 
 	def enumerateTags(self, node):
@@ -136,45 +181,15 @@ class SvgPathReader:
 	def parsePath(self, text, smartCircles=True) -> ZPath:
 		self.initialize()
 		self.m_text = text
-		self.m_idx = 0
-		while True:
-			token = self.nextToken()
-			if token is None:
-				break
-			#print(token)
-			value = token[0]
-			theType = token[1]
-			
-			if theType == 'command':
-				# we must start a new command
-				if value in 'zZ':
-					self.finishLastCommand()
-					self.closeTheCurrentLoop()
-					continue
-				self.addCommand(SvgCommand.getCommandForName(value))
-
-			elif theType == 'number':
-				# we found a number
-				self.m_args.append(float(value))
-				cmd = self.m_currentCommand
-				
-				if cmd is None:
-					# this may never happen for the first command
-					# currentCommand is None, we must create a new command,
-					# that was not given in the d string
-					# so we can assume, that self.m_possibleNextCmdName is set
-					cmd = SvgCommand.getCommandForName(self.m_possibleNextCmdName)
-					self.addCommand(cmd)
-					cmd.m_start = self.m_lastPoint
-					# m_args was cleaned in addCommand()
-					self.m_args.append(float(value))
-
-				possibleNextCmdName = cmd.getDefaultFollowerName(len(self.m_args))
-				self.m_possibleNextCmdName = possibleNextCmdName
-				if possibleNextCmdName is not None:
-					# currentCommand is finished, we might have to create a new one
-					self.finishLastCommand()
-					self.m_currentCommand = None
+		for (value, numbers) in self.tokenizePath(text):
+			if value in 'zZ':
+				self.finishLastCommand()
+				self.closeTheCurrentLoop()
+				continue
+			# we must start a new command
+			self.addCommand(SvgCommand.getCommandForName(value))
+			for number in numbers:
+				self.addNumber(number)
 				
 		self.finishLastCommand()
 		for cmd in self.m_commands:
@@ -182,11 +197,101 @@ class SvgPathReader:
 		path = self.getPath()
 		if smartCircles:
 			self.m_circles.extend(path.extractFullEllipses())
-		if len(path.m_segments) > 0:
-			self.m_paths.append(path)
 		return path
 
 
+	def parsePathCached(self, text, smartCircles=True) -> ZPath:
+		"""
+			Like parsePath(), but identical d attributes are parsed only once (LRU cache, see s_pathCacheSize).
+			The cache holds the path before the extraction of full ellipses, results share no points with it,
+			but their joints are shared between neighbour segments exactly as in a freshly parsed path
+		"""
+		if self.s_pathCacheSize <= 0:
+			return self.parsePath(text, smartCircles)
+		cache = SvgPathReader.s_pathCache
+		key = self.pathCacheKey(text, smartCircles)
+		rawPath = cache.get(key)
+		if rawPath is None:
+			SvgPathReader.s_pathCacheMisses += 1
+			path = self.parsePath(text, smartCircles)
+			cache[key] = self.getPath().deepCopy()
+			if len(cache) > self.s_pathCacheSize:
+				cache.popitem(last=False)
+			return path
+		SvgPathReader.s_pathCacheHits += 1
+		cache.move_to_end(key)
+		self.initialize()
+		self.m_text = text
+		self.m_rawPath = rawPath
+		path = rawPath.deepCopy()
+		if smartCircles:
+			self.m_circles.extend(path.extractFullEllipses())
+		return path
+
+
+	def addNumber(self, number):
+		"""
+			Add a number argument to the current command. If it is already complete, a new (implicit) command is created
+		"""
+		self.m_args.append(number)
+		cmd = self.m_currentCommand
+		
+		if cmd is None:
+			# this may never happen for the first command
+			# currentCommand is None, we must create a new command,
+			# that was not given in the d string
+			# so we can assume, that self.m_possibleNextCmdName is set
+			cmd = SvgCommand.getCommandForName(self.m_possibleNextCmdName)
+			self.addCommand(cmd)
+			cmd.m_start = self.m_lastPoint
+			# m_args was cleaned in addCommand()
+			self.m_args.append(number)
+
+		possibleNextCmdName = cmd.getDefaultFollowerName(len(self.m_args))
+		self.m_possibleNextCmdName = possibleNextCmdName
+		if possibleNextCmdName is not None:
+			# currentCommand is finished, we might have to create a new one
+			self.finishLastCommand()
+			self.m_currentCommand = None
+
+
+	@classmethod
+	def tokenizePath(cls, text) -> list:
+		"""
+			Split the d attribute into a list of tuples (commandLetter, [numbers]) in one pass.
+			Handles exponents, numbers without separators (like "1.5.5" or "1-2") and
+			the packed flags of arcs (like "a10 10 0 1150 50")
+		"""
+		ret = []
+		for match in cls.s_commandPattern.finditer(text):
+			cmd = match.group(1)
+			argText = match.group(2)
+			ret.append((cmd, cls.parseNumbers(argText, cmd in 'aA')))
+		return ret
+
+
+	@classmethod
+	def parseNumbers(cls, argText, isArc=False) -> list:
+		"""
+			Return the list of numbers in argText. For arcs, the 4th and 5th number (of every 7) are single digit flags
+		"""
+		ret = []
+		pos = 0
+		length = len(argText)
+		while True:
+			if isArc and len(ret) % 7 in (3, 4):
+				match = cls.s_flagPattern.match(argText, pos)
+			else:
+				match = cls.s_numberPattern.match(argText, pos)
+			if match is None:
+				break
+			ret.append(float(match.group(1)))
+			pos = match.end()
+		if argText[pos:length].strip(' \t\r\n,'):
+			raise Exception('SvgPathReader: illegal path data: ' + argText)
+		return ret
+
+
 	def addEllipsesFromPath(self, path):
 		for seg in path.m_segments:
 			# this must be a bunch of ZArcSegments
@@ -221,6 +326,9 @@ class SvgPathReader:
 
 
 	def getPath(self):
+		if self.m_rawPath is not None:
+			# the last path came from the cache
+			return self.m_rawPath.deepCopy()
 		path = ZPath()
 		segs = []
 		for cmd in self.m_commands:
@@ -249,46 +357,6 @@ class SvgPathReader:
 		self.m_currentCommand = None
 
 
-	def nextToken(self):
-		"""
-			Return the next token, but swallow 'ignore' and 'comma' tokens. Should be quite helpful for debugging.
-		"""
-		while True:
-			tok = self.nextTokenOld()
-			if tok is None:
-				# finished
-				return None
-			if not tok[1] in ['ignore', 'comma']:
-				# useful token
-				return tok
-
-
-	def nextTokenOld(self):
-		text = self.m_text
-		idx = self.m_idx
-		if len(text) <= idx:
-			return None
-		nextChar = text[idx]
-		idx = idx + 1
-		self.m_idx = idx
-		if nextChar.isalpha():
-			return [nextChar, 'command']
-		if nextChar == ' ':
-			return [nextChar, 'ignore']
-		if nextChar == ',':
-			return [nextChar, 'comma']
-		collector = nextChar
-		while True:
-			if len(text) <= idx:
-				return [collector, 'number']
-			nextChar = text[idx]			
-			if nextChar not in '-.0123456789':
-				return [collector, 'number']
-			collector = collector + nextChar
-			idx = idx + 1
-			self.m_idx = idx
-
-
 ################################################
 ################################################
 
@@ -691,6 +759,12 @@ class SvgCommandArc(SvgCommand):
 		return True
 
 
+	def getDefaultFollowerName(self, numOfArgs):
+		if numOfArgs == 7:
+			return self.commandFor('A')
+		return None
+
+
 	def acceptNumbers(self, numbers):
 		self.m_rx = numbers[0]
 		self.m_ry = numbers[1]
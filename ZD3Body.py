@@ -4,13 +4,14 @@
 	- ZBall3d
 	- ZCylinder
 	- ZCone
-	calculates intersection with 3d line
+	calculates intersection with 3d line (or with many lines at once, see intersectLines())
 """
 
 import math
 from numbers import Number
+import numpy as np
 
-from zutils.ZGeom import ZGeomItem, Point, Line, Plane, Circle2, Circle3
+from zutils.ZGeom import ZGeomItem, Point, PointArray, Line, Plane, Circle2, Circle3
 from zutils.ZMatrix import Matrix, Affine
 
 
@@ -22,19 +23,76 @@ class D3Body:
 		Abstract superclass, implements intersectLine()
 	"""
 	def intersectLine(self, line):
-		aff = Affine()
-		if self.isSimple():
-			doer = self
-		else:
-			aff = self.makeAffToSimple()
-			doer = self.transformedBy(aff)
-
+		(aff, doer) = self.getSimpleForm()
 		line2 = aff * line
 		inter = doer.intersectLineSimple(line2)
 		affInv = aff.inverted()
 		return [affInv * q for q in inter]
 
 
+	def intersectLines(self, lines) -> list:
+		"""
+			Like intersectLine() for many lines: all lines are transformed at once to my simple form,
+			and all quadratic equations are solved together.
+			Return a list (one entry per line) of lists of the intersection points, ordered along the line direction
+		"""
+		if len(lines) == 0:
+			return []
+		(aff, doer) = self.getSimpleForm()
+		starts = aff.applyMany(PointArray.fromPoints([line.m_p1 for line in lines])).m_array
+		stops = aff.applyMany(PointArray.fromPoints([line.m_p2 for line in lines])).m_array
+		directions = stops - starts
+		directions /= np.linalg.norm(directions, axis=1)[:, None]
+		(a, b, c) = doer.quadraticsForLinesSimple(starts, directions)
+		(params, counts) = self.solveQuadratics(a, b, c)
+
+		rows = np.repeat(np.arange(len(lines)), counts)
+		points = PointArray(starts[rows] + params[:, None] * directions[rows])
+		points = aff.inverted().applyMany(points).asPoints()
+		ret = []
+		idx = 0
+		for count in counts.tolist():
+			ret.append(points[idx:idx + count])
+			idx += count
+		return ret
+
+
+	@classmethod
+	def solveQuadratics(cls, a, b, c):
+		"""
+			Solve a * t^2 + b * t + c = 0 for arrays a, b, c (like ZGeomItem.solveQuadratic()).
+			Return all solutions (ordered per equation) and the number of solutions for each equation
+		"""
+		accuracy = ZGeomItem.s_wantedAccuracy
+		linear = np.abs(a) < accuracy
+		safeA = np.where(linear, 1.0, a)
+		safeB = np.where(np.abs(b) < accuracy, 1.0, b)
+		disk = b * b - 4 * a * c
+		tangent = ~linear & (np.abs(disk) < accuracy)
+		root = np.sqrt(np.maximum(disk, 0.0))
+		t1 = (-b - root) / (2.0 * safeA)
+		t2 = (-b + root) / (2.0 * safeA)
+		first = np.where(linear, -c / safeB, np.where(tangent, -b / (2.0 * safeA), np.minimum(t1, t2)))
+		second = np.maximum(t1, t2)
+		counts = np.where(linear, (np.abs(b) >= accuracy).astype(int), np.where(tangent, 1, np.where(disk > 0, 2, 0)))
+		allParams = np.stack((first, second), axis=1)
+		rows, cols = np.nonzero(np.arange(2)[None, :] < counts[:, None])
+		return (allParams[rows, cols], counts)
+
+
+	def getSimpleForm(self):
+		"""
+			Return the affine that makes me simple, and the simple body. As bodies are not changed, it is computed only once
+		"""
+		if self.m_simpleForm is None:
+			if self.isSimple():
+				self.m_simpleForm = (Affine(), self)
+			else:
+				aff = self.makeAffToSimple()
+				self.m_simpleForm = (aff, self.transformedBy(aff))
+		return self.m_simpleForm
+
+
 	def printTabs(cls, tabs):
 		"""
 			Print the given number of tabs and make no line feed at the end.
@@ -56,6 +114,7 @@ class ZBall3d(D3Body):
 	def __init__(self, c, r):
 		self.m_center = c
 		self.m_radius = r
+		self.m_simpleForm = None
 
 
 	def containsPoint(self, p: Point) -> bool:
@@ -98,6 +157,17 @@ class ZBall3d(D3Body):
 		return ret
 
 
+	def quadraticsForLinesSimple(self, starts, directions):
+		"""
+			Return the coefficients a, b, c (arrays) of the quadratic equations for the line parameters:
+			|start + t * direction|^2 = r^2
+		"""
+		a = np.einsum('ij,ij->i', directions, directions)
+		b = 2 * np.einsum('ij,ij->i', starts, directions)
+		c = np.einsum('ij,ij->i', starts, starts) - self.m_radius * self.m_radius
+		return (a, b, c)
+
+
 ####################################################################
 ####################################################################
 
@@ -110,6 +180,7 @@ class ZCylinder(D3Body):
 		self.m_p1 = p1
 		self.m_p2 = p2
 		self.m_r2 = r2
+		self.m_simpleForm = None
 		
 		self.m_centerLine = centerLine
 
@@ -279,6 +350,17 @@ class ZCylinder(D3Body):
 		return ret
 
 
+	def quadraticsForLinesSimple(self, starts, directions):
+		"""
+			Return the coefficients a, b, c (arrays) of the quadratic equations for the line parameters:
+			x^2 + y^2 = r^2
+		"""
+		(px, py) = (starts[:, 0], starts[:, 1])
+		(dx, dy) = (directions[:, 0], directions[:, 1])
+		r = self.m_r2
+		return (dx*dx + dy*dy, 2*(px*dx + py*dy), px*px + py*py - r*r)
+
+
 	def clone(self):
 		return ZCylinder(self.m_p1, self.m_p2, self.m_r2, self.m_centerLine)
 
@@ -440,8 +522,8 @@ class ZCone(ZCylinder):
 			# z is handled a bit different
 			# cone equation here:
 			# (c11*z + c12)^2 + (c21*z + c22)^2 = k^2*z^2
-			a = c11*c11 + c22*c22 - k*k
-			b = 2*c11*c22 + 2*c21*c22
+			a = c11*c11 + c21*c21 - k*k
+			b = 2*c11*c12 + 2*c21*c22
 			c = c12*c12 + c22*c22
 
 		solutions = ZGeomItem.solveQuadratic(a, b, c)
@@ -450,6 +532,20 @@ class ZCone(ZCylinder):
 		return ret
 
 
+	def quadraticsForLinesSimple(self, starts, directions):
+		"""
+			Return the coefficients a, b, c (arrays) of the quadratic equations for the line parameters:
+			x^2 + y^2 = k^2 * z^2
+		"""
+		k2 = math.tan(self.openingAngle()) ** 2
+		(px, py, pz) = (starts[:, 0], starts[:, 1], starts[:, 2])
+		(dx, dy, dz) = (directions[:, 0], directions[:, 1], directions[:, 2])
+		a = dx*dx + dy*dy - k2*dz*dz
+		b = 2*(px*dx + py*dy - k2*pz*dz)
+		c = px*px + py*py - k2*pz*pz
+		return (a, b, c)
+
+
 	def isSimple(self):
 		if not self.m_center.isSameAs(Point()):
 			return False
@@ -2,6 +2,8 @@
 	Contains several 2d-3d related classes
 	- ZGeomItem: abstract superclass, handling also metric/imperial setting
 	- Point
+	- PointArray: numpy based array of many points (for bulk operations)
+	- PointView: a Point, that is a row of a PointArray
 	- Cube
 	- Rect
 	- Circle2
@@ -19,6 +21,7 @@ from typing import List
 import math
 import random
 import sys
+import numpy as np
 from scipy.optimize import minimize_scalar
 #from typing_extensions import Annotated
 
@@ -32,6 +35,7 @@ class ZGeomItem:
 		Superclass of all the ZGeom classes. Provides some class methods for equality, rounding and printing.
 		Also handles metric/imperial setting
 	"""
+	__slots__ = ()						# allows compact subclasses (like Point) - the others still get a __dict__
 	s_inchWanted = False
 	s_mmAccuracy = 0.001
 	s_wantedAccuracy = 0.001
@@ -193,7 +197,12 @@ class ZGeomItem:
 class Point(ZGeomItem):
 	"""
 		A point in 3d. Sometimes there is no clear distinction to Vectors.
+		Points are compact (__slots__). They can be used as keys in dicts or sets: equality and hashing
+		are based on coordinates quantised to a grid of s_wantedAccuracy / 2, so that p1 == p2 implies p1.isSameAs(p2)
+		(but not vice versa, if the points lie near a grid border). Do not change a point while it is used as a key.
 	"""
+	__slots__ = ('m_x', 'm_y', 'm_z')
+
 	def __init__(self, x=0.0, y=0.0, z=0.0):
 		super().__init__()
 		self.m_x = x
@@ -502,6 +511,41 @@ class Point(ZGeomItem):
 		return self.isSameAs(Point())
 
 
+	def quantisedKey(self) -> tuple:
+		"""
+			Return my coordinates as tuple of ints on a grid of s_wantedAccuracy / 2 (used for hashing and equality)
+		"""
+		grid = ZGeomItem.s_wantedAccuracy * 0.5
+		return (self.quantise(self.m_x, grid), self.quantise(self.m_y, grid), self.quantise(self.m_z, grid))
+
+
+	@classmethod
+	def quantise(cls, value: float, grid: float):
+		"""
+			Return value as int on the grid. Non finite values (nan, inf) cannot be rounded: return them unchanged
+		"""
+		scaled = value / grid
+		if not math.isfinite(scaled):
+			return value
+		return round(scaled)
+
+
+	def __eq__(self, other) -> bool:
+		if not isinstance(other, Point):
+			return NotImplemented
+		return self.quantisedKey() == other.quantisedKey()
+
+
+	def __ne__(self, other) -> bool:
+		if not isinstance(other, Point):
+			return NotImplemented
+		return self.quantisedKey() != other.quantisedKey()
+
+
+	def __hash__(self) -> int:
+		return hash(self.quantisedKey())
+
+
 	def anyPerpendicularPoint(self) -> Point:
 		"""
 			return any point in the plane that goes through me and is perpendicular to me
@@ -570,6 +614,217 @@ class Point(ZGeomItem):
 #############################################################################
 
 
+class PointArray(ZGeomItem):
+	"""
+		A contiguous array of n points, stored as numpy array of shape (n, 3) and dtype float64.
+		Use it instead of a list of Points, if many points must be handled (sampling paths and surfaces).
+		Indexing with an int returns a PointView (writing through to the array), slicing returns a PointArray (sharing the data)
+	"""
+	def __init__(self, data=None):
+		super().__init__()
+		if data is None:
+			arr = np.zeros((0, 3))
+		elif isinstance(data, PointArray):
+			arr = data.m_array
+		elif isinstance(data, int):
+			arr = np.zeros((data, 3))
+		else:
+			arr = np.asarray(data, dtype=np.float64)
+			if arr.ndim == 1 and len(arr) == 0:
+				arr = arr.reshape(0, 3)
+		if arr.ndim != 2 or arr.shape[1] != 3:
+			raise Exception('PointArray needs an array of shape (n, 3)')
+		self.m_array = arr
+
+
+	@classmethod
+	def fromPoints(cls, points) -> PointArray:
+		"""
+			Return a new PointArray containing copies of the given Points
+		"""
+		arr = np.array([[p.m_x, p.m_y, p.m_z] for p in points], dtype=np.float64)
+		return PointArray(arr.reshape(-1, 3))
+
+
+	@classmethod
+	def asNumpy(cls, item):
+		"""
+			Return something that can be broadcast against my m_array: item may be a PointArray, a Point or a number
+		"""
+		if isinstance(item, PointArray):
+			return item.m_array
+		if isinstance(item, Point):
+			return np.array([item.m_x, item.m_y, item.m_z])
+		return item
+
+
+	def asPoints(self) -> List[Point]:
+		"""
+			Return a list of (independent) Points
+		"""
+		return [Point(x, y, z) for x, y, z in self.m_array.tolist()]
+
+
+	def __len__(self) -> int:
+		return self.m_array.shape[0]
+
+
+	def __getitem__(self, key):
+		"""
+			int => PointView, slice or index array => PointArray
+		"""
+		if isinstance(key, (int, np.integer)):
+			num = len(self)
+			if key < 0:
+				key += num
+			if key < 0 or key >= num:
+				raise IndexError('PointArray index out of range')
+			return PointView(self.m_array, int(key))
+		return PointArray(self.m_array[key])
+
+
+	def __setitem__(self, key, point):
+		self.m_array[key] = self.asNumpy(point)
+
+
+	def __iter__(self):
+		for ii in range(len(self)):
+			yield PointView(self.m_array, ii)
+
+
+	def __str__(self) -> str:
+		return 'PointArray(' + str(len(self)) + ' points)'
+
+
+	def __add__(self, other) -> PointArray:
+		return PointArray(self.m_array + self.asNumpy(other))
+
+
+	def __sub__(self, other) -> PointArray:
+		return PointArray(self.m_array - self.asNumpy(other))
+
+
+	def __neg__(self) -> PointArray:
+		return PointArray(-self.m_array)
+
+
+	def copy(self) -> PointArray:
+		return PointArray(self.m_array.copy())
+
+
+	def scaledBy(self, factor) -> PointArray:
+		"""
+			factor may be a number or an array of n numbers (one per point)
+		"""
+		factor = np.asarray(factor, dtype=np.float64)
+		if factor.ndim == 1:
+			factor = factor[:, np.newaxis]
+		return PointArray(self.m_array * factor)
+
+
+	def dot(self, other):
+		"""
+			Return an array of the n scalar products (other may be a Point or a PointArray)
+		"""
+		return np.einsum('ij,ij->i', self.m_array, np.broadcast_to(self.asNumpy(other), self.m_array.shape))
+
+
+	def crossProduct(self, other) -> PointArray:
+		return PointArray(np.cross(self.m_array, self.asNumpy(other)))
+
+
+	def lengthsSquared(self):
+		return self.dot(self)
+
+
+	def lengths(self):
+		"""
+			Return an array of the n euklidean lengths
+		"""
+		return np.sqrt(self.lengthsSquared())
+
+
+	def units(self) -> PointArray:
+		"""
+			Return all my points scaled to length 1
+		"""
+		lengths = self.lengths()
+		if np.any(lengths == 0):
+			raise Exception('zero vector has no length')
+		return self.scaledBy(1.0 / lengths)
+
+
+	def min(self) -> Point:
+		"""
+			Return the maximal point that has coordinates <= all of mine.
+		"""
+		return Point(*self.m_array.min(axis=0).tolist())
+
+
+	def max(self) -> Point:
+		"""
+			Return the minimal point that has coordinates >= all of mine.
+		"""
+		return Point(*self.m_array.max(axis=0).tolist())
+
+
+	def isSameAs(self, other) -> bool:
+		if len(self) != len(other):
+			return False
+		diff = self - other
+		return bool(np.all(diff.lengths() < ZGeomItem.s_wantedAccuracy))
+
+
+#############################################################################
+#############################################################################
+
+
+class PointView(Point):
+	"""
+		A Point, that is a row of a PointArray (no copy). Changing me changes the PointArray.
+		Arithmetic results are normal Points.
+	"""
+	__slots__ = ('m_array', 'm_row')
+
+	def __init__(self, array, row):
+		self.m_array = array
+		self.m_row = row
+
+
+	@property
+	def m_x(self):
+		return float(self.m_array[self.m_row, 0])
+
+
+	@m_x.setter
+	def m_x(self, value):
+		self.m_array[self.m_row, 0] = value
+
+
+	@property
+	def m_y(self):
+		return float(self.m_array[self.m_row, 1])
+
+
+	@m_y.setter
+	def m_y(self, value):
+		self.m_array[self.m_row, 1] = value
+
+
+	@property
+	def m_z(self):
+		return float(self.m_array[self.m_row, 2])
+
+
+	@m_z.setter
+	def m_z(self, value):
+		self.m_array[self.m_row, 2] = value
+
+
+#############################################################################
+#############################################################################
+
+
 class Cube(ZGeomItem):
 	"""
 		Cube in 3 dimensions, parallel to axes
@@ -599,13 +854,24 @@ class Cube(ZGeomItem):
 		'''
 			return a cube that contains me and otherCube
 		'''
-		return Cube(min(self.m_origin, otherCube.m_origin), self.m_corner.max(otherCube.m_corner))
+		return Cube(self.m_origin.min(otherCube.m_origin), self.m_corner.max(otherCube.m_corner))
 
 
 	def containsPoint(self, point) -> bool:
 		return self.m_origin <= point <= self.m_corner
 
 
+	def distanceOfPoint(self, point) -> float:
+		"""
+			Return the distance of point to me (0, if I contain it)
+		"""
+		ret = 0.0
+		for ii in range(3):
+			diff = max(self.m_origin[ii] - point[ii], 0.0, point[ii] - self.m_corner[ii])
+			ret += diff * diff
+		return math.sqrt(ret)
+
+
 	def getHeightY(self) -> float:
 		return self.m_corner.m_y - self.m_origin.m_y
 
@@ -1739,7 +2005,7 @@ class Polygon(ZGeomItem):
 				break
 		if idx < 0:
 			return False
-		self.m_points.remove(self.m_points[idx])
+		del self.m_points[idx]
 		return True
 		
 
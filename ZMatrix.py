@@ -2,25 +2,30 @@
 	Contains classes
 	- Matrix
 	- Affine
+	Both keep their values in numpy arrays, so many points (a PointArray) can be transformed with one matrix product (see applyMany())
 """
 
 from __future__ import annotations
 import numbers
 import math
+import numpy as np
 
 
-from zutils.ZGeom import ZGeomItem, Point, Line, Plane, Circle2, Ellipse3
+from zutils.ZGeom import ZGeomItem, Point, PointArray, PointView, Line, Plane, Circle2, Ellipse3
 
 
 ##########################################
 
 
 class Matrix(ZGeomItem):
+	s_orthogonalTolerance = 1e-12		# up to this deviation, inverted() uses the transposed matrix
+
 	def __init__(self, pointList=None):
 		"""
 			Return a matrix with the given line vectors.
 			If no argument is given return the identity matrix
 			If argument is a number, return a scaling matrix
+			If argument is a numpy array (n x 3), it is used (not copied)
 		"""
 		# the points are the lines
 		factor = math.nan
@@ -29,13 +34,14 @@ class Matrix(ZGeomItem):
 		if isinstance(pointList, numbers.Number):
 			factor = pointList
 		if not math.isnan(factor):
-			pointList = []
-			for ii in range(3):
-				p = Point()
-				p[ii] = factor
-				pointList.append(p)
-				#print(p)
-		self.m_lines = pointList
+			array = np.eye(3) * factor
+		elif isinstance(pointList, np.ndarray):
+			array = pointList
+		else:
+			array = np.array([[p.m_x, p.m_y, p.m_z] for p in pointList], dtype=np.float64)
+		self.m_array = array
+		# the lines are views of m_array, so changing them changes me
+		self.m_lines = [PointView(array, ii) for ii in range(len(array))]
 		self.m_determinant = math.nan
 
 
@@ -149,12 +155,7 @@ class Matrix(ZGeomItem):
 		# after changing any value it is obsolete!
 		if not math.isnan(self.m_determinant):
 			return self.m_determinant
-		line = self.m_lines[0]
-		a, b, c = line.m_x, line.m_y, line.m_z
-		line = self.m_lines[1]
-		d, e, f = line.m_x, line.m_y, line.m_z
-		line = self.m_lines[2]
-		g, h, i = line.m_x, line.m_y, line.m_z
+		(a, b, c), (d, e, f), (g, h, i) = self.m_array.tolist()
 		det = a*e*i + b*f*g + c*d*h - c*e*g - b*d*i - a*f*h
 		self.m_determinant = det
 		return det
@@ -174,10 +175,7 @@ class Matrix(ZGeomItem):
 
 
 	def rounded(self, num=2) -> Matrix:
-		ps = []
-		for line in self.m_lines:
-			ps.append(line.rounded(num))
-		return Matrix(ps)
+		return Matrix(np.round(self.m_array, num))
 
 
 	def numLines(self) -> int:
@@ -189,10 +187,8 @@ class Matrix(ZGeomItem):
 
 
 	def isSameAs(self, other) -> bool:
-		for ii in range(self.numLines()):
-			if not self.m_lines[ii].isSameAs(other.m_lines[ii]):
-				return False
-		return True
+		diff = self.m_array - other.m_array
+		return bool(np.all(np.sqrt(np.einsum('ij,ij->i', diff, diff)) < ZGeomItem.s_wantedAccuracy))
 
 
 	def solve(self, target) -> Point:
@@ -223,45 +219,43 @@ class Matrix(ZGeomItem):
 
 
 	def __mul__(self, other):
-		numLines = self.numLines()
 		if isinstance(other, numbers.Number):
-			factor = other
-			retLines = []
-			for ii in range(numLines):
-				p = self.m_lines[ii].scaledBy(factor)
-				retLines.append(p)
-			ret = Matrix(retLines)
-			return ret
+			return Matrix(self.m_array * other)
 		if isinstance(other, Point):
-			vector = other
-			ret = Point()
-			for ii in range(numLines):
-				theSum = self.m_lines[ii] * vector
-				ret[ii] = theSum
-			return ret
+			(x, y, z) = (other.m_x, other.m_y, other.m_z)
+			# plain floats are faster than numpy for a single point
+			return Point(*[line[0] * x + line[1] * y + line[2] * z for line in self.m_array.tolist()])
+		if isinstance(other, PointArray):
+			return self.applyMany(other)
 		if isinstance(other, Matrix):
-			matrix = other
-			retLines = []
-			for ii in range(numLines):
-				p = Point()
-				line = self.m_lines[ii]
-				for jj in range(matrix.numColumns()):
-					p[jj] = line * matrix.column(jj)
-				retLines.append(p)
-			ret = Matrix(retLines)
-			return ret
+			return Matrix(self.m_array @ other.asSquareArray())
 
 
-	def __add__(self, other) -> Matrix:
-		numLines = self.numLines()
-		retLines = []
-		for ii in range(numLines):
-			p = self.m_lines[ii] + other.m_lines[ii]
-			retLines.append(p)
-		ret = Matrix(retLines)
+	def applyMany(self, points):
+		"""
+			Return all points multiplied by me, in one matrix product.
+			points may be a PointArray (returns a PointArray) or a list of Points (returns a list of Points)
+		"""
+		if isinstance(points, PointArray):
+			return PointArray(points.m_array @ self.asSquareArray().T)
+		return self.applyMany(PointArray.fromPoints(points)).asPoints()
+
+
+	def asSquareArray(self):
+		"""
+			Return my array as 3 x 3 (missing lines are 0)
+		"""
+		if len(self.m_array) == 3:
+			return self.m_array
+		ret = np.zeros((3, 3))
+		ret[:len(self.m_array)] = self.m_array
 		return ret
 
 
+	def __add__(self, other) -> Matrix:
+		return Matrix(self.m_array + other.m_array)
+
+
 	def __sub__(self, other) -> Matrix:
 		return self + (other*-1)
 
@@ -275,10 +269,7 @@ class Matrix(ZGeomItem):
 
 
 	def column(self, idx) -> Point:
-		ret = Point()
-		for ii in range(self.numLines()):
-			ret[ii] = self.m_lines[ii][idx]
-		return ret
+		return Point(*self.m_array[:, idx].tolist())
 
 
 	def checkResult(self, target, solution) -> bool:
@@ -311,18 +302,13 @@ class Matrix(ZGeomItem):
 
 
 	def inverted(self) -> Matrix:
-		l = self.m_lines[0]
-		m00 = l[0]
-		m10 = l[1]
-		m20 = l[2]
-		l = self.m_lines[1]
-		m01 = l[0]
-		m11 = l[1]
-		m21 = l[2]
-		l = self.m_lines[2]
-		m02 = l[0]
-		m12 = l[1]
-		m22 = l[2]
+		"""
+			Return my inverse (analytic formula), or my transposed, if I am orthogonal.
+			Return None, if I am not invertible
+		"""
+		if self.isOrthogonal(Matrix.s_orthogonalTolerance):
+			return self.transposed()
+		(m00, m10, m20), (m01, m11, m21), (m02, m12, m22) = self.m_array.tolist()
 		det = m00*m11*m22 + m01*m12*m20 + m02*m10*m21 - m00*m12*m21 - m01*m10*m22 - m02*m11*m20
 		if det == 0:
 			print('matrix is not invertible')
@@ -330,41 +316,43 @@ class Matrix(ZGeomItem):
 		i11 = (m11*m22 - m12*m21) / det
 		i12 = (m12*m20 - m10*m22) / det
 		i13 = (m10*m21 - m11*m20) / det
-		p1 = Point(i11, i12, i13)
 
 		i21 = (m02*m21 - m01*m22) / det
 		i22 = (m00*m22 - m02*m20) / det
 		i23 = (m01*m20 - m00*m21) / det
-		p2 = Point(i21, i22, i23)
 
 		i31 = (m01*m12 - m02*m11) / det
 		i32 = (m02*m10 - m00*m12) / det
 		i33 = (m00*m11 - m01*m10) / det
-		p3 = Point(i31, i32, i33)
 
-		inverse = Matrix([p1, p2, p3])
+		inverse = Matrix(np.array([[i11, i12, i13], [i21, i22, i23], [i31, i32, i33]]))
+		inverse.m_determinant = 1.0 / det
+		self.m_determinant = det
 		return inverse
 
 
 	def transposed(self) -> Matrix:
-		lines = []
-		for ii in range(self.numColumns()):
-			lines.append(self.column(ii))
-		return Matrix(lines)
+		return Matrix(self.asSquareArray().T.copy())
 
 
-	def isOrthogonal(self) -> bool:
+	def isOrthonormal(self) -> bool:
 		'''
 			wrong name for isOrthogonal()
 		'''
 		raise Exception('please use isOrthogonal() instead')
 	
 
-	def isOrthogonal(self) -> bool:
+	def isOrthogonal(self, tolerance=None) -> bool:
 		'''
-			check if my tramsposed is my inverse
+			check if my tramsposed is my inverse.
+			If tolerance is given, no entry of me * transposed may differ more from the identity
 		'''
-		return (self * self.transposed()).isSameAs(Matrix())
+		if tolerance is None:
+			return (self * self.transposed()).isSameAs(Matrix())
+		array = self.m_array
+		if len(array) != 3:
+			return False
+		return bool(np.abs(array @ array.T - np.eye(3)).max() < tolerance)
 
 
 	def getEulerAngles(self) -> list:
@@ -373,18 +361,7 @@ class Matrix(ZGeomItem):
 			for x-rotation, then y-rotation, then z-rotation
 			see https://www.geometrictools.com/Documentation/EulerAngles.pdf
 		"""
-		p0 = self.m_lines[0]
-		r00 = p0.m_x
-		r01 = p0.m_y		# not used ??
-		r02 = p0.m_z		# not used ??
-		p1 = self.m_lines[1]
-		r10 = p1.m_x
-		r11 = p1.m_y
-		r12 = p1.m_z
-		p2 = self.m_lines[2]
-		r20 = p2.m_x
-		r21 = p2.m_y
-		r22 = p2.m_z
+		(r00, _, _), (r10, r11, r12), (r20, r21, r22) = self.m_array.tolist()
 		
 		if r20 < 0.9999:
 			if r20 > -0.9999:
@@ -413,11 +390,13 @@ class Affine(ZGeomItem):
 	"""
 		Represents an affine transformation (a matrix and a shift)
 	"""
+
 	def __init__(self, matrix=None, point=Point()):
 		if matrix is None:
 			matrix = Matrix()
 		self.m_matrix = matrix
 		self.m_shift = point
+		self.m_inverse = None		# cache of inverted(): Affines are not changed after creation
 
 
 	@classmethod
@@ -594,6 +573,17 @@ class Affine(ZGeomItem):
 		return self.m_matrix * point + self.m_shift
 
 
+	def applyMany(self, points):
+		"""
+			Return all points transformed by me, in one matrix product.
+			points may be a PointArray (returns a PointArray) or a list of Points (returns a list of Points)
+		"""
+		if isinstance(points, PointArray):
+			shift = self.m_shift
+			return PointArray(points.m_array @ self.m_matrix.asSquareArray().T + np.array([shift.m_x, shift.m_y, shift.m_z]))
+		return self.applyMany(PointArray.fromPoints(points)).asPoints()
+
+
 	def applyLine(self, line) -> Line:
 		return Line(self * line.m_p1, self * line.m_p2)
 
@@ -632,14 +622,22 @@ class Affine(ZGeomItem):
 
 
 	def inverted(self) -> Affine:
-		inv = self.m_matrix.inverted()
-		point = - (inv * self.m_shift)
-		return Affine(inv, point)
+		"""
+			Return my inverse. It is computed only once, and knows me as its inverse
+		"""
+		if self.m_inverse is None:
+			inv = self.m_matrix.inverted()
+			point = - (inv * self.m_shift)
+			self.m_inverse = Affine(inv, point)
+			self.m_inverse.m_inverse = self
+		return self.m_inverse
 
 
 	def __mul__(self, other):
 		if isinstance(other, Point):
 			return self.apply(other)
+		if isinstance(other, PointArray):
+			return self.applyMany(other)
 		if isinstance(other, Line):
 			return self.applyLine(other)
 		if isinstance(other, Plane):
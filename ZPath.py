@@ -1,6 +1,8 @@
 """
 	Contains 
 	- ZPath, a 2d or 3d path (composed from svg-like segments)
+	- ZPathBvh, a bounding volume hierarchy over the segments of a ZPath
+	- ZCncFitter, approximates a stream of points by lines and circle arcs
 	- ZPathSegment
 	- ZLineSegment
 	- ZBezier2Segment
@@ -12,10 +14,12 @@
 from __future__ import annotations
 #from abc import abstractclassmethod
 import math
+import heapq
 #from scipy.optimize import newton
 import xml.etree.ElementTree as ET
+import numpy as np
 
-from zutils.ZGeom import Point, Polygon, Line, Circle2, Ellipse3, ZGeomItem, Plane, Cube
+from zutils.ZGeom import Point, PointArray, Polygon, Line, Circle2, Ellipse3, ZGeomItem, Plane, Cube
 from zutils.ZMatrix import Matrix, Affine
 #from zutils.ZGeomHelper import vectorAngle2		#, calculateArcEllipse
 #from zutils.shame import searchForEllipseCenter
@@ -29,6 +33,8 @@ class ZPathSegment:
 	"""
 		Abstract superclass of segments, handles general tasks
 	"""
+	s_controlPointNames = None		# the point members that define me completely (None: transformBy() must be used)
+
 	def __init__(self, start, stop):
 		start.checkIsLegal()	# is it defined?
 		stop.checkIsLegal()
@@ -68,6 +74,37 @@ class ZPathSegment:
 		#return Cube(Min, Max)
 
 
+	def getTightBoundingBox(self):
+		'''
+			return the smallest cube that contains me. Overridden by curved subclasses
+		'''
+		return self.getSimpleBoundingBox()
+
+
+	def boundingBoxForParams(self, ts):
+		'''
+			return the cube containing my points for the params ts and my start and stop
+		'''
+		ts = np.append(np.asarray(ts, dtype=np.float64), [0.0, 1.0])
+		points = self.pointsAtParams(ts[(ts >= 0) & (ts <= 1)])
+		return Cube(points.min(), points.max())
+
+
+	def polynomialExtremaParams(self):
+		'''
+			return the params, where one of my coordinates has a local extremum
+		'''
+		coeffs = self.bernsteinArray()
+		degree = len(coeffs) - 1
+		derivs = coeffs[:-1] * np.arange(degree, 0, -1)[:, np.newaxis]
+		ret = []
+		for ii in range(3):
+			if np.any(derivs[:, ii]):
+				roots = np.roots(derivs[:, ii])
+				ret.extend(roots[np.abs(roots.imag) < 1e-9].real)
+		return ret
+
+
 	def setStandardNormal(self):
 		tangent = self.tangentAtParam(0)
 		second = self.secondDerivativeAtParam(0)
@@ -118,41 +155,153 @@ class ZPathSegment:
 		return val
 
 
+	def deepCopy(self):
+		"""
+			Return a copy of me, that does not share points with me. Overridden by subclasses whose copy() shares points
+		"""
+		return self.copy()
+
+
+	@classmethod
+	def paramsForStep(cls, paramStep, addLast=True):
+		"""
+			Return a numpy array of the params 0, paramStep, 2*paramStep ... <= 1.
+			If addLast, 1 is added (if not yet contained)
+		"""
+		num = int(math.floor(1.0 / paramStep + 1e-9)) + 1
+		ts = np.arange(num) * paramStep
+		if addLast and ts[-1] < 1 - ZGeomItem.s_wantedAccuracy:
+			ts = np.append(ts, 1.0)
+		return ts
+
+
+	def bernsteinArray(self):
+		"""
+			Return my m_bernsteinPoints as numpy array of shape (degree + 1, 3), highest power first
+		"""
+		return np.array([[p.m_x, p.m_y, p.m_z] for p in self.m_bernsteinPoints], dtype=np.float64)
+
+
+	def polynomialAtParams(self, ts, derivative=0) -> PointArray:
+		"""
+			Evaluate my polynomial (see m_bernsteinPoints) or one of its derivatives for all params in ts (Horner scheme)
+		"""
+		ts = np.asarray(ts, dtype=np.float64)
+		coeffs = self.bernsteinArray()
+		for _ in range(derivative):
+			degree = len(coeffs) - 1
+			if degree == 0:
+				coeffs = np.zeros((1, 3))
+				break
+			coeffs = coeffs[:-1] * np.arange(degree, 0, -1)[:, np.newaxis]
+		ret = np.zeros((len(ts), 3)) + coeffs[0]
+		for coeff in coeffs[1:]:
+			ret = ret * ts[:, np.newaxis] + coeff
+		return PointArray(ret)
+
+
+	def pointsAtParams(self, ts) -> PointArray:
+		"""
+			Vectorised pointAtParam(): return a PointArray with my points at all params in ts
+		"""
+		return self.polynomialAtParams(ts, 0)
+
+
+	def tangentsAtParams(self, ts) -> PointArray:
+		"""
+			Vectorised tangentAtParam()
+		"""
+		return self.polynomialAtParams(ts, 1)
+
+
+	def secondDerivativesAtParams(self, ts) -> PointArray:
+		"""
+			Vectorised secondDerivativeAtParam()
+		"""
+		return self.polynomialAtParams(ts, 2)
+
+
 	def getAllInterPoints(self, paramStep, addLast=True):
 		"""
 			return list of all points with this parameter step
 		"""
-		#print('--------------------------------------------------------------')
-		points = []
-		#print('in getAllInterPoints')
-		param = 0
-		while param <= 1:
-			points.append(self.pointAtParam(param))
-			param += paramStep
-		if addLast and (param < 1 - ZGeomItem.s_wantedAccuracy):
-			points.append(self.pointAtParam(1))
-		return points
+		ts = self.paramsForStep(paramStep, addLast)
+		return self.pointsAtParams(ts).asPoints()
 
 
+	def adaptiveStartCount(self):
+		"""
+			Return the number of intervals, that adaptiveParams() starts with (must be enough to not miss turning points)
+		"""
+		return 4
+
+
+	def adaptiveParams(self, tolerance, minStep=1e-6):
+		"""
+			Return a sorted numpy array of params, so that the polygon through their points deviates from me by
+			less than tolerance (chord deviation, checked at the interval middles). Intervals are split as long as needed.
+		"""
+		return self.adaptiveParamsAndPoints(tolerance, minStep)[0]
+
+
+	def adaptiveParamsAndPoints(self, tolerance, minStep=1e-6):
+		"""
+			Return [params, points] (numpy arrays of shape (n,) and (n, 3)): the params of adaptiveParams() and
+			the points at them, that were evaluated anyway
+		"""
+		if tolerance <= 0:
+			raise Exception('adaptiveParams(): tolerance must be > 0')
+		ts = np.linspace(0.0, 1.0, self.adaptiveStartCount() + 1)
+		points = self.pointsAtParams(ts).m_array
+		toCheck = np.ones(len(ts) - 1, dtype=bool)
+		while np.any(toCheck):
+			idx = np.nonzero(toCheck)[0]
+			mids = (ts[idx] + ts[idx + 1]) * 0.5
+			midPoints = self.pointsAtParams(mids).m_array
+			deviations = self.distancesToChords(midPoints, points[idx], points[idx + 1])
+			split = (deviations > tolerance) & (ts[idx + 1] - ts[idx] > minStep)
+			if not np.any(split):
+				break
+			insertAt = idx[split] + 1
+			ts = np.insert(ts, insertAt, mids[split])
+			points = np.insert(points, insertAt, midPoints[split], axis=0)
+			# only the two halves of split intervals must be checked again
+			toCheck = np.zeros(len(ts) - 1, dtype=bool)
+			newIdx = insertAt + np.arange(len(insertAt))
+			toCheck[newIdx - 1] = True
+			toCheck[newIdx] = True
+		return [ts, points]
+
+
+	@classmethod
+	def distancesToChords(cls, points, starts, stops):
+		"""
+			points, starts, stops are numpy arrays (n, 3). Return the distances of points[i] to the line segment starts[i], stops[i]
+		"""
+		chords = stops - starts
+		lengthsSquared = np.einsum('ij,ij->i', chords, chords)
+		rel = np.einsum('ij,ij->i', points - starts, chords)
+		factors = np.clip(np.divide(rel, lengthsSquared, out=np.zeros_like(rel), where=lengthsSquared > 0), 0, 1)
+		nearest = starts + chords * factors[:, np.newaxis]
+		return np.linalg.norm(points - nearest, axis=1)
+
+
+	def getAdaptiveInterPoints(self, tolerance):
+		"""
+			Return a list of points approximating me with the given tolerance (see adaptiveParams())
+		"""
+		return PointArray(self.adaptiveParamsAndPoints(tolerance)[1]).asPoints()
+
 
 	def getAllInterPointsWithTangent(self, paramStep, addLast=True):
 		"""
 			get interpoints and tangents
 			Return array of tuples (each one contains point and derivative)
 		"""
-		#print('--------------------------------------------------------------')
-		ret = []
-		param = 0
-		#print('in getAllInterPointsWithTangent')
-		while param <= 1:
-			point = self.pointAtParam(param)
-			tangent = self.tangentAtParam(param)
-			ret.append((point, tangent))
-			param += paramStep
-		if addLast and (param < 1 - ZGeomItem.s_wantedAccuracy):
-			ret.append((self.pointAtParam(1), self.tangentAtParam(1)))
-
-		return ret
+		ts = self.paramsForStep(paramStep, addLast)
+		points = self.pointsAtParams(ts).asPoints()
+		tangents = self.tangentsAtParams(ts).asPoints()
+		return list(zip(points, tangents))
 	
 	def getOscilatingCircleAtParam(self, param):
 			point = self.pointAtParam(param)
@@ -275,11 +424,50 @@ class ZPathSegment:
 
 	def findNearestPoint(self, point):
 		"""
-			Reteurn an arrray of points, that are nearest to point
+			Return a list [segment, point, segParameter, distance] for my point that is nearest to point.
+			Uses the analytic projection of my subclass, if there is one. Else the scan of findMinimalPoint() is used
 		"""
-		myLambda = lambda p: p.distanceOfPoint(point)
-		testArr = self.findMinimalPoint(myLambda)
-		return testArr
+		ts = self.nearestParamCandidates(point)
+		if ts is None:
+			myLambda = lambda p: p.distanceOfPoint(point)
+			return self.findMinimalPoint(myLambda)
+		return self.bestOfParams(point, ts)
+
+
+	def nearestParamCandidates(self, point):
+		"""
+			Return a list of params, where the distance to point may be minimal (my start and stop need not be contained).
+			None means: I have no analytic projection. Overridden by subclasses
+		"""
+		return None
+
+
+	def bestOfParams(self, point, ts):
+		"""
+			Return [self, point, param, distance] for the param of ts (or 0 or 1) that is nearest to point
+		"""
+		ts = np.clip(np.append(np.asarray(ts, dtype=np.float64), [0.0, 1.0]), 0.0, 1.0)
+		dists = (self.pointsAtParams(ts) - point).lengths()
+		idx = int(np.argmin(dists))
+		t = float(ts[idx])
+		return [self, self.pointAtParam(t), t, float(dists[idx])]
+
+
+	def polynomialNearestParams(self, point):
+		"""
+			Return the params, where the derivative of the squared distance of point to my polynomial vanishes.
+			These are the real parts of the roots of (P(t) - point) * P'(t), complex roots only cost an evaluation
+		"""
+		coeffs = self.bernsteinArray()
+		coeffs[-1] -= PointArray.asNumpy(point)
+		degree = len(coeffs) - 1
+		derivs = coeffs[:-1] * np.arange(degree, 0, -1)[:, np.newaxis]
+		poly = np.polymul(coeffs[:, 0], derivs[:, 0])
+		for ii in range(1, 3):
+			poly = np.polyadd(poly, np.polymul(coeffs[:, ii], derivs[:, ii]))
+		if not np.any(poly):
+			return []
+		return np.roots(poly).real
 
 
 	#def findZeroParameter(self, func):
@@ -333,11 +521,15 @@ class ZPathSegment:
 		self.xmlAddDetailsTo(node)
 
 
-	def asPolygon(self, numPoints):
+	def asPolygon(self, numPoints=None, tolerance=None):
 		"""
-			Return an array of Line segments that approximate myself. No precision given
+			Return an array of Line segments that approximate myself. Either numPoints lines, or as few as possible
+			lines with the given tolerance
 		"""
-		ps = self.getAllInterPoints(1 / numPoints)
+		if tolerance is not None:
+			ps = self.getAdaptiveInterPoints(tolerance)
+		else:
+			ps = self.getAllInterPoints(1 / numPoints)
 		ret = ZPath()
 		lastPoint = None
 
@@ -356,54 +548,21 @@ class ZPathSegment:
 		"""
 		if tolerance == 0:
 			raise Exception('cncFriendly(): tolerance 0 is not possible')
-		numPoints = 1000
-		ps = self.getAllInterPointsAndDerivs(1 / numPoints)
-		ret = []
-		segPoints = []
-		isInLine = False
+		fitter = ZCncFitter(tolerance)
+		for point in self.iterCncSamples(tolerance):
+			fitter.addPoint(point)
+		return fitter.finish()
 
-		for (p1, tangent, circle) in ps:
-			segPoints.append(p1)
-			segLen = len(segPoints)
-			if segLen < 3:
-				continue
-			if segLen == 3:
-				currentCircle = Circle2.circleFromThreePoints(segPoints[0], segPoints[1], segPoints[2])
-				if currentCircle is None:
-					isInLine = True
-				continue
 
-			# ok, we have more than 3 points
-			if isInLine:
-				if ZPathSegment.isStillInLine(segPoints, tolerance):
-					continue
-				segPoints.pop()
-				ZPathSegment.addOneLine(ret, segPoints)
-				last = segPoints.pop()
-				segPoints = []
-				segPoints.append(last)
-				segPoints.append(p1)
-				isInLine = False
-			else:
-				newCircle = ZPathSegment.isAcceptableCncTolerance(segPoints, currentCircle, tolerance)
-				if newCircle is not None:
-					currentCircle = newCircle
-				else:
-					# we need a new segment, first finish the current
-					segPoints.pop()
-					ZPathSegment.addOneCncSegment(ret, segPoints, currentCircle)
-					last = segPoints.pop()			
-					segPoints = []
-					segPoints.append(last)
-					segPoints.append(p1)
-
-		#print('one segment done')
-		if len(segPoints) > 1:
-			if isInLine:
-				ZPathSegment.addOneLine(ret, segPoints)
-			else:
-				self.addOneCncSegment(ret, segPoints, currentCircle)
-		return ret
+	def iterCncSamples(self, tolerance, chunkSize=256):
+		"""
+			Yield the points used by cncFriendly(). They come from adaptive flattening with a fraction of the tolerance,
+			which evaluates each of them once. Only the Point objects are made lazily, in chunks
+		"""
+		points = self.adaptiveParamsAndPoints(tolerance * 0.25)[1]
+		for ii in range(0, len(points), chunkSize):
+			for point in PointArray(points[ii:ii + chunkSize]).asPoints():
+				yield point
 	
 
 	# def cncFriendlyObsolete(self, tolerance):
@@ -494,6 +653,7 @@ class ZPathSegment:
 		segList.append(ZLineSegment(segPoints[0], segPoints[-1]))
 
 
+	# no longer used by cncFriendly(), see ZCncFitter
 	@classmethod
 	def isAcceptableCncTolerance(cls, points, currentCircle, tolerance, step=1):
 		minRad = 1000000000
@@ -549,6 +709,7 @@ class ZLineSegment(ZPathSegment):
 	"""
 		A line between 2 points
 	"""
+	s_controlPointNames = ('m_start', 'm_stop')
 
 	def __init__(self, p1, p2):
 		super().__init__(p1, p2)
@@ -557,6 +718,7 @@ class ZLineSegment(ZPathSegment):
 
 
 	def recalculateGeometry(self):
+		self.m_bernsteinPoints = []
 		self.m_bernsteinPoints.append(self.m_stop - self.m_start)
 		self.m_bernsteinPoints.append(self.m_start)
 		self.setStandardNormal()
@@ -567,15 +729,24 @@ class ZLineSegment(ZPathSegment):
 		return ZLineSegment(self.m_start, self.m_stop)
 
 
+	def deepCopy(self):
+		return ZLineSegment(self.m_start.copy(), self.m_stop.copy())
+
+
 	def transformBy(self, affine):
 		self.m_start = affine * self.m_start
 		self.m_stop = affine * self.m_stop
+		self.recalculateGeometry()
 
 
 	def getAllInterPoints(self, _):
 		return [self.m_start, self.m_stop]
 
 
+	def adaptiveParamsAndPoints(self, _tolerance, minStep=1e-6):
+		return [np.array([0.0, 1.0]), PointArray.fromPoints([self.m_start, self.m_stop]).m_array]
+
+
 	def getAllInterPointsWithTangent(self, _):
 		tang = self.m_stop - self.m_start
 		m1 = (self.m_start, -tang)
@@ -650,6 +821,18 @@ class ZLineSegment(ZPathSegment):
 		"""
 		return self.m_stop - self.m_start
 
+
+	def nearestParamCandidates(self, point):
+		"""
+			Orthogonal projection onto my line
+		"""
+		direction = self.m_bernsteinPoints[0]
+		lengthSquared = direction.lengthSquared()
+		if lengthSquared == 0:
+			return []
+		return [(point - self.m_start) * direction / lengthSquared]
+
+
 	def asNurbsDescription(self) -> list[Point]:
 		"""
 			Return a list of control points that make a nurbs description of me
@@ -666,6 +849,7 @@ class ZBezier3Segment(ZPathSegment):
 	"""
 		a cubic bezier segment
 	"""
+	s_controlPointNames = ('m_start', 'm_handleStart', 'm_handleStop', 'm_stop')
 	#s_bernsteinFunctions = {}
 	#s_bernsteinDerivationsOne = {}
 
@@ -740,6 +924,13 @@ class ZBezier3Segment(ZPathSegment):
 		# return Cube(Min, Max)
 
 
+	def getTightBoundingBox(self):
+		'''
+			return the smallest cube containing me (uses the extrema of my coordinates)
+		'''
+		return self.boundingBoxForParams(self.polynomialExtremaParams())
+
+
 	@classmethod
 	def makeTwoPointsConnection(cls, start: Point, tangentStart: Point, stop: Point, tangentStop: Point, stiffnessStart:float=0.5, stiffnessStop:float= 0.5) ->ZBezier3Segment:
 		if stiffnessStart > 0.9 > stiffnessStop > 0.9:
@@ -798,6 +989,10 @@ class ZBezier3Segment(ZPathSegment):
 		return a[0].scaledBy(6*t) + a[1].scaledBy(2)
 	
 
+	def nearestParamCandidates(self, point):
+		return self.polynomialNearestParams(point)
+
+
 	def getOsculatingNormal(self, tangent, second):
 		'''
 			I must return the normal of the osculation point. Is only called for segments that use several planes or have a turning point
@@ -825,6 +1020,10 @@ class ZBezier3Segment(ZPathSegment):
 		return ZBezier3Segment(self.m_start, self.m_stop, self.m_handleStart, self.m_handleStop)
 
 
+	def deepCopy(self):
+		return ZBezier3Segment(self.m_start.copy(), self.m_stop.copy(), self.m_handleStart.copy(), self.m_handleStop.copy())
+
+
 	def transformBy(self, affine):
 		"""
 			Transform myself. Return nothing
@@ -863,6 +1062,8 @@ class ZBezier2Segment(ZPathSegment):
 	"""
 		a quadratic bezier segment
 	"""
+	s_controlPointNames = ('m_start', 'm_handle', 'm_stop')
+
 	def __init__(self, p1, p2, handle):
 		super().__init__(p1, p2)
 		self.m_handle = handle
@@ -900,6 +1101,13 @@ class ZBezier2Segment(ZPathSegment):
 		# return Cube(Min, Max)
 
 
+	def getTightBoundingBox(self):
+		'''
+			return the smallest cube containing me (uses the extrema of my coordinates)
+		'''
+		return self.boundingBoxForParams(self.polynomialExtremaParams())
+
+
 	def reverse(self):
 		p1 = self.m_start
 		p2 = self.m_stop
@@ -951,6 +1159,10 @@ class ZBezier2Segment(ZPathSegment):
 		return self.m_bernsteinPoints[0].scaledBy(2)
 
 
+	def nearestParamCandidates(self, point):
+		return self.polynomialNearestParams(point)
+
+
 	def interpolate(self, p1, p2, t):
 		diff = (p2 - p1).scaledBy(t)
 		return p1 + diff
@@ -961,6 +1173,10 @@ class ZBezier2Segment(ZPathSegment):
 		return ZBezier2Segment(self.m_start, self.m_stop, self.m_handle)
 
 
+	def deepCopy(self):
+		return ZBezier2Segment(self.m_start.copy(), self.m_stop.copy(), self.m_handle.copy())
+
+
 	def transformBy(self, affine):
 		"""
 			Transform myself. Return nothing
@@ -1092,6 +1308,22 @@ class ZArcSegment(ZPathSegment):
 				self.m_ellipse.m_vert1, self.m_ellipse.m_vert2])
 
 
+	def getTightBoundingBox(self):
+		'''
+			return the smallest cube containing me. Coordinate i has its extrema at the angles atan2(diam2[i], diam1[i]) (+180)
+		'''
+		d1 = self.m_ellipse.m_diam1
+		d2 = self.m_ellipse.m_diam2
+		ts = []
+		for ii in range(3):
+			if d1[ii] == 0 and d2[ii] == 0:
+				continue
+			angle = math.degrees(math.atan2(d2[ii], d1[ii]))
+			ts.append(self.paramForAngle(angle))
+			ts.append(self.paramForAngle(angle + 180))
+		return self.boundingBoxForParams(ts)
+
+
 	def containsPoint(self, point):
 		return self.m_ellipse.containsPoint(point)
 	
@@ -1299,10 +1531,102 @@ class ZArcSegment(ZPathSegment):
 		return ret.scaledBy(self.m_deltaAngle*self.m_deltaAngle)
 	
 
+	def anglesForParams(self, ts):
+		"""
+			Vectorised angleForParam(), returns radians
+		"""
+		ts = np.asarray(ts, dtype=np.float64)
+		if len(ts) > 0 and np.max(np.abs(ts)) > 1:
+			raise Exception(f'ZArcSegment: suspicious param used {ts[np.argmax(np.abs(ts))]}')
+		return np.radians(self.m_startAngle + self.m_deltaAngle * ts)
+
+
+	def ellipseCombinations(self, cosFactors, sinFactors, shift=None) -> PointArray:
+		"""
+			Return the PointArray of cosFactors * diam1 + sinFactors * diam2 (+ shift)
+		"""
+		d1 = PointArray.asNumpy(self.m_ellipse.m_diam1)
+		d2 = PointArray.asNumpy(self.m_ellipse.m_diam2)
+		ret = cosFactors[:, np.newaxis] * d1 + sinFactors[:, np.newaxis] * d2
+		if shift is not None:
+			ret += PointArray.asNumpy(shift)
+		return PointArray(ret)
+
+
+	def pointsAtParams(self, ts) -> PointArray:
+		angles = self.anglesForParams(ts)
+		return self.ellipseCombinations(np.cos(angles), np.sin(angles), self.m_ellipse.m_center)
+
+
+	def tangentsAtParams(self, ts) -> PointArray:
+		angles = self.anglesForParams(ts)
+		delta = self.m_deltaAngle
+		return self.ellipseCombinations(-np.sin(angles) * delta, np.cos(angles) * delta)
+
+
+	def secondDerivativesAtParams(self, ts) -> PointArray:
+		angles = self.anglesForParams(ts)
+		delta2 = self.m_deltaAngle * self.m_deltaAngle
+		return self.ellipseCombinations(-np.cos(angles) * delta2, -np.sin(angles) * delta2)
+
+
 	def pointAtAngle(self, angle):
 		return self.m_ellipse.pointForAngle(angle)
 
 
+	def adaptiveStartCount(self):
+		"""
+			One interval per 45 degrees, at least 4
+		"""
+		return max(4, int(math.ceil(abs(self.m_deltaAngle) / 45.0)))
+
+
+	def paramForAngle(self, degrees):
+		"""
+			Return the param for a point of my ellipse with the given angle (may be > 1, if the angle is not on me)
+		"""
+		if ZGeomItem.almostZero(self.m_deltaAngle):
+			return 0
+		if self.m_deltaAngle > 0:
+			rel = (degrees - self.m_startAngle) % 360
+		else:
+			rel = (self.m_startAngle - degrees) % 360
+		return rel / abs(self.m_deltaAngle)
+
+
+	def nearestParamCandidates(self, point):
+		"""
+			Project point onto my ellipse: start with the angle of point (exact for circles), and refine by Newton iteration
+			on (P(angle) - point) * P'(angle). Ellipses are additionally started from the 3 other quadrants
+		"""
+		d1 = PointArray.asNumpy(self.m_ellipse.m_diam1)
+		d2 = PointArray.asNumpy(self.m_ellipse.m_diam2)
+		v = PointArray.asNumpy(point - self.m_ellipse.m_center)
+		start = math.atan2(v.dot(d2) / d2.dot(d2), v.dot(d1) / d1.dot(d1))
+		starts = [start]
+		if not self.m_ellipse.isCircle():
+			starts.extend([start + ii * math.pi * 0.5 for ii in range(1, 4)])
+		ret = []
+		for angle in starts:
+			for _ in range(20):
+				cos = math.cos(angle)
+				sin = math.sin(angle)
+				diff = d1 * cos + d2 * sin - v
+				tangent = d2 * cos - d1 * sin
+				func = diff.dot(tangent)
+				deriv = tangent.dot(tangent) - diff.dot(d1 * cos + d2 * sin)
+				if deriv == 0:
+					break
+				step = func / deriv
+				angle -= step
+				if abs(step) < 1e-12:
+					break
+			t = self.paramForAngle(math.degrees(angle))
+			if t <= 1:
+				ret.append(t)
+		return ret
+
+
 	def getBiggerRadius(self):
 		'''
 			return the greater one of my radii
@@ -1501,9 +1825,12 @@ class ZPath:
 	"""
 		The path class, holding a list of segments
 	"""
+
 	def __init__(self, groupId=None):
 		self.m_segments = None
 		self.m_groupId = groupId
+		self.m_useBvh = False
+		self.m_bvh = None
 
 
 	@classmethod
@@ -1520,12 +1847,41 @@ class ZPath:
 
 	def setSegments(self, segs):
 		self.m_segments = segs
+		self.invalidateBvh()
 
 
 	def addSegment(self, segment):
 		if self.m_segments is None:
 			self.m_segments = []
 		self.m_segments.append(segment)
+		self.invalidateBvh()
+
+
+	def useBvh(self, flag=True):
+		"""
+			Let my spatial queries (findNearestPoint, containsPoint ...) use a ZPathBvh to skip segments.
+			Makes sense for paths with many segments. The hierarchy is built lazily
+		"""
+		self.m_useBvh = flag
+		self.invalidateBvh()
+
+
+	def invalidateBvh(self):
+		"""
+			Must be called, if my segments were changed from outside
+		"""
+		self.m_bvh = None
+
+
+	def getBvh(self):
+		"""
+			Return my ZPathBvh, or None if I do not use one
+		"""
+		if not self.m_useBvh or not self.m_segments:
+			return None
+		if self.m_bvh is None:
+			self.m_bvh = ZPathBvh(self.m_segments)
+		return self.m_bvh
 
 
 	def describesAnEllipse(self):
@@ -1554,6 +1910,7 @@ class ZPath:
 
 	def prependSegment(self, segment):
 		self.m_segments.insert(0, segment)
+		self.invalidateBvh()
 		
 
 	def areSegsConnected(self):
@@ -1584,6 +1941,7 @@ class ZPath:
 		self.m_segments.reverse()
 		for seg in self.m_segments:
 			seg.reverse()
+		self.invalidateBvh()
 
 
 	def reversed(self):
@@ -1620,9 +1978,45 @@ class ZPath:
 		"""
 			Return a list of [points with given parameter step width
 		"""
+		return self.joinSegmentPoints([seg.getAllInterPoints(paramStep) for seg in self.m_segments])
+
+
+	def getAdaptiveInterPoints(self, tolerance):
+		"""
+			Return a list of points that approximates me with the given tolerance (as few points as possible)
+		"""
+		return self.joinSegmentPoints([seg.getAdaptiveInterPoints(tolerance) for seg in self.m_segments])
+
+
+	def adaptiveParams(self, tolerance, otherPath=None):
+		"""
+			Return a list of param arrays (one per segment) for an approximation with the given tolerance.
+			If otherPath is given (with the same number of segments), the params are good for both paths
+		"""
+		ret = []
+		for ii, seg in enumerate(self.m_segments):
+			ts = seg.adaptiveParams(tolerance)
+			if otherPath is not None:
+				ts = np.union1d(ts, otherPath.m_segments[ii].adaptiveParams(tolerance))
+			ret.append(ts)
+		return ret
+
+
+	def getPointsForParams(self, paramLists):
+		"""
+			Return a list of points for the param lists (one per segment, see adaptiveParams())
+		"""
+		segPoints = [seg.pointsAtParams(ts).asPoints() for (seg, ts) in zip(self.m_segments, paramLists)]
+		return self.joinSegmentPoints(segPoints)
+
+
+	@classmethod
+	def joinSegmentPoints(cls, segPoints):
+		"""
+			Join the point lists of my segments, the joints are contained only once
+		"""
 		points = []
-		for seg in self.m_segments:
-			newOnes = seg.getAllInterPoints(paramStep)
+		for newOnes in segPoints:
 			if len(points) > 0 and points[-1].isSameAs(newOnes[0]):
 				points.pop()
 			points.extend(newOnes)
@@ -1668,6 +2062,7 @@ class ZPath:
 			affine = Affine.makeMirror(lineOrPlane)
 		copy.transformBy(affine)
 		self.m_segments.extend(copy.m_segments)
+		self.invalidateBvh()
 
 
 	def closeByLine(self):
@@ -1676,15 +2071,26 @@ class ZPath:
 		lineStart = self.getStop()
 		lineStop = self.getStart()
 		line = ZLineSegment(lineStart, lineStop)
-		self.m_segments.append(line)
+		self.addSegment(line)
 
 
 	def transformBy(self, affine):
 		"""
-			Transform all my segments. Return nothing
-		"""
+			Transform all my segments. Return nothing.
+			The control points of all lines and beziers are transformed together in one matrix product
+		"""
+		batchSegs = [seg for seg in self.m_segments if seg.s_controlPointNames is not None]
+		points = [getattr(seg, name) for seg in batchSegs for name in seg.s_controlPointNames]
+		if points:
+			transformed = iter(affine.applyMany(PointArray.fromPoints(points)).asPoints())
+			for seg in batchSegs:
+				for name in seg.s_controlPointNames:
+					setattr(seg, name, next(transformed))
+				seg.recalculateGeometry()
 		for seg in self.m_segments:
-			seg.transformBy(affine)
+			if seg.s_controlPointNames is None:
+				seg.transformBy(affine)
+		self.invalidateBvh()
 
 
 	def transformedBy(self, affine):
@@ -1700,6 +2106,27 @@ class ZPath:
 		ret = ZPath(self.m_groupId)
 		newSegs = [x.copy() for x in self.m_segments]
 		ret.setSegments(newSegs)
+		ret.m_useBvh = self.m_useBvh
+		return ret
+
+
+	def deepCopy(self) -> ZPath:
+		"""
+			Return a copy of me, that shares no points with me.
+			Joints that are one Point object in me (e.g. stop of a segment and start of the next one) are one object in the copy, too
+		"""
+		newSegs = [x.deepCopy() for x in self.m_segments]
+		copies = dict()		# id of my joint point => its copy
+		for seg, newSeg in zip(self.m_segments, newSegs):
+			for attName in ['m_start', 'm_stop']:
+				point = getattr(seg, attName)
+				if id(point) in copies:
+					setattr(newSeg, attName, copies[id(point)])
+				else:
+					copies[id(point)] = getattr(newSeg, attName)
+		ret = ZPath(self.m_groupId)
+		ret.setSegments(newSegs)
+		ret.m_useBvh = self.m_useBvh
 		return ret
 
 
@@ -1751,6 +2178,7 @@ class ZPath:
 		"""
 		for seg in self.m_segments:
 			seg.makeFlat()
+		self.invalidateBvh()
 
 	
 	def printTabs(self, tabs):
@@ -1822,19 +2250,25 @@ class ZPath:
 				candidate = []
 			
 		self.m_segments = [x for x in self.m_segments if x not in toRemove]
+		self.invalidateBvh()
 		return ellipses
 
 
-	def findMinimalPoint(self, func):
+	def findMinimalPoint(self, func, boxLowerBound=None):
 		"""
 			Find a point p on me, so that func(p) has a minimal value.
 			func must return a number.
+			boxLowerBound(cube) may return a lower bound of func inside cube; if given (and I use a bvh), segments are skipped.
 			Returns a list: [segment, point, segParameter, value]
 		"""
+		segFunc = lambda seg: seg.findMinimalPoint(func)
+		bvh = self.getBvh()
+		if bvh is not None and boxLowerBound is not None:
+			return bvh.findMinimal(segFunc, boxLowerBound)
 		ret = []
 		minF = 1000000000
 		for seg in self.m_segments:
-			test = seg.findMinimalPoint(func)
+			test = segFunc(seg)
 			if test[-1] < minF:
 				minF = test[-1]
 				ret = test
@@ -1842,18 +2276,34 @@ class ZPath:
 
 
 	def findNearestPoint(self, point):
-		myLambda = lambda p: p.distanceOfPoint(point)
-		testArr = self.findMinimalPoint(myLambda)
-		return testArr
+		"""
+			Returns a list: [segment, point, segParameter, distance]
+		"""
+		bvh = self.getBvh()
+		if bvh is not None:
+			return bvh.findMinimal(lambda seg: seg.findNearestPoint(point), lambda cube: cube.distanceOfPoint(point))
+		ret = []
+		minDist = 1000000000
+		for seg in self.m_segments:
+			test = seg.findNearestPoint(point)
+			if test[-1] < minDist:
+				minDist = test[-1]
+				ret = test
+		return ret
 
 
-	def findAllPointsOnPath(self, func):
+	def findAllPointsOnPath(self, func, boxLowerBound=None):
 		"""
 			Return a list of points of me, where func(p) is 0 (func(p) must be >= 0)
+			boxLowerBound: see findMinimalPoint()
 			Returns a list of lists: [segment, point, segParameter, value]
 		"""
+		segs = self.m_segments
+		bvh = self.getBvh()
+		if bvh is not None and boxLowerBound is not None:
+			segs = bvh.segmentsBelow(boxLowerBound, ZGeomItem.s_wantedAccuracy)
 		ret = []
-		for seg in self.m_segments:
+		for seg in segs:
 			theList = seg.findMinimalPoint(func)
 			if ZGeomItem.almostZero(theList[3]):
 				ret.append(theList)
@@ -1886,13 +2336,13 @@ class ZPath:
 
 
 	# was formerly named cncFriendlySimple
-	def asPolygon(self, num):
+	def asPolygon(self, num=None, tolerance=None):
 		'''
-			return a polygon path for me, where every segment has num lines
+			return a polygon path for me, where every segment has num lines (or as few lines as needed for tolerance)
 		'''
 		ret = ZPath()
 		for seg in self.m_segments:
-			partPath = seg.asPolygon(num)
+			partPath = seg.asPolygon(num, tolerance)
 			for c in partPath.m_segments:
 				ret.addSegment(c)
 		return ret
@@ -1906,4 +2356,249 @@ class ZPath:
 		ret = []
 		for seg in self.m_segments:
 			ret.append(seg.asNurbsDescription())
-		return ret
\ No newline at end of file
+		return ret
+
+
+#########################################################
+#########################################################
+
+
+class ZPathBvh:
+	"""
+		A bounding volume hierarchy over path segments: a binary tree of cubes (tight bounding boxes).
+		Nodes are lists [cube, children, segments]; leaves have no children.
+		Lets the spatial queries of ZPath skip all segments whose cube cannot contain a better candidate
+	"""
+	s_leafSize = 4
+
+	def __init__(self, segments):
+		items = [(seg.getTightBoundingBox(), seg) for seg in segments]
+		self.m_root = self.buildNode(items)
+		self.m_order = {id(seg): idx for (idx, seg) in enumerate(segments)}
+
+
+	@classmethod
+	def buildNode(cls, items):
+		"""
+			items is a list of (cube, segment). Split at the median of the box centers along the longest axis
+		"""
+		cube = items[0][0]
+		for (other, _) in items[1:]:
+			cube = cube.combinedWith(other)
+		if len(items) <= cls.s_leafSize:
+			return [cube, [], [seg for (_, seg) in items]]
+		extent = cube.m_corner - cube.m_origin
+		axis = max(range(3), key=lambda ii: extent[ii])
+		items = sorted(items, key=lambda item: item[0].m_origin[axis] + item[0].m_corner[axis])
+		half = len(items) // 2
+		return [cube, [cls.buildNode(items[:half]), cls.buildNode(items[half:])], []]
+
+
+	def findMinimal(self, segFunc, boxLowerBound):
+		"""
+			Return the minimal result of segFunc(segment) (a list with the value as last entry), visiting the nodes
+			best first and stopping, when boxLowerBound(cube) cannot beat the best value
+		"""
+		ret = []
+		minF = 1000000000
+		counter = 0
+		heap = [(boxLowerBound(self.m_root[0]), counter, self.m_root)]
+		while heap:
+			(bound, _, node) = heapq.heappop(heap)
+			if bound >= minF:
+				break
+			for seg in node[2]:
+				test = segFunc(seg)
+				if test[-1] < minF:
+					minF = test[-1]
+					ret = test
+			for child in node[1]:
+				childBound = boxLowerBound(child[0])
+				if childBound < minF:
+					counter += 1
+					heapq.heappush(heap, (childBound, counter, child))
+		return ret
+
+
+	def segmentsBelow(self, boxLowerBound, limit):
+		"""
+			Return all segments in nodes, where boxLowerBound(cube) <= limit (in path order)
+		"""
+		ret = []
+		nodes = [self.m_root]
+		while nodes:
+			node = nodes.pop()
+			if boxLowerBound(node[0]) > limit:
+				continue
+			ret.extend(node[2])
+			nodes.extend(node[1])
+		ret.sort(key=lambda seg: self.m_order[id(seg)])
+		return ret
+
+
+#########################################################
+#########################################################
+
+
+class ZCncFitter:
+	"""
+		Approximates a stream of points (added by addPoint()) by line and circle arc segments (for cnc machines).
+		For the current arc, the minimal and maximal radius of its points is kept, so that a new point costs O(1)
+		as long as the current circle fits. Only if it does not, a new circle is tried (through first, middle and last point).
+		For the current line, the range of directions (in the xy plane, like the arcs) from its first point that keep all
+		inner points near enough is kept, so a new point costs O(1) as well (see isStillInLine())
+	"""
+	def __init__(self, tolerance):
+		self.m_tolerance = tolerance
+		self.m_segments = []
+		self.m_points = []
+		self.m_circle = None
+		self.m_minRad = 0
+		self.m_maxRad = 0
+		self.m_isInLine = False
+		self.m_lineRef = None		# angle, that m_lineMin and m_lineMax are relative to
+		self.m_lineMin = -math.pi
+		self.m_lineMax = math.pi
+		self.m_lineMaxDist = 0.0		# maximal distance of an inner point from the first one
+
+
+	def addPoint(self, point):
+		points = self.m_points
+		points.append(point)
+		num = len(points)
+		if num < 3:
+			return
+		if num == 3:
+			self.m_circle = Circle2.circleFromThreePoints(points[0], points[1], points[2])
+			self.m_isInLine = self.m_circle is None
+			if self.m_isInLine:
+				self.startLine()
+			else:
+				self.m_minRad = self.m_maxRad = self.m_circle.m_radius
+				self.acceptsCircle(self.m_circle)
+			return
+		if self.m_isInLine:
+			if self.isStillInLine():
+				return
+		else:
+			rad = point.distanceOfPoint(self.m_circle.m_center)
+			minRad = min(self.m_minRad, rad)
+			maxRad = max(self.m_maxRad, rad)
+			if maxRad - minRad < self.m_tolerance:
+				self.m_minRad = minRad
+				self.m_maxRad = maxRad
+				return
+			midIdx = int(round(num / 2.0))
+			newCircle = Circle2.circleFromThreePoints(points[0], points[midIdx], points[-1])
+			if newCircle is not None and self.acceptsCircle(newCircle):
+				self.m_circle = newCircle
+				return
+
+		# we need a new segment, first finish the current one (without point)
+		points.pop()
+		self.addCurrentSegment()
+		last = points[-1]
+		self.m_points = [last, point]
+		self.m_isInLine = False
+
+
+	def acceptsCircle(self, circle) -> bool:
+		"""
+			Check all my points against circle (vectorised). If ok, remember the radius range
+		"""
+		radii = (PointArray.fromPoints(self.m_points) - circle.m_center).lengths()
+		minRad = float(radii.min())
+		maxRad = float(radii.max())
+		if maxRad - minRad >= self.m_tolerance:
+			return False
+		self.m_minRad = minRad
+		self.m_maxRad = maxRad
+		return True
+
+
+	def startLine(self):
+		"""
+			My 3 points are in line: start with the direction range, that fits the middle and the last one
+			(the last one is an inner point, as soon as the next point comes)
+		"""
+		self.m_lineRef = None
+		self.m_lineMin = -math.pi
+		self.m_lineMax = math.pi
+		self.m_lineMaxDist = 0.0
+		self.addLineDirections(self.m_points[1])
+		self.addLineDirections(self.m_points[2])
+
+
+	def lineAngleAndDist(self, point) -> list[float]:
+		"""
+			Return [angle relative to m_lineRef, distance] of point seen from my first point (in the xy plane)
+		"""
+		diff = point - self.m_points[0]
+		angle = math.atan2(diff.m_y, diff.m_x)
+		if self.m_lineRef is not None:
+			angle = (angle - self.m_lineRef + math.pi) % (2 * math.pi) - math.pi
+		return [angle, math.hypot(diff.m_x, diff.m_y)]
+
+
+	def addLineDirections(self, point):
+		"""
+			point becomes an inner point of the current line: narrow the range of directions by the ones, that keep it near
+		"""
+		angle, dist = self.lineAngleAndDist(point)
+		self.m_lineMaxDist = max(self.m_lineMaxDist, dist)
+		if dist <= self.m_tolerance:
+			return
+		if self.m_lineRef is None:
+			self.m_lineRef = angle
+			angle = 0.0
+		width = math.asin(self.m_tolerance / dist)
+		self.m_lineMin = max(self.m_lineMin, angle - width)
+		self.m_lineMax = min(self.m_lineMax, angle + width)
+
+
+	def isStillInLine(self) -> bool:
+		"""
+			Return True, if all inner points are near enough to the chord from the first to the new last point.
+			As long as that chord is longer than the distances of the inner points, they project onto it and it suffices,
+			that its direction lies in the range of all inner points. Otherwise (the path turns back) all points are checked
+		"""
+		last = self.m_points[-1]
+		angle, dist = self.lineAngleAndDist(last)
+		if dist < self.m_lineMaxDist:
+			ret = self.allNearChord()
+		else:
+			ret = self.m_lineRef is None or self.m_lineMin <= angle <= self.m_lineMax
+		if ret:
+			self.addLineDirections(last)
+		return ret
+
+
+	def allNearChord(self) -> bool:
+		"""
+			Check the distances of all inner points to the chord from the first to the last point (vectorised)
+		"""
+		arr = PointArray.fromPoints(self.m_points).m_array
+		num = len(arr) - 2
+		starts = np.broadcast_to(arr[0], (num, 3))
+		stops = np.broadcast_to(arr[-1], (num, 3))
+		dists = ZPathSegment.distancesToChords(arr[1:-1], starts, stops)
+		return bool(np.all(dists <= self.m_tolerance))
+
+
+	def addCurrentSegment(self):
+		if self.m_isInLine:
+			ZPathSegment.addOneLine(self.m_segments, self.m_points)
+		else:
+			ZPathSegment.addOneCncSegment(self.m_segments, self.m_points, self.m_circle)
+
+
+	def finish(self) -> list:
+		"""
+			Return the list of all segments
+		"""
+		if len(self.m_points) == 2:
+			ZPathSegment.addOneLine(self.m_segments, self.m_points)
+		elif len(self.m_points) > 2:
+			self.addCurrentSegment()
+		self.m_points = []
+		return self.m_segments
@@ -34,6 +34,7 @@ class ZRhinoFile:
 	########### the Affine stack:
 	s_currentAffine = Affine()
 	s_affineStack = []
+	s_affineProducts = []		# s_affineProducts[ii] is the product of s_affineStack[0..ii], so push and pop are O(1)
 
 	@classmethod
 	def affineReset(cls):
@@ -44,20 +45,27 @@ class ZRhinoFile:
 	@classmethod
 	def affineRecalc(cls):
 		cls.s_currentAffine = Affine()
+		cls.s_affineProducts = []
 		for aff in cls.s_affineStack:
 			cls.s_currentAffine = aff * cls.s_currentAffine
+			cls.s_affineProducts.append(cls.s_currentAffine)
 
 
 	@classmethod
 	def affinePush(cls, aff):
 		cls.s_affineStack.append(aff)
-		cls.affineRecalc()
+		cls.s_currentAffine = aff * cls.s_currentAffine
+		cls.s_affineProducts.append(cls.s_currentAffine)
 
 
 	@classmethod
 	def affinePop(cls):
 		cls.s_affineStack.pop()
-		cls.affineRecalc()
+		cls.s_affineProducts.pop()
+		if cls.s_affineProducts:
+			cls.s_currentAffine = cls.s_affineProducts[-1]
+		else:
+			cls.s_currentAffine = Affine()
 
 
 ############################################################
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from context import zutils		#, testInFolder, testOutFolder
+
+from zutils.Instrument import Instrument
+from zutils.InstrumentPart import InstrumentPart
+from zutils.OSCNode import OSCCube
+from zutils.ZGeom import Point
+from zutils.ZMatrix import Affine
+
+
+class CubePart(InstrumentPart):
+	"""
+		A minimal part: one cube, shifted by offset
+	"""
+	def __init__(self, offset, fail=False):
+		super().__init__()
+		self.m_offset = offset
+		self.m_fail = fail
+
+
+	def needsAnSvgFile(self):
+		return False
+
+
+	def createAffLocalToGlobal(self, _):
+		return Affine(None, Point(self.m_offset))
+
+
+	def writeMyOSC(self, _, parent):
+		if self.m_fail:
+			raise ValueError('CubePart: failing on purpose')
+		parent.add(OSCCube('cube', 1, 2, 3, 0, 0, 0, Point(self.m_offset, 1)))
+
+
+class CubeInstrument(Instrument):
+	def __init__(self, folder, numParts, leftHanded=False):
+		super().__init__(folder=folder, leftHanded=leftHanded)
+		for ii in range(numParts):
+			self.addPart(CubePart(ii * 10.0), 'cube' + str(ii))
+
+
+	def partsInOrderToUpdate(self):
+		return self.m_parts
+
+
+class TestInstrument(unittest.TestCase):
+
+	def test_parallelOSCIsIdentical(self):
+		with tempfile.TemporaryDirectory() as folder:
+			for leftHanded in [False, True]:
+				instrument = CubeInstrument(folder, 4, leftHanded)
+				sequentialFile = os.path.join(folder, 'sequential.scad')
+				parallelFile = os.path.join(folder, 'parallel.scad')
+				instrument.writeOSC(sequentialFile, parallel=False)
+				instrument.writeOSC(parallelFile, parallel=True)
+				with open(sequentialFile, 'rb') as f:
+					sequential = f.read()
+				with open(parallelFile, 'rb') as f:
+					parallel = f.read()
+				self.assertTrue(len(sequential) > 0)
+				self.assertEqual(sequential, parallel)
+
+
+	def test_parallelOSCRaisesWorkerExceptions(self):
+		with tempfile.TemporaryDirectory() as folder:
+			instrument = CubeInstrument(folder, 3)
+			instrument.m_parts[1].m_fail = True
+			with self.assertRaises(ValueError):
+				instrument.writeOSC(os.path.join(folder, 'parallel.scad'), parallel=True)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -4,12 +4,17 @@
 
 import os
 import random
+import tempfile
+import zipfile
+import numpy as np
 
 from context import zutils, testInFolder, testOutFolder
 
-from zutils.ZGeom import Point, Polygon
+from zutils.ZGeom import ZGeomItem, Point, PointArray, Polygon
 from zutils.Form3d import Form3d, SurfacePolygon, SurfaceBezierCubic
-from zutils.OSCNode import OSCRoot, OSCCombination, OSCHexahedron, OSCLongSlot3D, OSCCube, OSCCylinder, OSCPocketHull, OSCForm3d
+from zutils.ZMatrix import Matrix, Affine
+from zutils.OSCNode import OSCTransform, OSCRoot, OSCCombination, OSCHexahedron, OSCLongSlot3D, OSCCube, OSCCylinder, OSCPocketHull, OSCForm3d, OSCPolyhedron, OSCPolygon, OSCExtrudeRounded
+from zutils.SvgReader import SvgPathReader
 
 
 ########################################################
@@ -39,6 +44,199 @@ def test_2AdjacentPolyhedra():
 	root.writeScadTo(s_outputRootFolder + '/test2AdjacentPolyhedra.scad')
 
 
+def test_vertexWelding():
+	"""
+		Coincident points of different faces must get the same index
+	"""
+	poly = OSCPolyhedron('welded')
+	poly.addFace([Point(), Point(1), Point(1, 1)])
+	poly.addFace([Point(0.0002), Point(1, 1.0002), Point(0, 1)])
+	poly.addFace([Point(0.9999, 0.9999), Point(2, 2), Point(1)])
+	assert len(poly.m_points) == 5
+	assert poly.m_faces == [[0, 1, 2], [0, 2, 3], [2, 4, 1]]
+
+
+def test_faceOrientation():
+	"""
+		Faces must become clockwise seen from outside, degenerate faces vanish, and the check runs only once
+	"""
+	p1, p2, p3, p4 = Point(), Point(1), Point(0, 1), Point(0, 0, 1)
+	poly = OSCPolyhedron('tetra')
+	for face in [[p1, p2, p3], [p1, p4, p2], [p1, p4, p3], [p2, p3, p4], [p1, p2, p1]]:
+		poly.addFace(face)
+	poly.checkAllPolygons()
+	assert poly.m_facesChecked
+	assert len(poly.m_faces) == 4
+	center = Point(0.25, 0.25, 0.25)
+	for face in poly.m_faces:
+		assert Polygon([poly.m_points[idx] for idx in face]).isClockWise(center)
+	poly.m_faces[0].reverse()
+	poly.checkAllPolygons()
+	assert not Polygon([poly.m_points[idx] for idx in poly.m_faces[0]]).isClockWise(center)
+	poly.addFace([p1, p3, p2])
+	assert not poly.m_facesChecked
+	poly.checkAllPolygons()
+	for face in poly.m_faces:
+		assert Polygon([poly.m_points[idx] for idx in face]).isClockWise(center)
+
+
+def test_extrudeRoundedWinding():
+	"""
+		Both orientations of a path give a closed polyhedron with all faces clockwise seen from outside and no degenerate faces
+	"""
+	for dAttribute in ['M 0 0 L 0 20 L 40 20 L 40 0 Z', 'M 0 0 L 40 0 L 40 20 L 0 20 Z', 'M 0 0 C 10 -10 30 -10 40 0 L 40 20 L 0 20 Z']:
+		for roundRadius in [0, 2]:
+			poly = OSCExtrudeRounded('extruded', SvgPathReader.classParsePath(dAttribute), 10, roundRadius)
+			points = PointArray.fromPoints(poly.m_points).m_array
+			edges = set()
+			volume = 0.0
+			for face in poly.m_faces:
+				assert len(set(face)) == len(face) and len(face) >= 3
+				facePoints = points[face]
+				assert np.linalg.norm(np.cross(facePoints, np.roll(facePoints, -1, axis=0)).sum(axis=0)) > 1e-9
+				for edge in zip(face, face[1:] + face[:1]):
+					assert edge not in edges
+					edges.add(edge)
+				for ii in range(1, len(face) - 1):
+					volume += np.dot(facePoints[0], np.cross(facePoints[ii], facePoints[ii + 1])) / 6
+			# every edge is used once in each direction: closed and consistently oriented
+			assert all((stop, start) in edges for start, stop in edges)
+			# vector areas point inwards
+			assert volume < 0
+			if roundRadius == 0 and not 'C' in dAttribute:
+				assert len(poly.m_faces) == 6
+				assert abs(volume + 8000) < 1e-6
+
+
+def test_meshExport():
+	"""
+		A cube written as binary stl and 3mf: 12 triangles with outward normals
+	"""
+	points = [Point(0, 0, 0), Point(1, 0, 0), Point(1, 1, 0), Point(0, 1, 0)]
+	upper = [p + Point(0, 0, 1) for p in points]
+	cube = OSCHexahedron('cube', *points, *upper)
+	triangles = cube.getTriangles()
+	assert triangles.shape == (12, 3)
+
+	fName = s_outputRootFolder + '/cube.stl'
+	cube.writeStlTo(fName)
+	assert os.path.getsize(fName) == 84 + 12 * 50
+	with open(fName, 'rb') as f:
+		data = f.read()
+	assert np.frombuffer(data, dtype='<u4', count=1, offset=80)[0] == 12
+	stl = np.frombuffer(data, dtype=OSCPolyhedron.s_stlTriangleType, offset=84)
+	centers = stl['corners'].mean(axis=1)
+	assert np.all(np.einsum('ij,ij->i', stl['normal'], centers - 0.5) > 0)
+
+	fName = s_outputRootFolder + '/cube.3mf'
+	cube.write3mfTo(fName)
+	with zipfile.ZipFile(fName) as zf:
+		model = zf.read('3D/3dmodel.model').decode('utf-8')
+	assert model.count('<vertex ') == 8
+	assert model.count('<triangle ') == 12
+
+
+def makeCacheTestTree(height):
+	root = OSCRoot('rootNode')
+	diff = root.add(OSCCombination('main diff', 'difference'))
+	diff.add(OSCCube('mainCube', 20, 10, height, 0, 0, 0, Point()))
+	points = [Point(0, 0, 0), Point(1, 0, 0), Point(1, 1, 0), Point(0, 1, 0)]
+	upper = [p + Point(0, 0, 1) for p in points]
+	diff.add(OSCHexahedron('hexa', *points, *upper))
+	return root
+
+
+def test_textCache():
+	"""
+		Unchanged subtrees reuse their text, changed ones are written again
+	"""
+	OSCRoot.setUseTextCache(True)
+	OSCRoot.clearTextCache()
+	root = makeCacheTestTree(5)
+	text1 = root.getScadText(-1)
+	hits, misses, _, _ = OSCRoot.getTextCacheStats()
+	assert hits == 0 and misses > 0
+	assert makeCacheTestTree(5).getScadText(-1) == text1
+	assert OSCRoot.getTextCacheStats()[0] == hits + 1		# the whole diff came from the cache
+
+	root2 = makeCacheTestTree(6)
+	text2 = root2.getScadText(-1)
+	assert text2 != text1
+	OSCRoot.setUseTextCache(False)
+	assert root2.getScadText(-1) == text2
+	OSCRoot.setUseTextCache(True)
+
+	# a changed global setting must not give the old text
+	ZGeomItem.s_inchWanted = True
+	hits = OSCRoot.getTextCacheStats()[0]
+	makeCacheTestTree(5).getScadText(-1)
+	ZGeomItem.s_inchWanted = False
+	assert OSCRoot.getTextCacheStats()[0] == hits
+
+	# values of unknown type are not hashed, the subtree is written without the cache
+	unknown = makeCacheTestTree(5)
+	unknown.m_children[0].m_children[0].m_unknown = object()
+	assert unknown.m_children[0].getSubtreeHash() is None
+	numEntries = OSCRoot.getTextCacheStats()[2]
+	assert unknown.getScadText(-1) == text1
+	assert OSCRoot.getTextCacheStats()[2] == numEntries
+
+	# hashing does not change a node: faces are hashed as they are, not checked
+	poly = OSCPolyhedron('unchecked')
+	p1, p2, p3, p4 = Point(), Point(1), Point(0, 1), Point(0, 0, 1)
+	for face in [[p1, p3, p2], [p1, p2, p4], [p1, p4, p3], [p2, p4, p3], [p1, p2, p1]]:
+		poly.addFace(face)
+	faces = [list(face) for face in poly.m_faces]
+	description = poly.getHashDescription()
+	assert poly.m_faces == faces and not poly.m_facesChecked
+	assert poly.getHashDescription() == description
+
+	with tempfile.TemporaryDirectory() as folder:
+		OSCRoot.setTextCacheFolder(folder)
+		OSCRoot.clearTextCache()
+		root.getScadText(-1)
+		assert len(os.listdir(folder)) > 0
+		OSCRoot.clearTextCache()
+		assert makeCacheTestTree(5).getScadText(-1) == text1
+		assert OSCRoot.getTextCacheStats()[1] == 0
+		OSCRoot.setTextCacheFolder(None)
+	OSCRoot.setUseTextCache(False)
+
+
+def test_cachedTransformation():
+	"""
+		The cached transformations must be the products of all affines above, also after reparenting
+	"""
+	aff1 = Affine(Matrix.makeEulerRotation(30, 'z'), Point(1, 2, 3))
+	aff2 = Affine(Matrix.makeScaleMatrix(2, 2, 2), Point(0, 0, 1))
+	aff0 = Affine(None, Point(5))
+	t1 = OSCTransform('t1', aff1)
+	t2 = t1.add(OSCTransform('t2', aff2))
+	leaf = t2.add(OSCCube('leaf', 1, 1, 1, 0, 0, 0, Point()))
+	assert leaf.getTransformation().isSameAs(aff1 * aff2)
+	assert leaf.m_transformation is not None
+	t0 = OSCTransform('t0', aff0)
+	t0.add(t1)
+	assert leaf.m_transformation is None
+	assert leaf.getTransformation().isSameAs(aff0 * aff1 * aff2)
+	assert t2.getTransformation().isSameAs(aff0 * aff1 * aff2)
+
+
+def test_batchedWriting():
+	"""
+		The batched point and face strings must look exactly like the single point writes
+	"""
+	poly = OSCPolyhedron('batched')
+	poly.addFace([Point(-0.00000001, 1.5), Point(1, -2.25, 3), Point(1, 1, 1e-9)])
+	points = poly.m_points
+	expected = ''.join([poly.getFloatListString(poly.s_vectorFormat3, [p.m_x, p.m_y, p.m_z]) + ', ' for p in points])
+	assert poly.getPointListString(points) == expected
+	expected2 = ''.join([poly.getFloatListString(poly.s_vectorFormat2, [p.m_x, p.m_y]) + ', ' for p in points])
+	assert poly.getPointListString(points, 2) == expected2
+	assert poly.getIndexListString(poly.m_faces) == '[0,1,2,],'
+	assert OSCPolygon('flat', points).getScadText(2) == '  polygon([' + expected2 + ']);\n'
+
+
 def pocketTest():
 	root = OSCRoot('rootNode')
 
@@ -297,6 +495,13 @@ s_outputRootFolder = folder
 #pocketTest()
 test_simpleOctohedron()
 test_2AdjacentPolyhedra()
+test_vertexWelding()
+test_faceOrientation()
+test_extrudeRoundedWinding()
+test_batchedWriting()
+test_meshExport()
+test_textCache()
+test_cachedTransformation()
 #test_neckStraightPart()
 test_baseCubeSimple()
 test_baseCubeItself()
@@ -4,12 +4,13 @@
 
 import os
 import random
+import numpy as np
 
 from context import zutils, testInFolder, testOutFolder
 
 from zutils.ZPath import ZBezier3Segment
-from zutils.SISLCall import SislCurveHolder, SislSurfaceHolder, SislLoftedSurfaceHolder
-from zutils.ZGeom import Point, Plane
+from zutils.SISLCall import SislObjectHolder, SislCurveHolder, SislSurfaceHolder, SislLoftedSurfaceHolder, SislScope
+from zutils.ZGeom import Point, Plane, PointArray
 from zutils.ZMatrix import Affine, Matrix
 from zutils.OSCNode import OSCRoot, OSCForm3d, OSCCylinder, OSCSphere
 from zutils.Form3d import Form3d
@@ -268,6 +269,126 @@ def test_parallelCurve():
 	parallelCurve = sislCurve.createOffsetCurve(1.0, 0.001, Point(0, 0, 1))
 	parallelCurve.dump('the found parallel curve')
 
+
+def test_zeroCopyMarshalling():
+	points = PointArray([[0, 0, 0], [1, 0.5, 0], [2, 0.5, 0], [3, 0, 0]])
+	coords = SislCurveHolder.makePointArray(points)
+	coords[3] = 7.0		# the ffi array shares the memory of the PointArray
+	if points[1].m_x != 7.0:
+		raise Exception('test_zeroCopyMarshalling: makePointArray copied the PointArray')
+	coords[3] = 1.0
+
+	curve = SislCurveHolder.createCurveFromControlPoints(points)
+	params = [curve.m_startPar, (curve.m_startPar + curve.m_endPar) / 2, curve.m_endPar]
+	pointArray = curve.getCurvePointArrayAt(params)
+	pointList = curve.getCurvePointsAt(params)
+	for ii in range(3):
+		if not pointArray[ii].isSameAs(pointList[ii]):
+			raise Exception('test_zeroCopyMarshalling: getCurvePointArrayAt differs from getCurvePointsAt')
+	if not pointArray[0].isSameAs(points[0]) or not pointArray[2].isSameAs(points[3]):
+		raise Exception('test_zeroCopyMarshalling: curve does not start and end at its control points')
+
+	aff = Affine(Matrix(2), Point(0, 0, 1))
+	moved = curve.transformedBy(aff).getCurvePointsAt(params)
+	for ii in range(3):
+		if not moved[ii].isSameAs(aff * pointList[ii]):
+			raise Exception('test_zeroCopyMarshalling: transformedBy failed')
+
+
+def test_gridCache():
+	surface = createSimpleSurface(10)
+	points1 = surface.getSurfacePoints(11)[0]
+	if list(surface.m_gridCache.keys()) != [(11, 11)]:
+		raise Exception('test_gridCache: grid not cached')
+	buffers = surface.m_gridCache[(11, 11)]
+	points2 = surface.getEdgePolygons(10)[0]
+	if surface.m_gridCache[(11, 11)] is not buffers:
+		raise Exception('test_gridCache: grid evaluated twice')
+	for ii in range(11):
+		if not points1[ii][0].isSameAs(points2[ii]):
+			raise Exception('test_gridCache: cached points differ')
+	if points1[0][0] is points2[0]:
+		raise Exception('test_gridCache: Points must not be shared')
+
+	moved = surface.transformedBy(Affine(None, Point(0, 0, 1)))
+	if moved.m_gridCache:
+		raise Exception('test_gridCache: transformed surface must start with an empty cache')
+	if not moved.getSurfacePoints(11)[0][0][0].isSameAs(points1[0][0] + Point(0, 0, 1)):
+		raise Exception('test_gridCache: transformed surface uses the old grid')
+
+	oldMax = SislSurfaceHolder.s_gridCacheMaxBytes
+	SislSurfaceHolder.s_gridCacheMaxBytes = surface.m_gridCacheBytes + 1
+	surface.getSurfacePoints(5)
+	SislSurfaceHolder.s_gridCacheMaxBytes = oldMax
+	if list(surface.m_gridCache.keys()) != [(5, 5)]:
+		raise Exception('test_gridCache: oldest grid not dropped')
+
+	surface.free()
+	if surface.m_gridCache or surface.m_gridCacheBytes != 0:
+		raise Exception('test_gridCache: free() must clear the cache')
+
+
+def test_surfaceGrid():
+	surface = createSimpleSurface(10)
+	grid = surface.getGrid(6, 4)
+	if grid.m_points.shape != (6, 4, 3) or grid.m_normals.shape != (6, 4, 3) or grid.m_derivsU.shape != (6, 4, 3):
+		raise Exception('test_surfaceGrid: wrong shapes')
+	points = grid.getPointsLists()
+	uVals = SislSurfaceHolder.getInterValuesPython(surface.m_startPar1, surface.m_endPar1, 6)
+	vVals = SislSurfaceHolder.getInterValuesPython(surface.m_startPar2, surface.m_endPar2, 4)
+	for ii in range(6):
+		for jj in range(4):
+			if not points[ii][jj].isSameAs(surface.getOneSurfacePoint(uVals[ii], vVals[jj])):
+				raise Exception('test_surfaceGrid: wrong point at ' + str([ii, jj]))
+			normal = Point(*grid.m_normals[ii, jj])
+			if abs(normal * Point(*grid.m_derivsU[ii, jj])) > 1e-9:
+				raise Exception('test_surfaceGrid: normal not perpendicular to u-derivative')
+	if grid.m_points.flags.writeable:
+		raise Exception('test_surfaceGrid: cached grid must be read only')
+
+
+def test_closestParamsMany():
+	surface = createSimpleSurface(10)
+	points = PointArray([[0.2 + 0.05 * ii, 1.5, 1] for ii in range(30)])
+	single = [surface.findClosestParamsSimple(p) for p in points.asPoints()]
+	for warmStart in [False, True]:
+		SislSurfaceHolder.s_closestChunkSize = 7
+		serialParams, serialClosest = surface.findClosestMany(points, warmStart=warmStart)
+		threadedParams, threadedClosest = surface.findClosestMany(points, warmStart=warmStart, numThreads=4)
+		SislSurfaceHolder.s_closestChunkSize = 256
+		if not np.array_equal(serialParams, threadedParams) or not np.array_equal(serialClosest.m_array, threadedClosest.m_array):
+			raise Exception('test_closestParamsMany: threaded results differ from serial ones')
+		for params, closest in [[serialParams, serialClosest], [threadedParams, threadedClosest]]:
+			for ii in range(len(points)):
+				if abs(params[ii][0] - single[ii][0]) > 1e-4 or abs(params[ii][1] - single[ii][1]) > 1e-4:
+					raise Exception('test_closestParamsMany: wrong params for point ' + str(ii))
+				if not closest[ii].isSameAs(surface.getOneSurfacePoint(params[ii][0], params[ii][1])):
+					raise Exception('test_closestParamsMany: wrong closest point for point ' + str(ii))
+	if len(surface.findClosestParamsMany([])) != 0:
+		raise Exception('test_closestParamsMany: empty input must give empty result')
+
+
+def test_sislScope():
+	before = SislObjectHolder.getLiveStats()
+	with SislCurveHolder.createCurveFromStraightLine(Point(), Point(1)) as curve:
+		if SislObjectHolder.getLiveStats()['count'] != before['count'] + 1:
+			raise Exception('test_sislScope: curve not counted')
+	if curve.m_structPtr is not None or SislObjectHolder.getLiveStats()['count'] != before['count']:
+		raise Exception('test_sislScope: curve not freed at exit')
+
+	with SislScope():
+		with SislScope() as inner:
+			surface = inner.keep(createSimpleSurface(5))
+			temp = surface.getDerivationAsSurface(0, 1)
+		if temp.m_structPtr is not None or surface.m_structPtr is None or surface.m_curves[0].m_structPtr is None:
+			raise Exception('test_sislScope: inner scope freed the wrong holders')
+		if SislObjectHolder.getLiveStats()['bytes'] <= before['bytes']:
+			raise Exception('test_sislScope: bytes not counted')
+	if surface.m_structPtr is not None or surface.m_curves[0].m_structPtr is not None:
+		raise Exception('test_sislScope: outer scope did not free the kept holders')
+	if SislObjectHolder.getLiveStats()['count'] != before['count'] or SislObjectHolder.getLiveStats()['bytes'] != before['bytes']:
+		raise Exception('test_sislScope: live stats not back to start')
+
 ##################
 
 # now create the output folders
@@ -293,3 +414,8 @@ testJoin2Curves()
 testCurveConstant()
 testCreateSurfsFromCurves()
 test_parallelCurve()
+test_zeroCopyMarshalling()
+test_gridCache()
+test_surfaceGrid()
+test_closestParamsMany()
+test_sislScope()
@@ -0,0 +1,331 @@
+"""
+	Tests of zutils.SISLCall.py that do not need the compiled sisl library
+"""
+
+import unittest
+from unittest import mock
+import cffi
+import numpy as np
+
+from context import zutils		#, testInFolder, testOutFolder
+
+from zutils.ZGeom import Point, PointArray
+import zutils.SISLCall as SISLCall
+from zutils.SISLCall import SislObjectHolder, SislCurveHolder, SislSurfaceHolder, SislSurfaceGrid, SislScope, s_ffi
+
+
+class FakeSisl:
+	"""
+		Replaces zutils.sisl_adapt: a real ffi with the struct members SISLCall.py reads, and a Mock as lib.
+		The fake surface is the plane z = 0 with parameters u = x and v = y
+	"""
+	s_declarations = """
+		typedef struct { int ik; int in; double *et; double *ecoef; int idim; } SISLCurve;
+		typedef struct { int ik1; int ik2; int in1; int in2; double *et1; double *et2; double *ecoef; int idim; } SISLSurf;
+	"""
+
+	def __init__(self):
+		self.ffi = cffi.FFI()
+		self.ffi.cdef(self.s_declarations)
+		self.lib = mock.Mock()
+		self.lib.s1506.side_effect = self.s1506
+		self.lib.s1603.side_effect = self.s1603
+		self.lib.s1958.side_effect = self.s1958
+		self.lib.s1775.side_effect = self.s1775
+		self.lib.s1421.side_effect = self.s1421
+		self.m_structs = []
+
+
+	def newSurface(self, numU=4, numV=4):
+		struct = self.ffi.new('SISLSurf *')
+		struct.ik1 = struct.ik2 = 4
+		struct.in1 = numU
+		struct.in2 = numV
+		struct.idim = 3
+		self.m_structs.append(struct)
+		return struct
+
+
+	def newCurve(self, num=4):
+		struct = self.ffi.new('SISLCurve *')
+		struct.ik = 4
+		setattr(struct, 'in', num)
+		struct.idim = 3
+		self.m_structs.append(struct)
+		return struct
+
+
+	def doubles(self, ptr, num):
+		return np.frombuffer(self.ffi.buffer(ptr, num * 8), dtype=np.float64)
+
+
+	def s1506(self, _, __, numU, uVals, numV, vVals, pointsAndDerivs, normals, ___):
+		"""
+			Write the s1506 layout: u runs fastest, each entry holds point, u-derivative and v-derivative
+		"""
+		us = self.doubles(uVals, numU)
+		vs = self.doubles(vVals, numV)
+		out = self.doubles(pointsAndDerivs, 9 * numU * numV).reshape(numV, numU, 3, 3)
+		out[:, :, 0, 0] = us[np.newaxis, :]
+		out[:, :, 0, 1] = vs[:, np.newaxis]
+		out[:, :, 0, 2] = 0
+		out[:, :, 1] = [1, 0, 0]
+		out[:, :, 2] = [0, 1, 0]
+		self.doubles(normals, 3 * numU * numV).reshape(numV, numU, 3)[:] = [0, 0, 1]
+
+
+	def s1603(self, _, startU, startV, endU, endV, stat):
+		startU[0], startV[0], endU[0], endV[0] = 0.0, 0.0, 1.0, 1.0
+		stat[0] = 0
+
+
+	def s1958(self, _, point, __, ___, ____, params, dist, stat):
+		params[0], params[1] = point[0], point[1]
+		dist[0] = abs(point[2])
+		stat[0] = 0
+
+
+	def s1775(self, surface, point, dim, __, ___, ____, _____, params, stat):
+		"""
+			SISL: s1775(SISLSurf *surf, double point[], int dim, double epsge, double start[], double end[], double guess[], double clpar[], int *stat)
+		"""
+		assert self.ffi.typeof(surface).cname == 'SISLSurf *' and self.ffi.typeof(point).cname == 'double[]' and dim == 3
+		params[0], params[1] = point[0], point[1]
+		stat[0] = 0
+
+
+	def s1421(self, _, __, params, ___, ____, point, normal, stat):
+		point[0], point[1], point[2] = params[0], params[1], 0.0
+		normal[0], normal[1], normal[2] = 0.0, 0.0, 1.0
+		stat[0] = 0
+
+
+class TestSislMarshalling(unittest.TestCase):
+
+	def test_makePointArray(self):
+		points = [Point(1, 2, 3), Point(4, 5, 6)]
+		self.assertEqual(list(SislObjectHolder.makePointArray(points)), [1, 2, 3, 4, 5, 6])
+		self.assertEqual(list(SislObjectHolder.makePointArray(Point(7, 8, 9))), [7, 8, 9])
+
+		# a float64 PointArray is shared, not copied
+		pointArray = PointArray(np.arange(6.0).reshape(2, 3))
+		arr = SislObjectHolder.makePointArray(pointArray)
+		arr[4] = 40.0
+		self.assertEqual(pointArray[1].m_y, 40.0)
+
+		# non contiguous or int input is converted, not reinterpreted
+		strided = np.arange(12.0).reshape(2, 6)[:, ::2]
+		self.assertEqual(list(SislObjectHolder.makePointArray(strided)), [0, 2, 4, 6, 8, 10])
+		ints = np.arange(6).reshape(2, 3)
+		self.assertEqual(list(SislObjectHolder.makePointArray(ints)), [0, 1, 2, 3, 4, 5])
+
+
+	def test_makeArraysWithValues(self):
+		doubles = SislObjectHolder.makeDoubleArrayWithValues(np.arange(10)[::3])
+		self.assertEqual(s_ffi.typeof(doubles).cname, 'double[]')
+		self.assertEqual(list(doubles), [0.0, 3.0, 6.0, 9.0])
+		ints = SislObjectHolder.makeIntArrayWithValues([1.0, 2.0, 3.0])
+		self.assertEqual(s_ffi.typeof(ints).cname, 'int[]')
+		self.assertEqual(list(ints), [1, 2, 3])
+
+
+	def test_readFromArray(self):
+		arr = SislObjectHolder.makeDoubleArrayWithValues([1, 2, 3, 4, 5, 6, 7])
+		view = SislObjectHolder.getPointArrayFromArray(arr, 2)
+		self.assertEqual(view.m_array.shape, (2, 3))
+		self.assertEqual(view.m_array.dtype, np.float64)
+		arr[0] = 10.0
+		self.assertEqual(view[0].m_x, 10.0)			# a view on the ffi memory
+		copy = SislObjectHolder.getPointArrayFromArray(arr, 2, copy=True)
+		arr[0] = 1.0
+		self.assertEqual(copy[0].m_x, 10.0)
+		self.assertEqual(SislObjectHolder.getDoublesFromArray(arr, 3), [1.0, 2.0, 3.0])
+		points = SislObjectHolder.getPointsFromArray(arr, 2)
+		self.assertTrue(points[1].isSameAs(Point(4, 5, 6)))
+
+		self.assertEqual(list(SislObjectHolder.getDoubleArrayFromArray(np.arange(8)[::2], 3)), [0.0, 2.0, 4.0])
+		self.assertEqual(len(SislObjectHolder.getDoubleArrayFromArray(arr, 0)), 0)
+		with self.assertRaises(Exception):
+			SislObjectHolder.getDoubleArrayFromArray(SislObjectHolder.makeIntArray(3), 3)
+
+
+class TestSislSurfaceGrid(unittest.TestCase):
+
+	def test_layout(self):
+		# entry jj * numU + ii of the s1506 output holds point, u-derivative and v-derivative of (ii, jj)
+		numU, numV = 4, 3
+		raw = np.empty((numV, numU, 3, 3))
+		normals = np.empty((numV, numU, 3))
+		for ii in range(numU):
+			for jj in range(numV):
+				for kind in range(3):
+					raw[jj, ii, kind] = [100 * kind + ii, jj, -1]
+				normals[jj, ii] = [ii, jj, 1]
+		raw = raw.reshape(-1)
+		normals = normals.reshape(-1)
+		raw.flags.writeable = False
+
+		grid = SislSurfaceGrid(raw, normals, numU, numV)
+		for arr in [grid.m_points, grid.m_derivsU, grid.m_derivsV, grid.m_normals]:
+			self.assertEqual(arr.shape, (numU, numV, 3))
+		self.assertEqual(grid.m_points.strides, (9 * 8, 9 * numU * 8, 8))
+		self.assertEqual(grid.m_normals.strides, (3 * 8, 3 * numU * 8, 8))
+		self.assertEqual(list(grid.m_points[3, 2]), [3, 2, -1])
+		self.assertEqual(list(grid.m_derivsU[1, 2]), [101, 2, -1])
+		self.assertEqual(list(grid.m_derivsV[2, 0]), [202, 0, -1])
+
+		# views, not copies
+		self.assertTrue(np.shares_memory(grid.m_points, raw))
+		self.assertTrue(np.shares_memory(grid.m_normals, normals))
+		self.assertFalse(grid.m_points.flags.writeable)
+		normals[3 * (2 * numU + 1)] = 42
+		self.assertEqual(grid.m_normals[1, 2, 0], 42)
+
+		points = grid.getPointsLists()
+		self.assertEqual((len(points), len(points[0])), (numU, numV))
+		self.assertTrue(points[3][1].isSameAs(Point(3, 1, -1)))
+		self.assertTrue(grid.getNormalsLists()[2][0].isSameAs(Point(2, 0, 1)))
+
+
+class TestSislGridCache(unittest.TestCase):
+
+	def setUp(self):
+		self.m_fake = FakeSisl()
+		self.m_patch = mock.patch.object(SISLCall, 'sl', self.m_fake)
+		self.m_patch.start()
+
+
+	def tearDown(self):
+		self.m_patch.stop()
+
+
+	def test_hitMissAndEviction(self):
+		lib = self.m_fake.lib
+		surface = SislSurfaceHolder(self.m_fake.newSurface())
+		points1 = surface.getSurfacePoints(5)[0]
+		self.assertEqual(lib.s1506.call_count, 1)		# a miss
+		points2 = surface.getEdgePolygons(4)[0]
+		self.assertEqual(lib.s1506.call_count, 1)		# a hit
+		self.assertTrue(points1[4][0].isSameAs(points2[4]))
+		self.assertIsNot(points1[4][0], points2[4])
+
+		# the cached buffers cannot be changed through the returned arrays
+		pointsAndDerivs, _ = surface.getGridBuffers(5, 5)
+		self.assertFalse(pointsAndDerivs.flags.writeable)
+		with self.assertRaises(ValueError):
+			pointsAndDerivs[0] = 1.0
+		with self.assertRaises(ValueError):
+			pointsAndDerivs.flags.writeable = True
+		self.assertEqual(lib.s1506.call_count, 1)
+
+		# eviction per surface
+		oldMax = SislSurfaceHolder.s_gridCacheMaxBytes
+		SislSurfaceHolder.s_gridCacheMaxBytes = surface.m_gridCacheBytes + 1
+		try:
+			surface.getSurfacePoints(3)
+		finally:
+			SislSurfaceHolder.s_gridCacheMaxBytes = oldMax
+		self.assertEqual(list(surface.m_gridCache.keys()), [(3, 3)])
+		surface.getSurfacePoints(5)
+		self.assertEqual(lib.s1506.call_count, 3)
+
+		# eviction over all surfaces
+		surface2 = SislSurfaceHolder(self.m_fake.newSurface())
+		oldMaxTotal = SislSurfaceHolder.s_gridCacheMaxTotalBytes
+		SislSurfaceHolder.s_gridCacheMaxTotalBytes = SislSurfaceHolder.s_gridCacheTotalBytes + 1
+		try:
+			surface2.getSurfacePoints(3)
+		finally:
+			SislSurfaceHolder.s_gridCacheMaxTotalBytes = oldMaxTotal
+		self.assertEqual(list(surface.m_gridCache.keys()), [(5, 5)])		# its oldest grid (3, 3) was dropped
+		self.assertEqual(list(surface2.m_gridCache.keys()), [(3, 3)])
+
+		total = SislSurfaceHolder.s_gridCacheTotalBytes
+		surface.free()
+		self.assertEqual(surface.m_gridCacheBytes, 0)
+		self.assertEqual(SislSurfaceHolder.s_gridCacheTotalBytes, total - 9 * 8 * 25 - 3 * 8 * 25)
+		surface2.free()
+
+
+class TestSislClosest(unittest.TestCase):
+
+	def test_threadedIsSerial(self):
+		with mock.patch.object(SISLCall, 'sl', FakeSisl()) as fake:
+			surface = SislSurfaceHolder(fake.newSurface())
+			points = PointArray([[0.01 * ii, 0.5 + 0.002 * ii, 0.1 * (ii % 3)] for ii in range(50)])
+			oldChunkSize = SislSurfaceHolder.s_closestChunkSize
+			SislSurfaceHolder.s_closestChunkSize = 7
+			try:
+				for warmStart in [False, True]:
+					serialParams, serialClosest = surface.findClosestMany(points, warmStart=warmStart)
+					threadedParams, threadedClosest = surface.findClosestMany(points, warmStart=warmStart, numThreads=4)
+					self.assertTrue(np.array_equal(serialParams, threadedParams))
+					self.assertTrue(np.array_equal(serialClosest.m_array, threadedClosest.m_array))
+					self.assertTrue(np.array_equal(serialParams, points.m_array[:, :2]))
+					self.assertTrue(np.array_equal(serialClosest.m_array[:, 2], np.zeros(len(points))))
+			finally:
+				SislSurfaceHolder.s_closestChunkSize = oldChunkSize
+			self.assertTrue(fake.lib.s1775.call_count > 0)
+			surface.free()
+
+
+
+class TestSislScope(unittest.TestCase):
+
+	def assertStats(self, expected):
+		stats = SislObjectHolder.getLiveStats()
+		self.assertEqual([stats['count'], stats['bytes']], [expected['count'], expected['bytes']])
+
+
+	def test_freedAtExit(self):
+		with mock.patch.object(SISLCall, 'sl', FakeSisl()) as fake:
+			before = SislObjectHolder.getLiveStats()
+			with SislScope():
+				curve = SislCurveHolder(fake.newCurve())
+				surface = SislSurfaceHolder(fake.newSurface())
+				stats = SislObjectHolder.getLiveStats()
+				self.assertEqual(stats['count'], before['count'] + 2)
+				self.assertEqual(stats['bytes'], before['bytes'] + curve.m_sislBytes + surface.m_sislBytes)
+				self.assertTrue(curve.m_sislBytes > 0 and surface.m_sislBytes > 0)
+			self.assertStats(before)
+			self.assertEqual(fake.lib.freeCurve.call_count, 1)
+			self.assertEqual(fake.lib.freeSurf.call_count, 1)
+			self.assertIsNone(curve.m_structPtr)
+			curve.free()		# freeing twice neither calls SISL nor counts again
+			self.assertEqual(fake.lib.freeCurve.call_count, 1)
+			self.assertStats(before)
+
+
+	def test_freedAtException(self):
+		with mock.patch.object(SISLCall, 'sl', FakeSisl()) as fake:
+			before = SislObjectHolder.getLiveStats()
+			with self.assertRaises(ValueError):
+				with SislScope() as outer:
+					kept = outer.keep(SislSurfaceHolder(fake.newSurface()))
+					with SislScope() as inner:
+						inner.keep(SislCurveHolder(fake.newCurve()))
+						SislSurfaceHolder(fake.newSurface())
+						raise ValueError('SislScope test: failing on purpose')
+			self.assertEqual(SislObjectHolder.getLiveStats()['count'], before['count'] + 1)
+			self.assertEqual(SislObjectHolder.getLiveStats()['bytes'], before['bytes'] + kept.m_sislBytes)
+			self.assertEqual(fake.lib.freeCurve.call_count, 1)		# kept by inner, freed by outer
+			self.assertEqual(fake.lib.freeSurf.call_count, 1)		# kept by outer, not freed
+			kept.free()
+			self.assertEqual(fake.lib.freeSurf.call_count, 2)
+			self.assertStats(before)
+
+
+	def test_zeroBytes(self):
+		with mock.patch.object(SISLCall, 'sl', FakeSisl()) as fake:
+			before = SislObjectHolder.getLiveStats()
+			with mock.patch.object(SislCurveHolder, 'getSislBytes', return_value=0):
+				with SislScope():
+					curve = SislCurveHolder(fake.newCurve())
+					self.assertEqual(SislObjectHolder.getLiveStats()['count'], before['count'] + 1)
+			self.assertStats(before)
+			self.assertEqual(fake.lib.freeCurve.call_count, 1)
+			self.assertIsNone(curve.m_structPtr)
+
+
+if __name__ == '__main__':
+	unittest.main()
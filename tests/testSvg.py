@@ -5,6 +5,11 @@
 
 import unittest
 import os
+import math
+import random
+import numpy as np
+from unittest import mock
+import xml.etree.ElementTree as ET
 
 #import sys
 #sys.path.append('.')
@@ -14,7 +19,7 @@ from context import zutils, testInFolder, testOutFolder
 from zutils.ZGeom import ZGeomItem, Point, Line
 from zutils.SvgReader import SvgPathReader
 from zutils.SvgPatcher import SvgWriter
-from zutils.ZPath import ZArcSegment
+from zutils.ZPath import ZArcSegment, ZCncFitter
 from zutils.ZMatrix import Matrix, Affine
 from zutils.ZGeomHelper import ZGeomHelper
 
@@ -77,11 +82,66 @@ class TestSvg(unittest.TestCase):
 
 		friendly = path.cncFriendly(0.05)
 		svgWriter.addPath(None, friendly, stroke='red')
+		self.assertTrue(friendly.areSegsConnected())
+		for point in path.getAllInterPoints(0.01):
+			self.assertTrue(friendly.findNearestPoint(point)[3] < 0.05)
 		#friendly.printComment('cncFriendly')
 		print(f'number Of Segments = {len(friendly.m_segments)}')
 
 		svgWriter.write(fName)
 
+
+	def test_cncSamplesOnce(self):
+		seg = SvgPathReader.classParsePath('M 0 100 C 25 50 75 150 100 100').m_segments[0]
+		evaluated = []
+		pointsAtParams = seg.pointsAtParams
+		def countingPointsAtParams(ts):
+			evaluated.append(len(ts))
+			return pointsAtParams(ts)
+		seg.pointsAtParams = countingPointsAtParams
+		samples = list(seg.iterCncSamples(0.05))
+		numForSamples = sum(evaluated)
+		evaluated.clear()
+		ts, points = seg.adaptiveParamsAndPoints(0.05 * 0.25)
+		# the samples are the points evaluated by the adaptive flattening, no point is evaluated again
+		self.assertEqual(numForSamples, sum(evaluated))
+		self.assertEqual(len(samples), len(ts))
+		self.assertTrue(all(x.isSameAs(Point(*y)) for x, y in zip(samples, points.tolist())))
+		self.assertTrue(np.allclose(points, pointsAtParams(ts).m_array))
+
+
+	def test_cncLineIsIncremental(self):
+		"""
+			The O(1) line check of ZCncFitter must decide like checking all points against the chord
+		"""
+		decisions = []
+		class CheckingFitter(ZCncFitter):
+			def isStillInLine(self):
+				expected = self.allNearChord()
+				ret = super().isStillInLine()
+				decisions.append(ret == expected)
+				return ret
+
+			def addCurrentSegment(self):
+				pass		# only the line decisions matter here
+
+		rand = random.Random(3)
+		for tolerance in [0.01, 0.05]:
+			fitter = CheckingFitter(tolerance)
+			x, y, angle = 0, 0, 0.3
+			fitter.addPoint(Point(x, y))
+			for ii in range(400):
+				if ii % 50 == 49:
+					angle += rand.uniform(-2.5, 2.5)
+				step = rand.uniform(-0.2, 1)
+				x += step * math.cos(angle)
+				y += step * math.sin(angle)
+				# noise on some points only, so that line runs start (3 points in line) and then get tested
+				noise = 0.02 if rand.random() < 0.3 else 0
+				fitter.addPoint(Point(x + rand.uniform(-noise, noise), y + rand.uniform(-noise, noise)))
+		self.assertTrue(len(decisions) > 100)
+		self.assertTrue(all(decisions))
+
 	def test_05_arcs1(self):
 
 		self.checkOneArcFromString('M 0 100 A 80 80 0 1 0 100 0', None, False)
@@ -149,6 +209,87 @@ class TestSvg(unittest.TestCase):
 		svgWriter.write(fName)
 
 
+	def test_batchEvaluation(self):
+		dAttribute = 'M 10 100 L 20 110 C 0 0 80 0 100 90 Q 80 0 100 50 A 60 40 20 0 0 0 50'
+		path = SvgPathReader.classParsePath(dAttribute)
+		ts = [0, 0.2, 0.55, 1]
+		for seg in path.m_segments:
+			points = seg.pointsAtParams(ts)
+			tangents = seg.tangentsAtParams(ts)
+			seconds = seg.secondDerivativesAtParams(ts)
+			for ii, t in enumerate(ts):
+				self.assertTrue(points[ii].isSameAs(seg.pointAtParam(t)))
+				self.assertTrue(tangents[ii].isSameAs(seg.tangentAtParam(t)))
+				self.assertTrue(seconds[ii].isSameAs(seg.secondDerivativeAtParam(t)))
+		interPoints = path.m_segments[2].getAllInterPoints(0.3)
+		self.assertEqual(len(interPoints), 5)
+		self.assertTrue(interPoints[-1].isSameAs(path.m_segments[2].m_stop))
+
+
+	def test_batchTransform(self):
+		dAttribute = 'M 10 100 L 20 110 C 0 0 80 0 100 90 Q 80 0 100 50 A 60 40 20 0 0 0 50'
+		path = SvgPathReader.classParsePath(dAttribute)
+		aff = Affine(Matrix.makeEulerRotation(30, 'z'), Point(5, -3))
+		expected = [seg.transformedBy(aff) for seg in path.m_segments]
+		path.transformBy(aff)
+		for seg, other in zip(path.m_segments, expected):
+			for t in [0, 0.3, 1]:
+				self.assertTrue(seg.pointAtParam(t).isSameAs(other.pointAtParam(t)))
+
+
+	def test_nearestPoint(self):
+		dAttribute = 'M 10 100 L 20 110 C 0 0 80 0 100 90 Q 80 0 100 50 A 60 40 20 0 0 0 50 A 30 30 0 1 1 -20 80'
+		path = SvgPathReader.classParsePath(dAttribute)
+		testPoints = [Point(0, 0), Point(50, 50), Point(15, 107), Point(-30, 70), Point(120, 40, 5)]
+		for seg in path.m_segments:
+			for point in testPoints:
+				fast = seg.findNearestPoint(point)
+				scan = seg.findMinimalPoint(lambda p: p.distanceOfPoint(point))
+				self.assertTrue(fast[3] <= scan[3] + ZGeomItem.s_wantedAccuracy)
+				self.assertAlmostEqual(fast[1].distanceOfPoint(point), fast[3])
+			middle = seg.pointAtParam(0.4)
+			self.assertAlmostEqual(seg.paramForPoint(middle), 0.4)
+
+
+	def test_bvh(self):
+		fName = os.path.join(self.s_testInFolder, 'Blob.svg')
+		xmlReader = SvgPathReader()
+		xmlReader.readFile(fName)
+		path = xmlReader.getPath()
+		for seg in path.m_segments:
+			tight = seg.getTightBoundingBox()
+			simple = seg.getSimpleBoundingBox()
+			self.assertTrue(simple.m_origin <= tight.m_origin + Point(0.001, 0.001, 0.001))
+			self.assertTrue(tight.m_corner <= simple.m_corner + Point(0.001, 0.001, 0.001))
+		box = path.getSimpleBoundingBox()
+		testPoints = [box.m_origin, box.m_corner, Point(0, 0), path.m_segments[3].pointAtParam(0.3)]
+		expected = [path.findNearestPoint(p) for p in testPoints]
+		path.useBvh()
+		for (point, other) in zip(testPoints, expected):
+			found = path.findNearestPoint(point)
+			self.assertAlmostEqual(found[3], other[3])
+		self.assertTrue(path.containsPoint(testPoints[-1]))
+		myLambda = lambda p: abs(p.m_y - 140)
+		onPath = path.findAllPointsOnPath(myLambda, lambda cube: max(0, cube.m_origin.m_y - 140, 140 - cube.m_corner.m_y))
+		self.assertEqual(len(onPath), len(path.findAllPointsOnPath(myLambda)))
+
+
+	def test_adaptiveFlattening(self):
+		dAttribute = 'M 0 0 A 400 400 0 0 1 400 400 A 2 2 0 0 1 402 402 C 450 400 500 450 500 500'
+		path = SvgPathReader.classParsePath(dAttribute)
+		tolerance = 0.01
+		for seg in path.m_segments:
+			ts = seg.adaptiveParams(tolerance)
+			mids = (ts[:-1] + ts[1:]) * 0.5
+			for ii, t in enumerate(mids):
+				chord = Line(seg.pointAtParam(ts[ii]), seg.pointAtParam(ts[ii + 1]))
+				self.assertTrue(chord.distanceOf(seg.pointAtParam(t)) <= tolerance)
+		[big, small, _] = [len(seg.adaptiveParams(tolerance)) for seg in path.m_segments]
+		self.assertTrue(small * 5 < big)
+		polygon = path.asPolygon(tolerance=tolerance)
+		self.assertEqual(len(polygon.getAdaptiveInterPoints(tolerance)), len(path.getAdaptiveInterPoints(tolerance)))
+
+
 	def test_halfArcs(self):
 		'''
 			test arcs with 180 degrees sweepAngle
@@ -395,6 +536,70 @@ class TestSvg(unittest.TestCase):
 		self.assertTrue(path.isClosed())
 
 
+	def test_tokenizer(self):
+		tokens = SvgPathReader.tokenizePath('M1.5.5-2e1,3E-1l.5-1 a10 10 0 1150 50Z')
+		self.assertEqual(tokens[0], ('M', [1.5, 0.5, -20.0, 0.3]))
+		self.assertEqual(tokens[1], ('l', [0.5, -1.0]))
+		self.assertEqual(tokens[2], ('a', [10.0, 10.0, 0.0, 1.0, 1.0, 50.0, 50.0]))
+		self.assertEqual(tokens[3], ('Z', []))
+		with self.assertRaises(Exception):
+			SvgPathReader.tokenizePath('M 1 2 L 3 x')
+		# 2 arcs in one command
+		path = SvgPathReader.classParsePath('M 0 0 A 50 50 0 0 1 100 0 50 50 0 0 1 0 0', smartCircles=False)
+		self.assertEqual(len(path.m_segments), 2)
+		self.assertTrue(path.isClosed())
+
+
+	def test_iterFile(self):
+		fName = os.path.join(self.s_outputRootFolder, 'testGroups.svg')
+		with open(fName, 'w') as f:
+			f.write('<svg xmlns="http://www.w3.org/2000/svg"><g id="outer"><g><path d="M 0 0 L 10 0"/></g>'
+				+ '<circle cx="1" cy="2" r="3"/></g><g id="other"><path d="M 0 0 L 0 10"/></g></svg>')
+		xmlReader = SvgPathReader()
+		elements = []
+		iterparse = ET.iterparse
+		def recordingIterparse(*args, **kwargs):
+			for event, elem in iterparse(*args, **kwargs):
+				elements.append(elem)
+				yield event, elem
+		with mock.patch.object(ET, 'iterparse', recordingIterparse):
+			groupIds = [path.m_groupId for path in xmlReader.iterFile(fName)]
+		self.assertEqual(groupIds, ['outer', 'other'])
+		self.assertEqual(len(xmlReader.m_circles), 1)
+		# streaming keeps neither the paths nor the processed elements
+		self.assertEqual(xmlReader.m_paths, [])
+		self.assertEqual(len(elements[0]), 0)
+
+		paths = SvgPathReader().readFile(fName)
+		self.assertEqual([path.m_groupId for path in paths], ['outer', 'other'])
+
+
+	def test_pathCache(self):
+		SvgPathReader.clearPathCache()
+		dAttribute = 'M 10 100 C 0 0 80 0 100 90 L 10 100'
+		path1 = SvgPathReader.classParsePath(dAttribute)
+		path1.makeFlat()
+		path1.m_segments[0].m_start.m_x = 1000
+		path2 = SvgPathReader.classParsePath(dAttribute)
+		self.assertEqual(SvgPathReader.getPathCacheStats(), {'hits': 1, 'misses': 1, 'size': 1})
+		self.assertTrue(path2.m_segments[0].m_start.isSameAs(Point(10, 100)))
+		self.assertEqual(path2.svgCode(), SvgPathReader.classParsePath(dAttribute).svgCode())
+		SvgPathReader.classParsePath(dAttribute, smartCircles=False)
+		self.assertEqual(SvgPathReader.getPathCacheStats()['misses'], 2)
+
+		# a miss and a hit give the same joints: moving one keeps the path connected
+		dAttribute = 'M 0 0 L 10 0 C 12 2 14 5 20 0 L 20 10 Z'
+		for counter in ['misses', 'hits']:
+			before = SvgPathReader.getPathCacheStats()[counter]
+			path = SvgPathReader.classParsePath(dAttribute)
+			self.assertEqual(SvgPathReader.getPathCacheStats()[counter], before + 1)
+			segs = path.m_segments
+			self.assertTrue(all(segs[ii].m_stop is segs[ii + 1].m_start for ii in range(len(segs) - 1)))
+			self.assertTrue(segs[-1].m_stop is segs[0].m_start)
+			segs[0].m_stop.m_y = 5
+			self.assertTrue(path.areSegsConnected())
+
+
 	def test_arcFlags(self):
 		# first arc: around (0,0), CW
 		# second arc: around (100,100), CW
@@ -1,5 +1,6 @@
 
 import math
+import random
 import unittest
 #import sys
 #sys.path.append('.')
@@ -7,7 +8,7 @@ import unittest
 from context import zutils		#, testInFolder, testOutFolder
 
 
-from zutils.ZGeom import ZGeomItem, Point, Plane, Line, Polygon, Circle2, Ellipse3
+from zutils.ZGeom import ZGeomItem, Point, PointArray, Plane, Line, Polygon, Circle2, Ellipse3
 from zutils.ZGeomHelper import ZGeomHelper
 from zutils.ZMatrix import Matrix, Affine
 from zutils.ZD3Body import  ZCylinder, ZCone, ZBall3d
@@ -40,6 +41,54 @@ class TestZGeom(unittest.TestCase):
 		self.assertAlmostEqual(l, 1.0)
 
 
+	def test_pointArray(self):
+		points = [Point(3, 4), Point(0, 0, 2), Point(1, 2, 3)]
+		arr = PointArray.fromPoints(points)
+		self.assertEqual(len(arr), 3)
+		for p1, p2 in zip(arr.asPoints(), points):
+			self.comparePoints(p1, p2)
+		self.assertAlmostEqual(arr.lengths()[0], 5)
+		self.assertAlmostEqual(arr.units().lengths()[1], 1)
+		self.comparePoints((arr + Point(1))[0], Point(4, 4))
+		self.comparePoints((arr - arr)[2], Point())
+		self.comparePoints(arr.scaledBy(2)[2], Point(2, 4, 6))
+		self.assertAlmostEqual(arr.dot(Point(1, 1, 1))[2], 6)
+		self.comparePoints(arr.crossProduct(Point(1))[2], Point(1, 2, 3).crossProduct(Point(1)))
+		self.comparePoints(arr.max(), Point(3, 4, 3))
+
+		# rows are views: writing changes the array
+		view = arr[-1]
+		self.assertTrue(isinstance(view, Point))
+		self.comparePoints(view + Point(1), Point(2, 2, 3))
+		view.m_x = 10
+		self.assertEqual(arr.m_array[2, 0], 10)
+		self.assertEqual(len(arr[1:]), 2)
+
+
+	def test_pointHashing(self):
+		p1 = Point(1, 2, 3)
+		p2 = Point(1.0001, 2, 3)
+		p3 = Point(1.1, 2, 3)
+		self.assertFalse(hasattr(p1, '__dict__'))
+		self.assertEqual(p1, p2)
+		self.assertTrue(p1.isSameAs(p2))
+		self.assertNotEqual(p1, p3)
+		self.assertNotEqual(p1, None)
+		self.assertEqual(len({p1, p2, p3}), 2)
+		self.assertEqual({p1: 'a'}[p2], 'a')
+
+
+	def test_pointHashingNonFinite(self):
+		pNan = Point(math.nan, 2, 3)
+		pInf = Point(math.inf, 2, 3)
+		self.assertEqual(pNan, pNan)
+		self.assertIn(pNan, [Point(1, 2, 3), pNan])
+		self.assertEqual(pInf, Point(math.inf, 2, 3))
+		self.assertNotEqual(pInf, Point(-math.inf, 2, 3))
+		self.assertNotEqual(pInf, Point(1, 2, 3))
+		self.assertEqual(len({pNan, pInf, Point(math.inf, 2, 3), Point(1e308, 2, 3)}), 3)
+
+
 	def test_angleBetweenPoints(self):
 		p1 = Point(1, 0, 0)
 		p2 = Point(1, 1, 0)
@@ -247,6 +296,20 @@ class TestZGeom(unittest.TestCase):
 		self.assertTrue(ide2.isSameAs(ide))
 
 
+	def test_matrixArrayAndApplyMany(self):
+		m = Matrix()
+		m.m_lines[2][2] = -1		# the lines are views of the array
+		self.assertEqual(m.m_array[2, 2], -1)
+		aff = Affine(TestZGeom.exampleMatrixInvertible()[0], Point(1, 2, 3))
+		points = [Point(1, 2, 3), Point(-4, 0.5, 2), Point()]
+		many = aff.applyMany(PointArray.fromPoints(points))
+		for ii, point in enumerate(points):
+			self.assertTrue(many[ii].isSameAs(aff * point))
+		self.assertTrue((aff * PointArray.fromPoints(points)).isSameAs(many))
+		asList = aff.applyMany(points)
+		self.assertTrue(asList[1].isSameAs(aff * points[1]))
+
+
 	def test_matrixInversion1(self):
 		(m, realInverse) = TestZGeom.exampleMatrixInvertible()
 		myInverse = m.inverted()
@@ -258,6 +321,23 @@ class TestZGeom(unittest.TestCase):
 		self.assertAlmostEqual(detM, (1.0 / detI))
 
 
+	def test_cachedInverse(self):
+		ortho = TestZGeom.exampleMatrixOrthogonal()
+		self.assertTrue(ortho.isOrthogonal(1e-12))
+		self.assertTrue(ortho.inverted().isSameAs(ortho.transposed()))
+		(m, realInverse) = TestZGeom.exampleMatrixInvertible()
+		self.assertFalse(m.isOrthogonal(1e-12))
+		aff = Affine(m, Point(1, 2, 3))
+		inv = aff.inverted()
+		self.assertIs(aff.inverted(), inv)
+		self.assertIs(inv.inverted(), aff)
+		self.assertTrue(inv.m_matrix.isSameAs(realInverse))
+		self.assertTrue((inv * (aff * Point(3, -1, 2))).isSameAs(Point(3, -1, 2)))
+		cyl = ZCylinder.makeCylinders(Point(1, 2, 3), Point(-1, 2, 4), 2.5, Point())[0]
+		self.assertIs(cyl.getSimpleForm(), cyl.getSimpleForm())
+		self.assertTrue(cyl.getSimpleForm()[1].isSimple())
+
+
 	def test_matrixInversion2(self):
 		m = Matrix()
 		mI = m.inverted()
@@ -504,6 +584,23 @@ class TestZGeom(unittest.TestCase):
 				self.assertTrue(cone.containsPoint(point))
 
 
+	def test_intersectLines(self):
+		random.seed(3)
+		bodies = [ZBall3d(Point(1, 2, 3), 4)]
+		bodies += ZCylinder.makeCylinders(Point(1, 2, 3), Point(-1, 2, 4), 2.5, Point())
+		bodies += ZCone.makeCones(Point(1, 2, 3), 2, Point(-1, 2, 4), 2.5, Point())
+		lines = [Line(Point.randomPoint(), Point.randomPoint()) for _ in range(50)]
+		lines.append(Line(Point(1, 2), direction=Point(0, 0, 1)))
+		for body in bodies:
+			many = body.intersectLines(lines)
+			self.assertEqual(len(many), len(lines))
+			for line, points in zip(lines, many):
+				single = body.intersectLine(line)
+				self.assertEqual(len(single), len(points))
+				for point in single:
+					self.assertTrue(any(point.isSameAs(other) for other in points))
+
+
 	def test_coneLineIntersection2(self):
 		p1 = Point(0, 0, 10)
 		p2 = Point(0, 325, 10)